@@ -1,18 +1,21 @@
+import math
 import os
 from datetime import datetime
-from functools import lru_cache
+from functools import wraps
 
 from flask import (
     Flask,
     render_template,
-    send_from_directory,
     abort,
     url_for,
     jsonify,
     request,
     redirect,
     flash,
+    has_request_context,
 )
+from markupsafe import Markup
+from sqlalchemy import func
 from werkzeug.utils import safe_join
 from flask_login import (
     LoginManager,
@@ -22,14 +25,20 @@ from flask_login import (
     current_user,
 )
 
-from config import MEDIA_ROOT, SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS, SECRET_KEY, AVATAR_UPLOAD_FOLDER, ALLOWED_AVATAR_EXTENSIONS
-from media_indexer import (
-    get_series_library,
-    get_series_cards,
-    find_episode_info,
-)
-from ia_episodios import gerar_descricao_episodio
-from models import db, User, WatchProgress
+from config import MEDIA_ROOT, HLS_ROOT, HLS_JS_FILE, HLS_JS_URL, HLS_JS_INTEGRITY, PROGRESS_HEARTBEAT_SECONDS, MEDIA_IMMUTABLE_MAX_AGE, MEDIA_SIGNED_URLS, LIBRARY_WATCHER, CONTINUE_WATCHING_LIMIT, HOME_FRAGMENT_TTL, SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS, SQLALCHEMY_ENGINE_OPTIONS, SCHEMA_AUTO_MIGRATE, SECRET_KEY, AVATAR_UPLOAD_FOLDER, ALLOWED_AVATAR_EXTENSIONS
+from media_indexer import asset_version, find_episode_info
+from cache_backend import get_cache, make_key
+from library_store import get_library_state, get_library_generation, get_cached_library, request_rescan
+from library_watcher import start_library_watcher
+from media_stream import media_cache_policy, send_file_range
+from media_metadata import lookup_many
+from package_hls import master_playlist_for
+import media_derivatives
+import media_signing
+from ia_episodios import gerar_descricoes_temporada, prefetch_temporada, descricoes_prontas
+from models import db, init_db, User, WatchProgress, ensure_schema
+from auth_cache import load_identity, remember_identity, forget_identity
+from progress_buffer import progress_buffer
 
 app = Flask(__name__)
 
@@ -39,8 +48,14 @@ app = Flask(__name__)
 app.config["SECRET_KEY"] = SECRET_KEY
 app.config["SQLALCHEMY_DATABASE_URI"] = SQLALCHEMY_DATABASE_URI
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = SQLALCHEMY_TRACK_MODIFICATIONS
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = SQLALCHEMY_ENGINE_OPTIONS
+
+init_db(app)  # pool + PRAGMAs do SQLite (WAL, busy_timeout, ...)
+progress_buffer.init_app(app)
 
-db.init_app(app)
+if SCHEMA_AUTO_MIGRATE:
+    with app.app_context():
+        ensure_schema()  # tabelas + colunas novas em bancos antigos
 
 login_manager = LoginManager(app)
 login_manager.login_view = "login"  # rota para redirecionar quando não logado
@@ -48,7 +63,18 @@ login_manager.login_view = "login"  # rota para redirecionar quando não logado
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # identidade da sessão assinada + cache (auth_cache.py), sem query por requisição
+    return load_identity(user_id)
+
+def _logout_missing_user():
+    """
+    A identidade em cache ainda vale, mas o usuário foi apagado do banco: encerra
+    a sessão, como o load_identity faria ao conferir o banco.
+    """
+    logout_user()
+    forget_identity()
+    flash("Sua conta não foi encontrada. Entre novamente.", "warning")
+    return redirect(url_for("login"))
 
 def allowed_avatar(filename: str) -> bool:
     if "." not in filename:
@@ -61,17 +87,27 @@ def allowed_avatar(filename: str) -> bool:
 # Cache da biblioteca
 # ======================
 
-@lru_cache(maxsize=1)
-def get_cached_library():
-    return get_series_library(MEDIA_ROOT)
+if LIBRARY_WATCHER:
+    start_library_watcher()
 
 
 @app.route("/reindex")
 @login_required
 def reindex():
-    get_cached_library.cache_clear()
-    _ = get_cached_library()
-    return "Reindexado com sucesso."
+    """
+    Agenda uma revarredura incremental em segundo plano e responde na hora.
+    A nova versão chega aos outros workers pela geração publicada. Confere
+    também posters/thumbs sobrescritos no lugar, que o polling não vê.
+    """
+    request_rescan(check_images=True)
+    return "Reindexação agendada.", 202
+
+
+@app.route("/cache/stats")
+@login_required
+def cache_stats():
+    """Acertos, faltas e despejos do cache deste worker."""
+    return jsonify(get_cache().stats())
 
 @app.route("/profile", methods=["GET", "POST"])
 @login_required
@@ -83,14 +119,19 @@ def profile():
         file = request.files.get("avatar")
         if file and file.filename:
             if allowed_avatar(file.filename):
+                user = current_user.load()
+                if user is None:
+                    return _logout_missing_user()
                 os.makedirs(AVATAR_UPLOAD_FOLDER, exist_ok=True)
                 ext = file.filename.rsplit(".", 1)[1].lower()
                 filename = f"user_{current_user.id}.{ext}"
                 path = os.path.join(AVATAR_UPLOAD_FOLDER, filename)
                 file.save(path)
 
-                current_user.avatar_filename = filename
+                user.avatar_filename = filename
                 db.session.commit()
+                remember_identity(user)
+                current_user.avatar_filename = filename  # esta página já mostra o novo
                 flash("Avatar atualizado com sucesso!", "success")
             else:
                 flash("Formato de imagem não suportado. Use jpg, jpeg, png ou webp.", "warning")
@@ -107,15 +148,19 @@ def change_password():
         new = request.form.get("new_password", "")
         confirm = request.form.get("confirm_password", "")
 
-        if not current_user.check_password(current):
+        user = current_user.load()
+        if user is None:
+            return _logout_missing_user()
+        if not user.check_password(current):
             flash("Senha atual incorreta.", "danger")
         elif not new or len(new) < 6:
             flash("A nova senha deve ter pelo menos 6 caracteres.", "warning")
         elif new != confirm:
             flash("A confirmação da senha não confere.", "warning")
         else:
-            current_user.set_password(new)
+            user.set_password(new)
             db.session.commit()
+            remember_identity(user)  # as outras sessões deste usuário deixam de valer
             flash("Senha alterada com sucesso.", "success")
             return redirect(url_for("profile"))
 
@@ -126,79 +171,145 @@ def change_password():
 # ======================
 
 def record_progress(user_id: int, relative_path: str, serie_name: str, episode_name: str) -> None:
-    progress = WatchProgress.query.filter_by(
-        user_id=user_id, relative_path=relative_path
-    ).first()
-
-    now = datetime.utcnow()
-    if progress:
-        progress.last_watched = now
-        progress.serie_name = serie_name
-        progress.episode_name = episode_name
-    else:
-        progress = WatchProgress(
-            user_id=user_id,
-            relative_path=relative_path,
-            serie_name=serie_name,
-            episode_name=episode_name,
-            last_watched=now,
+    # Vai para o buffer; o UPSERT no banco sai em lote (progress_buffer.py)
+    progress_buffer.record(user_id, relative_path, serie_name, episode_name)
+    invalidate_home_fragments(user_id)
+
+
+# Perto do fim (últimos N segundos ou X% do vídeo) o episódio volta do começo
+RESUME_END_MARGIN = 30
+RESUME_END_RATIO = 0.95
+
+
+def get_resume_position(user_id: int, relative_path: str) -> float:
+    """Segundo em que o usuário parou neste episódio (0 se não há ou se já terminou)."""
+    row = progress_buffer.get(user_id, relative_path)
+    position = row.get("position_seconds") if row else None
+    duration = row.get("duration_seconds") if row else None
+    if position is None:
+        saved = (
+            db.session.query(WatchProgress.position_seconds, WatchProgress.duration_seconds)
+            .filter_by(user_id=user_id, relative_path=relative_path)
+            .first()
         )
-        db.session.add(progress)
+        if saved:
+            position, duration = saved.position_seconds, duration or saved.duration_seconds
 
-    db.session.commit()
+    if not position:
+        return 0.0
+    if duration and (position >= duration - RESUME_END_MARGIN or position >= duration * RESUME_END_RATIO):
+        return 0.0
+    return position
 
 
-def build_continue_list(library: dict, user_id: int):
-    poster_lookup = {name: data.get("poster") for name, data in library.items()}
+def build_continue_list(library: dict, user_id: int, limit: int = CONTINUE_WATCHING_LIMIT):
+    """
+    Último episódio assistido de cada série, do mais recente para o mais antigo.
+    A deduplicação por série é feita no próprio SQLite (ROW_NUMBER por série).
+    """
+    ranked = (
+        db.session.query(
+            WatchProgress.id.label("id"),
+            func.row_number()
+            .over(
+                partition_by=WatchProgress.serie_name,
+                order_by=WatchProgress.last_watched.desc(),
+            )
+            .label("rn"),
+        )
+        .filter(WatchProgress.user_id == user_id)
+        .subquery()
+    )
 
     rows = (
-        WatchProgress.query.filter_by(user_id=user_id)
+        WatchProgress.query.join(ranked, WatchProgress.id == ranked.c.id)
+        .filter(ranked.c.rn == 1)
         .order_by(WatchProgress.last_watched.desc())
+        .limit(limit)
         .all()
     )
 
-    items = []
-    seen_series = set()
+    # O que ainda está no buffer é mais novo que o banco: vale o mais recente por série
+    latest = {}
     for row in rows:
-        if row.serie_name in seen_series:
-            continue
-        seen_series.add(row.serie_name)
+        latest[row.serie_name] = {
+            "relative_path": row.relative_path,
+            "serie_name": row.serie_name,
+            "episode_name": row.episode_name,
+            "last_watched": row.last_watched,
+        }
+    for row in progress_buffer.pending_for_user(user_id):
+        current = latest.get(row["serie_name"])
+        if current is None or (current["last_watched"] or datetime.min) <= row["last_watched"]:
+            latest[row["serie_name"]] = row
+
+    ordered = sorted(latest.values(), key=lambda r: r["last_watched"] or datetime.min, reverse=True)
 
+    items = []
+    for row in ordered[:limit]:
+        serie = library.get(row["serie_name"])
         items.append(
             {
-                "relative_path": row.relative_path,
-                "serie_name": row.serie_name,
-                "episode_name": row.episode_name,
-                "poster": poster_lookup.get(row.serie_name),
-                "last_watched": row.last_watched.isoformat() if row.last_watched else "",
+                "relative_path": row["relative_path"],
+                "serie_name": row["serie_name"],
+                "episode_name": row["episode_name"],
+                "poster": serie.get("poster") if serie else None,
+                "last_watched": row["last_watched"].isoformat() if row["last_watched"] else "",
             }
         )
 
     return items
 
 
-def get_prev_and_next_episode(library, serie_name: str, relative_path: str):
-    serie = library.get(serie_name)
-    if not serie:
-        return None, None
+# ======================
+# Cache da página inicial
+# ======================
+# Os fragmentos ficam no cache_backend. O grid de séries é igual para todo mundo
+# e a chave leva a geração da biblioteca. O "Continuar assistindo" é por usuário:
+# é apagado quando o progresso muda (no buffer e de novo quando o lote chega ao
+# banco) e expira em HOME_FRAGMENT_TTL. Com backend
+# compartilhado ("shared"/"redis") a invalidação vale para todos os workers.
 
-    seasons = serie.get("seasons", [])
-    flat_eps = []
+def _continue_key(user_id: int, generation: int) -> str:
+    return make_key("fragment", "continue", user_id, generation)
 
-    for season in seasons:
-        for ep in season.get("episodes", []):
-            flat_eps.append(ep["relative_path"])
 
-    rel_norm = relative_path.replace("\\", "/")
+def invalidate_home_fragments(user_id: int) -> None:
+    get_cache().delete(_continue_key(user_id, get_library_generation()))
 
-    try:
-        idx = flat_eps.index(rel_norm)
-    except ValueError:
-        return None, None
 
-    prev_ep = flat_eps[idx - 1] if idx > 0 else None
-    next_ep = flat_eps[idx + 1] if idx < len(flat_eps) - 1 else None
-    return prev_ep, next_ep
+@progress_buffer.after_flush
+def _progress_flushed(user_ids: set) -> None:
+    # Com cache compartilhado, outro worker pode ter montado "Continuar
+    # assistindo" entre o record e a gravação, sem o buffer deste: só vale o banco
+    for user_id in user_ids:
+        invalidate_home_fragments(user_id)
+
+
+def get_series_grid_html() -> Markup:
+    state = get_library_state()
+    # com URLs assinadas os posters levam o usuário na URL: um grid por usuário
+    owner = current_user.id if MEDIA_SIGNED_URLS else "all"
+    key = make_key("fragment", "series_grid", get_library_generation(), owner)
+
+    cache = get_cache()
+    html = cache.get(key)
+    if html is None:
+        html = render_template("_series_grid.html", series_cards=state.cards)
+        cache.set(key, html)
+    return Markup(html)
+
+
+def get_continue_html(user_id: int) -> Markup:
+    key = _continue_key(user_id, get_library_generation())
+
+    cache = get_cache()
+    html = cache.get(key)
+    if html is None:
+        continue_list = build_continue_list(get_cached_library(), user_id)
+        html = render_template("_continue_watching.html", continue_list=continue_list)
+        cache.set(key, html, ttl=HOME_FRAGMENT_TTL)
+    return Markup(html)
 
 
 # ======================
@@ -217,6 +328,7 @@ def login():
         user = User.query.filter_by(email=email).first()
         if user and user.check_password(password):
             login_user(user)
+            remember_identity(user)
             flash("Login realizado com sucesso.", "success")
             next_page = request.args.get("next") or url_for("index")
             return redirect(next_page)
@@ -230,6 +342,7 @@ def login():
 @login_required
 def logout():
     logout_user()
+    forget_identity()
     flash("Você saiu da sua conta.", "info")
     return redirect(url_for("login"))
 
@@ -271,14 +384,10 @@ def register():
 @app.route("/")
 @login_required
 def index():
-    library = get_cached_library()
-    series_cards = get_series_cards(library)
-    continue_list = build_continue_list(library, current_user.id)
-
     return render_template(
         "index.html",
-        series_cards=series_cards,
-        continue_list=continue_list,
+        series_grid_html=get_series_grid_html(),
+        continue_html=get_continue_html(current_user.id),
     )
 
 
@@ -293,6 +402,11 @@ def serie_detail(serie_name):
     poster = serie.get("poster")
     seasons = serie.get("seasons", [])
 
+    # A página carrega a temporada 0 logo em seguida: adianta as descrições dela
+    # e da próxima
+    for season_index in range(min(2, len(seasons))):
+        prefetch_temporada(serie_name, *_season_descriptions_args(seasons, season_index))
+
     return render_template(
         "serie.html",
         serie_name=serie_name,
@@ -301,13 +415,25 @@ def serie_detail(serie_name):
     )
 
 
+if HLS_JS_URL and not HLS_JS_INTEGRITY:
+    print("[hls] HLS_JS_URL ignorada: defina também HLS_JS_INTEGRITY (hash SRI do arquivo)")
+
+
+def hls_js_url() -> str | None:
+    """hls.js do player: URL externa com SRI ou a cópia local (None se não houver)."""
+    if HLS_JS_URL:
+        return HLS_JS_URL if HLS_JS_INTEGRITY else None
+    if os.path.exists(HLS_JS_FILE):
+        return url_for("static", filename="js/hls.min.js")
+    return None
+
+
 @app.route("/watch/<path:relative_path>")
 @login_required
 def watch(relative_path):
     rel_norm = relative_path.replace("\\", "/")
 
-    library = get_cached_library()
-    info = find_episode_info(library, rel_norm)
+    info = find_episode_info(get_library_state().episodes, rel_norm)
 
     if not info:
         abort(404)
@@ -317,6 +443,8 @@ def watch(relative_path):
     season_name = info.get("season_name", "")
     episode_index = info.get("episode_index")
 
+    resume_position = get_resume_position(current_user.id, rel_norm)
+
     record_progress(
         current_user.id,
         rel_norm,
@@ -324,90 +452,249 @@ def watch(relative_path):
         episode_name,
     )
 
-    prev_episode, next_episode = get_prev_and_next_episode(
-        library, serie_name, rel_norm
-    )
+    hls_master = master_playlist_for(rel_norm)
 
     return render_template(
         "watch.html",
         relative_path=rel_norm,
+        hls_url=url_for("hls_file", hls_path=hls_master) if hls_master else None,
+        hls_js_url=hls_js_url() if hls_master else None,
+        hls_js_integrity=HLS_JS_INTEGRITY if HLS_JS_URL else None,
+        resume_position=resume_position,
+        heartbeat_seconds=PROGRESS_HEARTBEAT_SECONDS,
         serie_name=serie_name,
         episode_name=episode_name,
         season_name=season_name,
         episode_index=episode_index,
-        prev_episode=prev_episode,
-        next_episode=next_episode,
+        prev_episode=info["prev"],
+        next_episode=info["next"],
     )
 
 
+@app.route("/api/progresso", methods=["POST"])
+@login_required
+def api_progress():
+    """
+    Heartbeat do player: {"relative_path", "position", "duration"} em JSON
+    (fetch ou navigator.sendBeacon). Só atualiza o buffer em memória; o banco é
+    gravado em lote pelo progress_buffer.
+    """
+    data = request.get_json(silent=True, force=True)
+    if not isinstance(data, dict):
+        abort(400)  # corpo ausente, inválido ou JSON que não é objeto ([1], "x")
+    rel_norm = str(data.get("relative_path") or "").replace("\\", "/")
+    info = find_episode_info(get_library_state().episodes, rel_norm)
+    if not info:
+        abort(404)
+
+    try:
+        position = float(data.get("position"))
+        duration = float(data["duration"]) if data.get("duration") else None
+    except (TypeError, ValueError):
+        abort(400)
+    if not math.isfinite(position) or position < 0:
+        abort(400)
+    if duration is not None and (not math.isfinite(duration) or duration <= 0):
+        duration = None
+
+    progress_buffer.record(
+        current_user.id,
+        rel_norm,
+        info["serie_name"],
+        info["episode_name"],
+        position=round(position, 1),
+        duration=round(duration, 1) if duration else None,
+    )
+    return "", 204
+
+
 # ======================
 # API de episódios por temporada
 # ======================
 
-@app.route("/api/serie/<serie_name>/temporada/<int:season_index>")
-@login_required
-def api_season(serie_name, season_index):
+def _season_descriptions_args(seasons: list, season_index: int):
+    """(nome da temporada, [(número, arquivo)]) no formato do ia_episodios."""
+    season = seasons[season_index]
+    return (
+        season.get("name", f"Temporada {season_index+1}"),
+        [(idx, ep["filename"]) for idx, ep in enumerate(season.get("episodes", []), start=1)],
+    )
+
+
+def season_payload(serie_name: str, season_index: int, thumb_url) -> dict:
+    """
+    JSON de /api/serie/<série>/temporada/<i>. `thumb_url(relative_path | None)`
+    monta a URL da thumb (o asgi_app monta sem contexto de requisição do Flask).
+    """
     library = get_cached_library()
     serie = library.get(serie_name)
 
     if not serie:
-        return jsonify({"episodes": []})
+        return {"episodes": []}
 
     seasons = serie.get("seasons", [])
     if season_index < 0 or season_index >= len(seasons):
-        return jsonify({"episodes": []})
+        return {"episodes": []}
 
     season = seasons[season_index]
+    episodes = season.get("episodes", [])
     episodes_out = []
+    metadata = lookup_many(ep["relative_path"] for ep in episodes)
 
-    for idx, ep in enumerate(season.get("episodes", []), start=1):
-        if ep.get("thumb"):
-            thumb_url = url_for("media_file", relative_path=ep["thumb"])
-        else:
-            thumb_url = url_for("static", filename="no-thumb.jpg")
+    # Nunca espera a IA: o que falta no cache vem com o fallback e entra na fila;
+    # o cliente busca depois em /descricoes os números de "pending_descriptions"
+    descriptions, pending = gerar_descricoes_temporada(
+        serie_name, *_season_descriptions_args(seasons, season_index)
+    )
+    if season_index + 1 < len(seasons):
+        prefetch_temporada(serie_name, *_season_descriptions_args(seasons, season_index + 1))
 
-        description = gerar_descricao_episodio(
-            serie_name,
-            season.get("name", f"Temporada {season_index+1}"),
-            idx,
-            ep["filename"],
-        )
+    for idx, ep in enumerate(episodes, start=1):
+        description = descriptions[idx]
 
         episodes_out.append(
             {
                 "number": idx,
                 "filename": ep["filename"],
                 "relative_path": ep["relative_path"],
-                "thumb": thumb_url,
+                "thumb": thumb_url(ep.get("thumb")),
                 "description": description,
+                "meta": metadata.get(ep["relative_path"], ep.get("meta")),
             }
         )
 
-    return jsonify({"episodes": episodes_out})
+    return {"episodes": episodes_out, "pending_descriptions": pending}
+
+
+def season_descriptions_payload(serie_name: str, season_index: int, numeros: str) -> dict:
+    """JSON do polling de descrições (`numeros` = "1,2,3")."""
+    serie = get_cached_library().get(serie_name)
+    seasons = serie.get("seasons", []) if serie else []
+    if season_index < 0 or season_index >= len(seasons):
+        return {"descriptions": {}, "pending": []}
+
+    numbers = [int(n) for n in numeros.split(",") if n.strip().isdigit()]
+    season_name, _ = _season_descriptions_args(seasons, season_index)
+    ready, pending = descricoes_prontas(serie_name, season_name, numbers)
+    return {"descriptions": ready, "pending": pending}
+
+
+def _thumb_url(relative_path: str | None) -> str:
+    if relative_path:
+        return media_url(relative_path, size="row")
+    return url_for("static", filename="no-thumb.jpg")
+
+
+@app.route("/api/serie/<serie_name>/temporada/<int:season_index>")
+@login_required
+def api_season(serie_name, season_index):
+    return jsonify(season_payload(serie_name, season_index, _thumb_url))
+
+
+@app.route("/api/serie/<serie_name>/temporada/<int:season_index>/descricoes")
+@login_required
+def api_season_descriptions(serie_name, season_index):
+    """Polling das descrições: ?numeros=1,2,3 -> as que ficaram prontas + as que ainda estão na fila."""
+    return jsonify(season_descriptions_payload(serie_name, season_index, request.args.get("numeros", "")))
 
 
 # ======================
 # Arquivos de mídia
 # ======================
+# Com MEDIA_SIGNED_URLS, url_for("stream"/"media_file") sai assinada para o
+# usuário logado (media_signing.py) e essas rotas aceitam a assinatura no lugar
+# da sessão. O proxy reverso pode então mandar /stream e /media para o
+# media_gateway.py, que confere a assinatura sem passar pelo Flask.
+
+# endpoint -> tipo usado na assinatura
+SIGNED_MEDIA_ENDPOINTS = {"stream": "stream", "media_file": "media"}
+
+
+@app.url_defaults
+def sign_media_urls(endpoint, values):
+    kind = SIGNED_MEDIA_ENDPOINTS.get(endpoint)
+    if not MEDIA_SIGNED_URLS or kind is None or "sig" in values:
+        return
+    if has_request_context() and current_user.is_authenticated:
+        values.update(media_signing.sign(kind, values["relative_path"], current_user.id))
+
+
+def media_access_required(view):
+    """login_required, ou uma URL assinada válida (sem sessão nem banco)."""
+    protected = login_required(view)
 
-def send_media(relative_path: str):
+    @wraps(view)
+    def wrapped(relative_path, **kwargs):
+        kind = SIGNED_MEDIA_ENDPOINTS[request.endpoint]
+        if "sig" in request.args and media_signing.verify(kind, relative_path, request.args) is not None:
+            return view(relative_path, **kwargs)
+        return protected(relative_path, **kwargs)
+
+    return wrapped
+
+
+def media_url_params(relative_path: str, size: str | None = None) -> dict:
+    params = {}
+    version = asset_version(get_library_state().signatures, relative_path)
+    if version:
+        params["v"] = version
+    if size and media_derivatives.available():
+        params["size"] = size
+    return params
+
+
+@app.template_global()
+def media_url(relative_path: str, size: str | None = None) -> str:
+    """
+    URL de /media com a versão do arquivo (?v=...) tirada do índice da biblioteca.
+    Quando a imagem muda, a versão muda e o cache do navegador é ignorado.
+    `size` pede uma derivada redimensionada (card, row, hero).
+    """
+    return url_for("media_file", relative_path=relative_path, **media_url_params(relative_path, size))
+
+
+def send_media(relative_path: str, **cache):
     rel_norm = relative_path.replace("\\", "/").lstrip("/")
     safe_path = safe_join(MEDIA_ROOT, rel_norm)
-    if safe_path is None or not os.path.exists(safe_path):
+    if safe_path is None:
         abort(404)
-    return send_from_directory(MEDIA_ROOT, rel_norm, as_attachment=False)
+
+    size = request.args.get("size")
+    if size:
+        fmt = "webp" if "image/webp" in request.accept_mimetypes else "jpeg"
+        derivative = media_derivatives.get_derivative(safe_path, rel_norm, size, fmt)
+        if derivative:
+            response = send_file_range(derivative, None, **cache)
+            response.vary.add("Accept")
+            return response
+
+    return send_file_range(safe_path, rel_norm, **cache)
 
 
 @app.route("/stream/<path:relative_path>")
-@login_required
+@media_access_required
 def stream(relative_path):
-    return send_media(relative_path)
+    return send_media(relative_path, **media_cache_policy("stream", False))
 
 
 @app.route("/media/<path:relative_path>")
-@login_required
+@media_access_required
 def media_file(relative_path):
-    return send_media(relative_path)
+    # mesma política do media_gateway (media_stream.media_cache_policy)
+    return send_media(relative_path, **media_cache_policy("media", bool(request.args.get("v"))))
+
+
+@app.route("/hls/<path:hls_path>")
+@login_required
+def hls_file(hls_path):
+    # Playlists sempre revalidam (mudam ao reempacotar); segmentos têm a versão
+    # do arquivo de origem no nome, então são imutáveis
+    safe_path = safe_join(HLS_ROOT, hls_path)
+    if safe_path is None:
+        abort(404)
+    if hls_path.endswith(".m3u8"):
+        return send_file_range(safe_path, None)
+    return send_file_range(safe_path, None, max_age=MEDIA_IMMUTABLE_MAX_AGE, immutable=True)
 
 
 # ======================
@@ -425,6 +712,5 @@ def server_error(e):
 
 
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()  # cria tabela users se não existir
+    # Servidor de desenvolvimento; em produção use `python serve.py`
     app.run(debug=True, host="0.0.0.0")
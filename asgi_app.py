@@ -0,0 +1,276 @@
+# asgi_app.py
+"""
+Modo de execução assíncrono (ASGI): o app Flask inteiro, mais /stream, /media e
+/api/serie/... atendidos no event loop, sem prender uma thread por requisição.
+
+    python asgi_app.py --port 8000 --workers 2     # migra o banco uma vez e sobe o uvicorn
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8000   # um processo só
+
+- /stream e /media: os arquivos são lidos em blocos de STREAM_BUFFER_SIZE com
+  asyncio.to_thread (media_gateway.send_file). Um cliente lento num episódio de
+  2 GB só ocupa uma tarefa do loop; as threads só aparecem durante cada leitura.
+  Vale URL assinada (media_signing) ou o cookie de sessão do Flask.
+- /api/serie/<série>/temporada/<i> (e /descricoes): o JSON é o mesmo da rota
+  Flask (season_payload). A IA nunca é esperada na requisição (fila do
+  ia_episodios); as consultas ao SQLite rodam numa thread e o loop fica livre.
+- O resto vai para o Flask num pool de ASGI_WSGI_THREADS threads. Também vão
+  para o Flask os pedidos que o caminho assíncrono não sabe decidir (sem login,
+  sessão de antes do cache de identidade), que então respondem como sempre.
+
+A sessão é lida com o mesmo serializer do Flask e conferida como em
+auth_cache.SESSION_ONLY_ENDPOINTS: identidade em cache ou, com o cache frio,
+a sessão assinada; nada vai ao banco. Com MEDIA_ACCEL configurado, /stream e
+/media continuam no Flask (quem envia os bytes é o proxy).
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.cookies import CookieError, SimpleCookie
+from tempfile import SpooledTemporaryFile
+
+from itsdangerous import BadSignature
+
+import media_signing
+from app import app as flask_app, media_url_params, season_payload, season_descriptions_payload
+from auth_cache import resolve_identity, session_identity
+from config import ASGI_WSGI_THREADS, MEDIA_ACCEL, MEDIA_SIGNED_URLS
+from media_gateway import handle_lifespan, header, parse_query, respond, send_file, split_media_path
+
+_API_SEASON = re.compile(r"^/api/serie/([^/]+)/temporada/(\d+)(/descricoes)?$")
+
+_wsgi_pool = ThreadPoolExecutor(max_workers=ASGI_WSGI_THREADS, thread_name_prefix="wsgi")
+
+
+# ======================
+# Sessão do Flask
+# ======================
+
+_session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+_session_cookie = flask_app.config["SESSION_COOKIE_NAME"]
+_session_max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+
+
+def read_session(headers: dict) -> dict:
+    """Conteúdo do cookie de sessão do Flask ({} se ausente ou inválido)."""
+    raw = header(headers, "cookie")
+    if not raw:
+        return {}
+    try:
+        cookie = SimpleCookie()
+        cookie.load(raw)
+        morsel = cookie.get(_session_cookie)
+        if morsel is None:
+            return {}
+        return _session_serializer.loads(morsel.value, max_age=_session_max_age)
+    except (CookieError, BadSignature):
+        return {}
+
+
+def session_user_id(headers: dict) -> int | None:
+    """Usuário logado segundo a sessão + cache de identidade, sem banco."""
+    data = read_session(headers)
+    try:
+        user_id = int(data.get("_user_id"))
+    except (TypeError, ValueError):
+        return None
+    stored = session_identity(data, user_id)
+    if stored is None:
+        return None
+    identity = resolve_identity(user_id, stored, allow_db=False)
+    return identity["id"] if identity else None
+
+
+# ======================
+# Rotas assíncronas
+# ======================
+
+_urls = flask_app.url_map.bind("localhost")  # só para montar caminhos
+
+
+def _thumb_url(user_id: int, relative_path: str | None) -> str:
+    """Mesma URL do media_url do app, montada fora do contexto de requisição."""
+    if not relative_path:
+        return _urls.build("static", {"filename": "no-thumb.jpg"})
+    params = media_url_params(relative_path, size="row")
+    if MEDIA_SIGNED_URLS:
+        params.update(media_signing.sign("media", relative_path, user_id))
+    return _urls.build("media_file", {"relative_path": relative_path, **params})
+
+
+async def _send_json(send, payload: dict) -> None:
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    await respond(send, 200, [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode("latin-1")),
+    ], body)
+
+
+async def _media(scope, send, headers: dict, kind: str, rel: str) -> bool:
+    query = parse_query(scope.get("query_string", b"").decode("latin-1"))
+    if media_signing.verify(kind, rel, query) is None and session_user_id(headers) is None:
+        return False
+    await send_file(scope, send, kind, rel, query, headers)
+    return True
+
+
+async def _api_season(scope, send, headers: dict, match) -> bool:
+    user_id = session_user_id(headers)
+    if user_id is None:
+        return False
+    serie_name, season_index = match.group(1), int(match.group(2))
+    if match.group(3):
+        query = parse_query(scope.get("query_string", b"").decode("latin-1"))
+        payload = await asyncio.to_thread(
+            season_descriptions_payload, serie_name, season_index, query.get("numeros", "")
+        )
+    else:
+        payload = await asyncio.to_thread(
+            season_payload, serie_name, season_index, partial(_thumb_url, user_id)
+        )
+    await _send_json(send, payload)
+    return True
+
+
+# ======================
+# Flask (WSGI) num pool de threads
+# ======================
+# O WsgiToAsgi do asgiref roda todas as requisições numa única thread
+# (sync_to_async com thread_sensitive=True); aqui cada uma vai para o pool.
+
+def _wsgi_environ(scope, body) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers") or []:
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            environ[name] = value
+            continue
+        key = "HTTP_" + name
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _run_wsgi(environ: dict, loop, send) -> None:
+    """Roda o app Flask nesta thread e manda a resposta pelo loop."""
+    state = {"start": None, "sent": False}
+
+    def send_message(message: dict) -> None:
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def flush_start() -> None:
+        if not state["sent"]:
+            send_message(state["start"])
+            state["sent"] = True
+
+    def write(data: bytes) -> None:
+        flush_start()
+        if data:
+            send_message({"type": "http.response.body", "body": data, "more_body": True})
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and state["sent"]:
+            raise exc_info[1].with_traceback(exc_info[2])
+        state["start"] = {
+            "type": "http.response.start",
+            "status": int(status.split(" ", 1)[0]),
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+        }
+        return write
+
+    result = flask_app(environ, start_response)
+    try:
+        for chunk in result:
+            write(chunk)
+        flush_start()
+        send_message({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+
+async def _flask(scope, receive, send) -> None:
+    with SpooledTemporaryFile(max_size=65536) as body:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.write(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body.seek(0)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_wsgi_pool, _run_wsgi, _wsgi_environ(scope, body), loop, send)
+
+
+# ======================
+# App ASGI
+# ======================
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await handle_lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    headers = dict(scope.get("headers") or [])
+    path = scope["path"]
+    handled = False
+
+    if scope["method"] in ("GET", "HEAD"):
+        kind, rel = split_media_path(path)
+        if kind is not None and not MEDIA_ACCEL:
+            handled = await _media(scope, send, headers, kind, rel)
+        elif scope["method"] == "GET":
+            match = _API_SEASON.match(path)
+            if match:
+                handled = await _api_season(scope, send, headers, match)
+
+    if not handled:
+        await _flask(scope, receive, send)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metflix em modo ASGI (uvicorn).")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("O modo ASGI precisa de um servidor ASGI: pip install uvicorn")
+    # o esquema já foi migrado no import deste processo e o observador da
+    # biblioteca (LIBRARY_WATCHER) já roda aqui; os workers do uvicorn (processos
+    # novos que importam o app de novo) não repetem o DDL nem sobem outro observador
+    os.environ["SCHEMA_AUTO_MIGRATE"] = "0"
+    os.environ["LIBRARY_WATCHER"] = "0"
+    uvicorn.run("asgi_app:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# auth_cache.py
+"""
+Usuário logado sem consultar o banco a cada requisição.
+
+Antes, o user_loader fazia User.query.get em toda requisição autenticada,
+inclusive em cada poster de /media e em cada Range de /stream. Agora:
+
+- No login (e ao trocar avatar ou senha) os campos usados pelas páginas vão para
+  a sessão, que o Flask assina com a SECRET_KEY: {"id", "email", "avatar", "stamp"}.
+  O "stamp" é derivado do hash da senha: muda quando a senha muda.
+- A identidade atual de cada usuário fica no cache (cache_backend, namespace
+  "identity") por AUTH_CACHE_TTL segundos. Só uma falta vai ao banco.
+- Se o stamp da sessão não bate com o do cache, a senha foi trocada em outra
+  sessão e o login deixa de valer. Se só o avatar mudou, a sessão é atualizada.
+- /stream, /media, /hls e o heartbeat (SESSION_ONLY_ENDPOINTS) nunca vão ao
+  banco: com o cache frio, confiam na sessão assinada. A próxima página comum
+  faz a conferência completa.
+
+O current_user passa a ser um SessionUser (id, email, avatar_url). Quem precisa
+alterar o usuário carrega o modelo com current_user.load().
+"""
+import hashlib
+
+from flask import request, session
+from flask_login import UserMixin
+
+from cache_backend import get_cache, make_key
+from config import AUTH_CACHE_TTL
+from models import db, User, avatar_url_for
+
+SESSION_KEY = "identity"
+
+# Rotas autorizadas só com a sessão assinada quando a identidade não está em cache
+SESSION_ONLY_ENDPOINTS = {"stream", "media_file", "hls_file", "api_progress"}
+
+
+class SessionUser(UserMixin):
+    """Usuário da requisição, montado a partir da identidade (sem ORM)."""
+
+    def __init__(self, identity: dict):
+        self.id = identity["id"]
+        self.email = identity["email"]
+        self.avatar_filename = identity["avatar"]
+
+    @property
+    def avatar_url(self) -> str:
+        return avatar_url_for(self.avatar_filename)
+
+    def load(self) -> User | None:
+        """O User do banco (para alterar avatar, senha...)."""
+        return db.session.get(User, self.id)
+
+
+def password_stamp(password_hash: str) -> str:
+    return hashlib.sha256(password_hash.encode("utf-8")).hexdigest()[:16]
+
+
+def identity_for(user_id: int, email: str, avatar_filename: str | None, password_hash: str) -> dict:
+    return {
+        "id": user_id,
+        "email": email,
+        "avatar": avatar_filename,
+        "stamp": password_stamp(password_hash),
+    }
+
+
+def _identity_key(user_id: int) -> str:
+    return make_key("identity", user_id)
+
+
+# ======================
+# Escrita (login, perfil, senha)
+# ======================
+
+def remember_identity(user: User) -> None:
+    """
+    Grava a identidade do usuário na sessão e no cache. Chamar depois do login e
+    depois de salvar avatar ou senha.
+    """
+    identity = identity_for(user.id, user.email, user.avatar_filename, user.password_hash)
+    session[SESSION_KEY] = identity
+    get_cache().set(_identity_key(user.id), identity, ttl=AUTH_CACHE_TTL)
+
+
+def forget_identity() -> None:
+    """Tira a identidade da sessão (logout)."""
+    session.pop(SESSION_KEY, None)
+
+
+# ======================
+# Leitura (user_loader)
+# ======================
+
+def _current_identity(user_id: int, allow_db: bool = True) -> dict | None:
+    cache = get_cache()
+    key = _identity_key(user_id)
+    identity = cache.get(key)
+    if identity is None and allow_db:
+        row = (
+            db.session.query(User.id, User.email, User.avatar_filename, User.password_hash)
+            .filter_by(id=user_id)
+            .first()
+        )
+        if row is None:
+            return None
+        identity = identity_for(row.id, row.email, row.avatar_filename, row.password_hash)
+        cache.set(key, identity, ttl=AUTH_CACHE_TTL)
+    return identity
+
+
+def resolve_identity(user_id: int, stored: dict | None, allow_db: bool = True) -> dict | None:
+    """
+    Identidade atual do usuário se a sessão (`stored`) ainda vale, senão None.
+    Com allow_db=False nada vai ao banco: fora do cache, vale a sessão assinada.
+    Não depende do contexto de requisição do Flask (usado também pelo asgi_app).
+    """
+    current = _current_identity(user_id, allow_db)
+    if current is None:
+        return None if allow_db else stored
+    if stored is not None and stored["stamp"] != current["stamp"]:
+        return None  # senha trocada em outra sessão
+    return current
+
+
+def session_identity(data, user_id) -> dict | None:
+    """Identidade guardada na sessão, se for do mesmo usuário do login."""
+    stored = data.get(SESSION_KEY)
+    if not isinstance(stored, dict) or stored.get("id") != user_id:
+        return None  # sessão anterior ao cache de identidade
+    return stored
+
+
+def load_identity(user_id: str) -> SessionUser | None:
+    """user_loader do Flask-Login: SessionUser ou None (sessão não vale mais)."""
+    try:
+        uid = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    stored = session_identity(session, uid)
+    session_only = stored is not None and request.endpoint in SESSION_ONLY_ENDPOINTS
+    current = resolve_identity(uid, stored, allow_db=not session_only)
+    if current is None:
+        return None
+    if not session_only and stored != current:
+        session[SESSION_KEY] = current  # avatar novo (ou sessão antiga)
+    return SessionUser(current)
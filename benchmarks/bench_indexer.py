@@ -0,0 +1,192 @@
+# benchmarks/bench_indexer.py
+"""
+Compara o indexador atual (os.scandir, uma leitura por pasta) com a versão antiga
+(os.listdir repetido + os.path.exists por imagem candidata) numa árvore sintética.
+
+Uso:
+    python benchmarks/bench_indexer.py [--episodes 10000] [--repeat 3]
+
+As chamadas de sistema são contadas embrulhando os.listdir, os.scandir e os.stat
+(os.path.exists/isdir usam os.stat por baixo). Entradas do scandir não geram stat
+extra no Linux, porque o tipo vem do próprio d_type; só as imagens recebem um
+DirEntry.stat (versão da URL), que não entra na contagem. Na revarredura sem
+mudanças, cada imagem conhecida é conferida com os.stat.
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import media_indexer  # noqa: E402
+
+VIDEO_EXTS = media_indexer.VIDEO_EXTS
+IMAGE_EXTS = media_indexer.IMAGE_EXTS
+
+
+# ======================
+# Implementação antiga (referência)
+# ======================
+
+def _legacy_find_thumb(folder_path, video_name, serie_name, season_name):
+    stem, _ = os.path.splitext(video_name)
+    for ext in IMAGE_EXTS:
+        cand = stem + ext
+        if os.path.exists(os.path.join(folder_path, cand)):
+            if season_name:
+                return f"{serie_name}/{season_name}/{cand}"
+            return f"{serie_name}/{cand}"
+    return None
+
+
+def _legacy_extract_number(text):
+    nums = re.findall(r"\d+", text)
+    return int(nums[0]) if nums else 9999
+
+
+def legacy_get_series_library(media_root):
+    library = {}
+    if not os.path.exists(media_root):
+        return library
+
+    for serie_name in sorted(os.listdir(media_root)):
+        serie_path = os.path.join(media_root, serie_name)
+        if not os.path.isdir(serie_path):
+            continue
+
+        poster = None
+        for file in os.listdir(serie_path):
+            lower = file.lower()
+            if lower.startswith("poster") and lower.endswith(IMAGE_EXTS):
+                poster = f"{serie_name}/{file}"
+                break
+
+        seasons = []
+        season_dirs = []
+        loose_episodes = []
+        for entry in os.listdir(serie_path):
+            full = os.path.join(serie_path, entry)
+            if os.path.isdir(full):
+                season_dirs.append(entry)
+            elif entry.lower().endswith(VIDEO_EXTS):
+                loose_episodes.append(entry)
+
+        for sd in sorted(season_dirs, key=_legacy_extract_number):
+            season_path = os.path.join(serie_path, sd)
+            eps = []
+            for fname in sorted(os.listdir(season_path), key=_legacy_extract_number):
+                if not fname.lower().endswith(VIDEO_EXTS):
+                    continue
+                eps.append({
+                    "filename": fname,
+                    "relative_path": f"{serie_name}/{sd}/{fname}",
+                    "thumb": _legacy_find_thumb(season_path, fname, serie_name, sd),
+                })
+            if eps:
+                seasons.append({"name": sd, "episodes": eps})
+
+        if loose_episodes:
+            eps = []
+            for f in sorted(loose_episodes, key=_legacy_extract_number):
+                eps.append({
+                    "filename": f,
+                    "relative_path": f"{serie_name}/{f}",
+                    "thumb": _legacy_find_thumb(serie_path, f, serie_name, None),
+                })
+            seasons.insert(0, {"name": "Episódios", "episodes": eps})
+
+        if seasons:
+            library[serie_name] = {"poster": poster, "seasons": seasons}
+
+    return library
+
+
+# ======================
+# Árvore sintética / contagem de syscalls
+# ======================
+
+def build_tree(root: str, episodes: int, seasons_per_serie: int = 4, eps_per_season: int = 25):
+    per_serie = seasons_per_serie * eps_per_season
+    series = max(1, episodes // per_serie)
+    for s in range(series):
+        serie_path = os.path.join(root, f"Serie {s:04d}")
+        os.makedirs(serie_path)
+        open(os.path.join(serie_path, "poster.jpg"), "wb").close()
+        for t in range(1, seasons_per_serie + 1):
+            season_path = os.path.join(serie_path, f"Temporada {t:02d}")
+            os.makedirs(season_path)
+            for e in range(1, eps_per_season + 1):
+                stem = f"S{t:02d}E{e:02d}"
+                open(os.path.join(season_path, stem + ".mp4"), "wb").close()
+                # metade dos episódios com thumb, para exercitar os dois caminhos
+                if e % 2:
+                    open(os.path.join(season_path, stem + ".jpg"), "wb").close()
+    return series * per_serie
+
+
+class SyscallCounter:
+    NAMES = ("listdir", "scandir", "stat")
+
+    def __init__(self):
+        self.counts = Counter()
+        self._orig = {}
+
+    def __enter__(self):
+        for name in self.NAMES:
+            orig = getattr(os, name)
+            self._orig[name] = orig
+
+            def wrapper(*args, _orig=orig, _name=name, **kwargs):
+                self.counts[_name] += 1
+                return _orig(*args, **kwargs)
+
+            setattr(os, name, wrapper)
+        return self
+
+    def __exit__(self, *exc):
+        for name, orig in self._orig.items():
+            setattr(os, name, orig)
+
+
+def measure(label: str, fn, repeat: int):
+    with SyscallCounter() as counter:
+        result = fn()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    calls = dict(counter.counts)
+    total = sum(calls.values())
+    print(f"{label:<28} {best * 1000:9.1f} ms  syscalls={total:<7} {calls}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--episodes", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="miniflix-bench-")
+    try:
+        total = build_tree(root, args.episodes)
+        print(f"Árvore sintética: {total} episódios em {root}\n")
+
+        legacy = measure("antigo (listdir/exists)", lambda: legacy_get_series_library(root), args.repeat)
+        current = measure("scandir (varredura total)", lambda: media_indexer.get_series_library(root), args.repeat)
+        state = media_indexer.rescan_series_library(root)
+        measure("scandir (sem mudanças)", lambda: media_indexer.rescan_series_library(root, state), args.repeat)
+
+        print("\nMesma saída:", legacy == current)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
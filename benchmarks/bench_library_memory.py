@@ -0,0 +1,143 @@
+# benchmarks/bench_library_memory.py
+"""
+Memória da biblioteca em RAM: registros compactos (Episode/EpisodeInfo com
+__slots__ e prefixo compartilhado) contra os dicts antigos, para um catálogo
+sintético grande.
+
+Uso:
+    python benchmarks/bench_library_memory.py [--episodes 200000] [--per-season 25] [--seasons 8]
+
+Os nomes de arquivo são gerados como o scandir entregaria (uma string nova por
+arquivo) e as duas versões montam a biblioteca + o índice de episódios, que é o
+que cada worker mantém em memória. A medição é a memória alocada (tracemalloc)
+após a montagem, além do tamanho do snapshot em pickle.
+"""
+import argparse
+import gc
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import media_indexer  # noqa: E402
+from media_indexer import DirListing, extract_number  # noqa: E402
+
+
+def synthetic_listings(total: int, per_season: int, seasons: int):
+    """[(série, temporada, DirListing)] com `total` episódios, metade com thumb."""
+    listings = []
+    n = 0
+    serie = 0
+    while n < total:
+        serie_name = f"Série de Teste Número {serie:05d}"
+        for season in range(1, seasons + 1):
+            if n >= total:
+                break
+            count = min(per_season, total - n)
+            videos = [f"S{season:02d}E{ep:02d} - Título do episódio {ep}.mkv" for ep in range(1, count + 1)]
+            images = {
+                os.path.splitext(v)[0]: os.path.splitext(v)[0] + ".jpg"
+                for i, v in enumerate(videos) if i % 2 == 0
+            }
+            listings.append((serie_name, f"Temporada {season}", DirListing([], videos, images, None, {})))
+            n += count
+        serie += 1
+    return listings
+
+
+# ======================
+# Formato antigo (referência)
+# ======================
+
+def legacy_build(listings):
+    library = {}
+    for serie_name, season_name, listing in listings:
+        prefix = f"{serie_name}/{season_name}"
+        eps = []
+        for fname in sorted(listing.videos, key=extract_number):
+            stem, _ = os.path.splitext(fname)
+            cand = listing.images.get(stem)
+            eps.append({
+                "filename": fname,
+                "relative_path": f"{prefix}/{fname}",
+                "thumb": f"{prefix}/{cand}" if cand else None,
+            })
+        serie = library.setdefault(serie_name, {"poster": None, "seasons": []})
+        serie["seasons"].append({"name": season_name, "episodes": eps})
+
+    index = {}
+    for serie_name, data in library.items():
+        prev_info = None
+        for season in data["seasons"]:
+            for idx, ep in enumerate(season["episodes"]):
+                rel_path = ep["relative_path"]
+                info = {
+                    "serie_name": serie_name,
+                    "episode_name": ep["filename"],
+                    "season_name": season["name"],
+                    "episode_index": idx + 1,
+                    "prev": prev_info["relative_path"] if prev_info else None,
+                    "next": None,
+                    "relative_path": rel_path,
+                }
+                if prev_info:
+                    prev_info["next"] = rel_path
+                index[rel_path] = info
+                prev_info = info
+    return library, index
+
+
+def compact_build(listings):
+    library = {}
+    for serie_name, season_name, listing in listings:
+        eps = media_indexer._build_episodes(listing, f"{serie_name}/{season_name}")
+        serie = library.setdefault(serie_name, {"poster": None, "seasons": []})
+        serie["seasons"].append({"name": season_name, "episodes": eps})
+    return library, media_indexer.build_episode_index(library)
+
+
+def measure(label: str, build, listings_factory):
+    # Os nomes vindos do "scandir" são alocados fora da medição nas duas versões
+    listings = listings_factory()
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build(listings)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    snapshot_size = len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+    print(
+        f"{label:<22} {current / 2**20:8.1f} MB  (pico {peak / 2**20:7.1f} MB)  "
+        f"snapshot {snapshot_size / 2**20:7.1f} MB  {elapsed:6.2f}s"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memória da biblioteca: dicts antigos x registros compactos")
+    parser.add_argument("--episodes", type=int, default=200_000)
+    parser.add_argument("--per-season", type=int, default=25)
+    parser.add_argument("--seasons", type=int, default=8)
+    args = parser.parse_args()
+
+    factory = lambda: synthetic_listings(args.episodes, args.per_season, args.seasons)  # noqa: E731
+    print(f"{args.episodes} episódios ({args.per_season} por temporada, {args.seasons} temporadas por série)\n")
+
+    legacy_library, legacy_index = measure("dicts (antigo)", legacy_build, factory)
+    library, index = measure("registros compactos", compact_build, factory)
+
+    same = library == legacy_library and all(
+        media_indexer.find_episode_info(index, rel).as_dict() == info
+        for rel, info in legacy_index.items()
+    )
+    print("\nMesma saída:", same)
+
+
+if __name__ == "__main__":
+    main()
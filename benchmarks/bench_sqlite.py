@@ -0,0 +1,212 @@
+# benchmarks/bench_sqlite.py
+"""
+app.db sob carga: configuração antiga (journal padrão, sem PRAGMAs, só o índice
+em user_id) contra models.init_db (WAL, busy_timeout, synchronous=NORMAL, mmap,
+pool por worker e o índice (user_id, last_watched)).
+
+Uso:
+    python benchmarks/bench_sqlite.py [--viewers 16] [--readers 8] [--seconds 5] [--users 200] [--rows 60]
+
+Cada "espectador" é uma thread gravando o progresso de um usuário (um UPSERT por
+requisição, como o /watch fazia antes do buffer). Cada "leitor" simula a página
+inicial: carrega o usuário (load_user) e monta o "Continuar assistindo" com a
+mesma consulta do app. O banco fica numa pasta temporária; a medição é vazão de
+leituras e gravações, latência p50/p95 e quantos "database is locked" apareceram.
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import func, text  # noqa: E402
+from sqlalchemy.dialects.sqlite import insert  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from config import SQLALCHEMY_ENGINE_OPTIONS  # noqa: E402
+from models import db, init_db, User, WatchProgress  # noqa: E402
+
+
+def create_app(db_path: str, tuned: bool) -> Flask:
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + db_path
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    if tuned:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = SQLALCHEMY_ENGINE_OPTIONS
+        init_db(app)
+    else:
+        db.init_app(app)
+    return app
+
+
+def seed(app: Flask, tuned: bool, users: int, rows: int) -> None:
+    with app.app_context():
+        db.create_all()
+        if not tuned:
+            # índices como eram antes: só user_id
+            with db.engine.begin() as conn:
+                conn.execute(text("DROP INDEX IF EXISTS ix_progress_user_last_watched"))
+                conn.execute(text("CREATE INDEX ix_watch_progress_user_id ON watch_progress (user_id)"))
+
+        now = datetime.utcnow()
+        db.session.add_all(
+            User(id=uid, email=f"user{uid}@teste", password_hash="x") for uid in range(1, users + 1)
+        )
+        db.session.flush()
+        db.session.execute(
+            WatchProgress.__table__.insert(),
+            [
+                {
+                    "user_id": uid,
+                    "relative_path": f"Série {n % 15}/Temporada 1/E{n:03d}.mp4",
+                    "serie_name": f"Série {n % 15}",
+                    "episode_name": f"E{n:03d}.mp4",
+                    "last_watched": now - timedelta(minutes=n),
+                }
+                for uid in range(1, users + 1)
+                for n in range(rows)
+            ],
+        )
+        db.session.commit()
+
+
+def continue_watching(user_id: int, limit: int = 20) -> list:
+    """Mesma consulta do build_continue_list do app."""
+    ranked = (
+        db.session.query(
+            WatchProgress.id.label("id"),
+            func.row_number()
+            .over(partition_by=WatchProgress.serie_name, order_by=WatchProgress.last_watched.desc())
+            .label("rn"),
+        )
+        .filter(WatchProgress.user_id == user_id)
+        .subquery()
+    )
+    return (
+        WatchProgress.query.join(ranked, WatchProgress.id == ranked.c.id)
+        .filter(ranked.c.rn == 1)
+        .order_by(WatchProgress.last_watched.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def write_progress(user_id: int, n: int) -> None:
+    stmt = insert(WatchProgress.__table__).values(
+        user_id=user_id,
+        relative_path=f"Série {n % 15}/Temporada 1/E{n:03d}.mp4",
+        serie_name=f"Série {n % 15}",
+        episode_name=f"E{n:03d}.mp4",
+        last_watched=datetime.utcnow(),
+        position_seconds=float(n),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "relative_path"],
+        set_={"last_watched": stmt.excluded.last_watched, "position_seconds": stmt.excluded.position_seconds},
+    )
+    db.session.execute(stmt)
+    db.session.commit()
+
+
+def run_load(app: Flask, viewers: int, readers: int, seconds: float, users: int, rows: int) -> dict:
+    results = {"read": [], "write": [], "locked": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+    start = threading.Barrier(viewers + readers + 1)
+
+    def worker(kind: str, seed_value: int) -> None:
+        rng = random.Random(seed_value)
+        latencies = []
+        locked = errors = 0
+        with app.app_context():
+            start.wait()
+            while not stop.is_set():
+                user_id = rng.randint(1, users)
+                t0 = time.perf_counter()
+                try:
+                    if kind == "write":
+                        write_progress(user_id, rng.randrange(rows))
+                    else:
+                        db.session.get(User, user_id)
+                        continue_watching(user_id)
+                        db.session.rollback()  # fim da "requisição"
+                except OperationalError as e:
+                    db.session.rollback()
+                    if "locked" in str(e):
+                        locked += 1
+                    else:
+                        errors += 1
+                    continue
+                latencies.append(time.perf_counter() - t0)
+            db.session.remove()
+        with lock:
+            results[kind].extend(latencies)
+            results["locked"] += locked
+            results["errors"] += errors
+
+    threads = [threading.Thread(target=worker, args=("write", i)) for i in range(viewers)]
+    threads += [threading.Thread(target=worker, args=("read", 1000 + i)) for i in range(readers)]
+    for t in threads:
+        t.start()
+    start.wait()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return results
+
+
+def report(label: str, results: dict, seconds: float) -> None:
+    def fmt(latencies: list) -> str:
+        if not latencies:
+            return "      0/s"
+        lat = sorted(latencies)
+        p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+        return (
+            f"{len(lat) / seconds:7.0f}/s  p50 {statistics.median(lat) * 1000:7.1f} ms  "
+            f"p95 {p95 * 1000:7.1f} ms"
+        )
+
+    print(f"{label}")
+    print(f"  leituras  {fmt(results['read'])}")
+    print(f"  gravações {fmt(results['write'])}")
+    print(f"  'database is locked': {results['locked']}   outros erros: {results['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app.db sob carga: configuração antiga x ajustada")
+    parser.add_argument("--viewers", type=int, default=16, help="threads gravando progresso")
+    parser.add_argument("--readers", type=int, default=8, help="threads abrindo a página inicial")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=60, help="linhas de progresso por usuário")
+    args = parser.parse_args()
+
+    print(
+        f"{args.viewers} espectadores gravando, {args.readers} leitores, {args.seconds:g}s, "
+        f"{args.users} usuários x {args.rows} episódios\n"
+    )
+    for label, tuned in (("padrão (journal DELETE, sem PRAGMAs)", False), ("init_db (WAL + PRAGMAs + pool + índice)", True)):
+        tmp_dir = tempfile.mkdtemp(prefix="bench_sqlite_")
+        try:
+            app = create_app(os.path.join(tmp_dir, "app.db"), tuned)
+            seed(app, tuned, args.users, args.rows)
+            results = run_load(app, args.viewers, args.readers, args.seconds, args.users, args.rows)
+            report(label, results, args.seconds)
+            with app.app_context():
+                db.engine.dispose()
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        print()
+
+
+if __name__ == "__main__":
+    main()
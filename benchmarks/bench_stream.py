@@ -0,0 +1,187 @@
+# benchmarks/bench_stream.py
+"""
+Compara o envio antigo (send_from_directory) com media_stream.send_file_range.
+
+Sobe um app Flask mínimo (sem login) num servidor HTTP local com as duas rotas e mede:
+  - vazão de um download completo
+  - seeks concorrentes: N clientes pedindo trechos aleatórios (Range) ao mesmo tempo
+
+Uso:
+    python benchmarks/bench_stream.py [--size-mb 256] [--clients 16] [--seeks 50]
+
+Com --server gunicorn (se instalado) o teste roda sob gunicorn, que entrega o
+wsgi.file_wrapper via os.sendfile — é aí que aparece o ganho do caminho zero-copy.
+O servidor de desenvolvimento do Werkzeug sempre copia em blocos pelo Python.
+"""
+import argparse
+import http.client
+import logging
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from flask import Flask, send_from_directory  # noqa: E402
+
+from media_stream import send_file_range  # noqa: E402
+
+FILE_NAME = "video.mp4"
+MEDIA_DIR = os.environ.get("BENCH_MEDIA_DIR", "")
+
+
+def create_app(media_dir: str) -> Flask:
+    app = Flask(__name__)
+
+    @app.route("/old/<path:name>")
+    def old(name):
+        return send_from_directory(media_dir, name, as_attachment=False)
+
+    @app.route("/new/<path:name>")
+    def new(name):
+        return send_file_range(os.path.join(media_dir, name), name)
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("servidor não subiu")
+
+
+def _get(port: int, path: str, headers=None) -> int:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.request("GET", path, headers=headers or {})
+    resp = conn.getresponse()
+    total = 0
+    while True:
+        chunk = resp.read(1024 * 1024)
+        if not chunk:
+            break
+        total += len(chunk)
+    conn.close()
+    return total
+
+
+def bench_full(port: int, route: str, size: int) -> float:
+    start = time.perf_counter()
+    got = _get(port, f"/{route}/{FILE_NAME}")
+    elapsed = time.perf_counter() - start
+    assert got == size, (got, size)
+    return size / elapsed / (1024 * 1024)
+
+
+def bench_seeks(port: int, route: str, size: int, clients: int, seeks: int, chunk: int) -> tuple:
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        local = []
+        for _ in range(seeks):
+            start = rnd.randrange(0, size - chunk)
+            t0 = time.perf_counter()
+            got = _get(port, f"/{route}/{FILE_NAME}", {"Range": f"bytes={start}-{start + chunk - 1}"})
+            local.append(time.perf_counter() - t0)
+            assert got == chunk, got
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    return len(latencies) / elapsed, p50, p99
+
+
+def start_server(kind: str, media_dir: str, port: int, workers: int):
+    if kind == "gunicorn":
+        env = dict(os.environ, BENCH_MEDIA_DIR=media_dir, PYTHONPATH=ROOT_DIR)
+        proc = subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn",
+                "-b", f"127.0.0.1:{port}", "-w", str(workers), "-k", "gthread", "--threads", "8",
+                "benchmarks.bench_stream:app",
+            ],
+            cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        _wait_port(port)
+        return proc.terminate
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", port, create_app(media_dir), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    _wait_port(port)
+    return server.shutdown
+
+
+# app usado quando o benchmark roda sob gunicorn
+app = create_app(MEDIA_DIR) if MEDIA_DIR else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seeks", type=int, default=50)
+    parser.add_argument("--chunk-kb", type=int, default=1024)
+    parser.add_argument("--server", choices=("werkzeug", "gunicorn"), default="werkzeug")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    media_dir = tempfile.mkdtemp(prefix="miniflix-stream-")
+    size = args.size_mb * 1024 * 1024
+    with open(os.path.join(media_dir, FILE_NAME), "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size_mb):
+            f.write(block)
+
+    port = _free_port()
+    stop = start_server(args.server, media_dir, port, args.workers)
+    try:
+        print(f"Servidor: {args.server} | arquivo: {args.size_mb} MB | "
+              f"{args.clients} clientes x {args.seeks} seeks de {args.chunk_kb} KB\n")
+        for route, label in (("old", "send_from_directory"), ("new", "send_file_range")):
+            _get(port, f"/{route}/{FILE_NAME}")  # aquece o page cache
+            mbps = bench_full(port, route, size)
+            rps, p50, p99 = bench_seeks(
+                port, route, size, args.clients, args.seeks, args.chunk_kb * 1024
+            )
+            print(f"{label:<20} completo: {mbps:8.1f} MB/s | seeks: {rps:8.1f} req/s "
+                  f"p50={p50:6.1f} ms p99={p99:6.1f} ms")
+    finally:
+        stop()
+        shutil.rmtree(media_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
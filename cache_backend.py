@@ -0,0 +1,368 @@
+# cache_backend.py
+"""
+Camada de cache usada pelo app inteiro (biblioteca, descrições, fragmentos HTML
+e a identidade dos usuários logados).
+
+Três backends com a mesma interface (get / set / delete / stats):
+
+- "local":  LRU com TTL na memória do processo. Rápido, mas cada worker do
+            gunicorn tem a sua cópia.
+- "shared": um arquivo por chave numa pasta em tmpfs (/dev/shm por padrão).
+            Todos os workers da máquina enxergam o mesmo cache; a leitura é um
+            mmap do arquivo, sem ir ao disco. A pasta precisa ser do usuário do
+            app e fechada para os outros (os valores são pickles).
+- "redis":  qualquer cliente com get/set(ex=)/delete (redis-py ou um substituto
+            local injetado via configure_cache(backend=...)). Serve para vários
+            hosts.
+
+As chaves são montadas por make_key(namespace, *partes): levam o prefixo
+CACHE_KEY_PREFIX e a versão do namespace (CACHE_VERSIONS), então mudar o formato
+de um valor é só subir a versão, sem precisar limpar nada.
+"""
+import hashlib
+import mmap
+import os
+import pickle
+import stat
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from config import (
+    CACHE_BACKEND,
+    CACHE_KEY_PREFIX,
+    CACHE_DEFAULT_TTL,
+    CACHE_LOCAL_MAX_ENTRIES,
+    CACHE_SHARED_DIR,
+    CACHE_SHARED_MAX_BYTES,
+    CACHE_REDIS_URL,
+)
+
+try:
+    import redis
+except ImportError:  # backend "redis" é opcional
+    redis = None
+
+# Versão do formato de cada namespace (suba ao mudar o que é guardado)
+CACHE_VERSIONS = {
+    "library": 1,
+    "descriptions": 1,
+    "fragment": 1,
+    "identity": 1,
+}
+
+_MISSING = object()
+
+
+def make_key(namespace: str, *parts) -> str:
+    """Chave versionada: "<prefixo>:<namespace>:v<versão>:<partes...>"."""
+    version = CACHE_VERSIONS.get(namespace, 1)
+    return ":".join([CACHE_KEY_PREFIX, namespace, f"v{version}", *(str(p) for p in parts)])
+
+
+class CacheBackend:
+    """Interface comum + contadores de acertos/faltas/gravações/despejos."""
+
+    name = "base"
+    shared = False  # True quando todos os processos enxergam os mesmos valores
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "deletes": 0, "evictions": 0}
+
+    def _count(self, field: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[field] += n
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._get(key)
+        if value is _MISSING:
+            self._count("misses")
+            return default
+        self._count("hits")
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        self._set(key, value, CACHE_DEFAULT_TTL if ttl is None else ttl)
+        self._count("sets")
+
+    def delete(self, key: str) -> None:
+        self._delete(key)
+        self._count("deletes")
+
+    def _after_fork(self) -> None:
+        # um lock preso por uma thread do pai no fork nunca seria liberado no filho
+        self._stats_lock = threading.Lock()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+        stats["backend"] = self.name
+        return stats
+
+    # implementados pelos backends; ttl <= 0 significa "sem expiração"
+    def _get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    def _delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+# ======================
+# Local (memória do processo)
+# ======================
+
+class LocalCache(CacheBackend):
+    name = "local"
+
+    def __init__(self, max_entries: int = CACHE_LOCAL_MAX_ENTRIES):
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+
+    def _after_fork(self):
+        super()._after_fork()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires, value = item
+            if expires and expires < time.monotonic():
+                del self._data[key]
+                self._count("evictions")
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key, value, ttl):
+        expires = time.monotonic() + ttl if ttl > 0 else 0.0
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            evicted = 0
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+
+    def _delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+# ======================
+# Compartilhado (arquivos em tmpfs)
+# ======================
+# Cada chave vira <dir>/<sha1>.bin com um cabeçalho (expira_em: double) + pickle.
+# Gravação em arquivo temporário + rename: quem lê nunca vê um valor pela metade.
+# Quando o total passa de max_bytes, os arquivos lidos há mais tempo são removidos.
+#
+# Os valores são pickles: quem consegue gravar na pasta consegue rodar código nos
+# workers. Por isso a pasta é criada com 0700 e recusada se for de outro usuário,
+# se outros puderem gravar nela ou se for um link simbólico (/dev/shm é de todos).
+
+_HEADER = struct.Struct("<d")
+
+
+def _private_dir(directory: str) -> None:
+    """Cria (0700) ou confere a pasta do cache compartilhado. RuntimeError se não for segura."""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode):
+        raise RuntimeError(f"cache compartilhado: {directory} não é uma pasta (link simbólico?)")
+    if not hasattr(os, "getuid"):
+        return  # Windows: sem dono/permissões POSIX
+    if st.st_uid != os.getuid():
+        raise RuntimeError(
+            f"cache compartilhado: {directory} pertence a outro usuário (uid {st.st_uid}); "
+            f"use outra pasta em CACHE_SHARED_DIR"
+        )
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise RuntimeError(
+            f"cache compartilhado: outros usuários podem gravar em {directory}; "
+            f"apague a pasta ou use outra em CACHE_SHARED_DIR"
+        )
+    if stat.S_IMODE(st.st_mode) != 0o700:
+        os.chmod(directory, 0o700)  # pasta antiga (0755) do próprio usuário
+
+
+class SharedFileCache(CacheBackend):
+    name = "shared"
+    shared = True
+
+    def __init__(self, directory: str = CACHE_SHARED_DIR, max_bytes: int = CACHE_SHARED_MAX_BYTES):
+        super().__init__()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._written = 0
+        _private_dir(directory)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".bin")
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    (expires,) = _HEADER.unpack_from(mm, 0)
+                    if expires and expires < time.time():
+                        raise LookupError
+                    value = pickle.loads(mm[_HEADER.size:])
+        except (OSError, ValueError, LookupError, pickle.UnpicklingError, EOFError, struct.error):
+            return _MISSING
+        # marca o acesso (mtime) para a política de despejo
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def _set(self, key, value, ttl):
+        expires = time.time() + ttl if ttl > 0 else 0.0
+        data = _HEADER.pack(expires) + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._written += len(data)
+        if self._written > self.max_bytes // 8:
+            self._written = 0
+            self._evict()
+
+    def _delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        now = time.time()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".bin"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+        evicted = 0
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        if evicted:
+            self._count("evictions", evicted)
+
+
+# ======================
+# Redis (ou compatível)
+# ======================
+
+class RedisCache(CacheBackend):
+    """
+    `client` precisa de get(key) -> bytes | None, set(key, bytes, ex=segundos)
+    e delete(key). Sem client, conecta em CACHE_REDIS_URL (exige o pacote redis).
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, client=None, url: str = CACHE_REDIS_URL):
+        super().__init__()
+        if client is None:
+            if redis is None:
+                raise RuntimeError("CACHE_BACKEND=redis exige o pacote 'redis' (pip install redis)")
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def _get(self, key):
+        raw = self.client.get(key)
+        if raw is None:
+            return _MISSING
+        try:
+            return pickle.loads(raw)
+        except (pickle.UnpicklingError, EOFError, ValueError):
+            return _MISSING
+
+    def _set(self, key, value, ttl):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if ttl > 0:
+            self.client.set(key, data, ex=max(1, int(ttl)))
+        else:
+            self.client.set(key, data)
+
+    def _delete(self, key):
+        self.client.delete(key)
+
+
+# ======================
+# Instância do processo
+# ======================
+
+_cache: CacheBackend | None = None
+_cache_lock = threading.Lock()
+
+
+def _create(kind: str) -> CacheBackend:
+    if kind == "shared":
+        return SharedFileCache()
+    if kind == "redis":
+        return RedisCache()
+    return LocalCache()
+
+
+def get_cache() -> CacheBackend:
+    """Backend configurado em CACHE_BACKEND (criado na primeira chamada)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = _create(CACHE_BACKEND)
+    return _cache
+
+
+def configure_cache(kind: str | None = None, backend: CacheBackend | None = None) -> CacheBackend:
+    """Troca o backend do processo (por nome ou passando uma instância pronta)."""
+    global _cache
+    with _cache_lock:
+        _cache = backend if backend is not None else _create(kind or CACHE_BACKEND)
+    return _cache
+
+
+def _reset_after_fork() -> None:
+    # Workers do gunicorn nascem por fork do processo que fez o warm-up: os
+    # locks são recriados (os valores do cache local continuam valendo)
+    global _cache_lock
+    _cache_lock = threading.Lock()
+    if _cache is not None:
+        _cache._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
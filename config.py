@@ -7,13 +7,141 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 DATA_DIR = os.path.join(BASE_DIR, "data")
 PROGRESS_FILE = os.path.join(DATA_DIR, "progress.json")
+LIBRARY_SNAPSHOT_FILE = os.path.join(DATA_DIR, "library.snapshot")
+LIBRARY_GENERATION_FILE = os.path.join(DATA_DIR, "library.generation")
+
+# De quanto em quanto tempo (s) cada worker confere se há uma biblioteca nova publicada
+LIBRARY_CHECK_INTERVAL = float(os.environ.get("LIBRARY_CHECK_INTERVAL", "2"))
+
+# Observador da pasta de mídia (library_watcher.py)
+LIBRARY_WATCHER = os.environ.get("LIBRARY_WATCHER", "0") == "1"  # inicia dentro do app
+LIBRARY_WATCH_DEBOUNCE = float(os.environ.get("LIBRARY_WATCH_DEBOUNCE", "2"))
+LIBRARY_POLL_INTERVAL = float(os.environ.get("LIBRARY_POLL_INTERVAL", "30"))
+
+# Ferramentas externas (generate_thumbs.py, convert.py)
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.environ.get("FFPROBE_BIN", "ffprobe")
+THUMBS_MANIFEST_FILE = os.path.join(DATA_DIR, "thumbs_manifest.json")
+
+# Cache do ffprobe de cada vídeo (media_metadata.py)
+MEDIA_METADATA_DB = os.path.join(DATA_DIR, "media_metadata.db")
+
+# Descrições de episódios no formato antigo (JSON): importadas uma vez pelo ensure_schema
+DESCRIPTIONS_LEGACY_FILE = os.path.join(DATA_DIR, "descriptions.json")
+
+# Empacotamento HLS (package_hls.py): renditions em DATA_DIR/hls, servidas em /hls
+HLS_ROOT = os.path.join(DATA_DIR, "hls")
+HLS_SEGMENT_SECONDS = int(os.environ.get("HLS_SEGMENT_SECONDS", "6"))
+# hls.js para navegadores sem HLS nativo (sem ele só Safari/Android tocam HLS).
+# Padrão: a cópia local em HLS_JS_FILE (baixe uma versão fixa, ex.
+# https://cdn.jsdelivr.net/npm/hls.js@1.5.20/dist/hls.min.js). Uma URL externa em
+# HLS_JS_URL, com a versão exata, só é usada junto com o hash SRI do arquivo em
+# HLS_JS_INTEGRITY ("sha384-" + `openssl dgst -sha384 -binary hls.min.js | openssl base64 -A`)
+HLS_JS_FILE = os.path.join(BASE_DIR, "static", "js", "hls.min.js")
+HLS_JS_URL = os.environ.get("HLS_JS_URL", "")
+HLS_JS_INTEGRITY = os.environ.get("HLS_JS_INTEGRITY", "")
+
+# Cache compartilhado (cache_backend.py): "local" (memória de cada worker),
+# "shared" (arquivos em tmpfs, todos os workers da máquina) ou "redis"
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "local")
+CACHE_KEY_PREFIX = os.environ.get("CACHE_KEY_PREFIX", "metflix")
+CACHE_DEFAULT_TTL = float(os.environ.get("CACHE_DEFAULT_TTL", "300"))
+CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get("CACHE_LOCAL_MAX_ENTRIES", "4096"))
+# Pasta privada do usuário do app (0700): o cache_backend recusa pastas de outro dono
+CACHE_SHARED_DIR = os.environ.get(
+    "CACHE_SHARED_DIR",
+    f"/dev/shm/metflix-cache-{os.getuid()}" if os.path.isdir("/dev/shm") else os.path.join(DATA_DIR, "cache"),
+)
+CACHE_SHARED_MAX_BYTES = int(os.environ.get("CACHE_SHARED_MAX_MB", "256")) * 1024 * 1024
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+DESCRIPTIONS_CACHE_TTL = float(os.environ.get("DESCRIPTIONS_CACHE_TTL", "30"))
+# Por quanto tempo (s) um episódio na fila de descrições conta como "sendo gerado"
+# para todos os workers; renovado quando a geração começa
+DESCRIPTIONS_PENDING_TTL = float(os.environ.get("DESCRIPTIONS_PENDING_TTL", "300"))
+# Identidade do usuário logado (auth_cache.py): por quanto tempo (s) os dados
+# lidos do banco valem antes de conferir de novo (senha trocada, avatar novo)
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "60"))
+
+# Progresso gravado em lote (progress_buffer.py): a cada N segundos ou quando
+# o buffer passar de N entradas
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get("PROGRESS_FLUSH_INTERVAL", "2"))
+PROGRESS_FLUSH_MAX_PENDING = int(os.environ.get("PROGRESS_FLUSH_MAX_PENDING", "200"))
+# Quantas vezes uma linha recusada pelo banco volta ao buffer antes de ser descartada
+PROGRESS_FLUSH_MAX_ATTEMPTS = int(os.environ.get("PROGRESS_FLUSH_MAX_ATTEMPTS", "5"))
+# De quantos em quantos segundos o player envia a posição atual
+PROGRESS_HEARTBEAT_SECONDS = int(os.environ.get("PROGRESS_HEARTBEAT_SECONDS", "15"))
+
+# Página inicial: quantas séries aparecem em "Continuar assistindo" e por quanto
+# tempo (s) os fragmentos renderizados ficam em cache em cada worker
+CONTINUE_WATCHING_LIMIT = int(os.environ.get("CONTINUE_WATCHING_LIMIT", "20"))
+HOME_FRAGMENT_TTL = float(os.environ.get("HOME_FRAGMENT_TTL", "30"))
+
+# Streaming de mídia (media_stream.py)
+# MEDIA_ACCEL: "" (o próprio app envia os bytes), "nginx" (X-Accel-Redirect)
+# ou "sendfile" (X-Sendfile, Apache/lighttpd)
+MEDIA_ACCEL = os.environ.get("MEDIA_ACCEL", "")
+MEDIA_ACCEL_PREFIX = os.environ.get("MEDIA_ACCEL_PREFIX", "/_protected_media/")
+STREAM_BUFFER_SIZE = 256 * 1024
+
+# URLs de mídia assinadas (media_signing.py / media_gateway.py): com
+# MEDIA_SIGNED_URLS=1, url_for("stream"/"media_file") sai com uid/exp/sig e a
+# URL vale sem sessão por até MEDIA_URL_TTL segundos (no mínimo metade disso).
+# Mantenha MEDIA_URL_TTL/2 maior que o TTL dos fragmentos em cache.
+MEDIA_SIGNED_URLS = os.environ.get("MEDIA_SIGNED_URLS", "0") == "1"
+MEDIA_URL_TTL = int(os.environ.get("MEDIA_URL_TTL", str(6 * 3600)))
+MEDIA_GATEWAY_AUTH_PATH = os.environ.get("MEDIA_GATEWAY_AUTH_PATH", "/_media_auth")
+
+# Modo ASGI (asgi_app.py): threads que rodam as rotas Flask (páginas, login...)
+# em cada processo; /stream, /media e /api/serie não ocupam essas threads
+ASGI_WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", "32"))
+
+# Cache de posters/thumbs no navegador: URLs com ?v=<versão> são imutáveis;
+# sem versão o cliente guarda por MEDIA_MAX_AGE e depois revalida (304)
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MEDIA_MAX_AGE = int(os.environ.get("MEDIA_MAX_AGE", "3600"))
+
+# Derivadas redimensionadas de posters/thumbs (media_derivatives.py)
+DERIVATIVE_CACHE_DIR = os.path.join(DATA_DIR, "derivatives")
+DERIVATIVE_CACHE_MAX_BYTES = int(os.environ.get("DERIVATIVE_CACHE_MAX_MB", "512")) * 1024 * 1024
 
 # === NOVO: configs de Flask/DB ===
 SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-change-me")  # troque em produção
 
-SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(BASE_DIR, "app.db")
+APP_DB_PATH = os.path.join(BASE_DIR, "app.db")
+SQLALCHEMY_DATABASE_URI = "sqlite:///" + APP_DB_PATH
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# SQLite do app.db (models.init_db): PRAGMAs aplicados em cada conexão nova
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")  # seguro com WAL
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_MB", "256")) * 1024 * 1024
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", "16384"))
+# ensure_schema (tabelas, colunas e índices novos) ao importar o app. O serve.py e o
+# asgi_app.py desligam nos workers: o esquema é migrado uma vez, antes de subi-los
+SCHEMA_AUTO_MIGRATE = os.environ.get("SCHEMA_AUTO_MIGRATE", "1") == "1"
+
+# Servidor de produção (serve.py): gunicorn com workers criados depois do warm-up
+WEB_BIND = os.environ.get("WEB_BIND", "0.0.0.0:8000")
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", str(max(2, os.cpu_count() or 1))))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "8"))  # por worker
+WEB_TIMEOUT = int(os.environ.get("WEB_TIMEOUT", "120"))
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", "30"))
+WEB_KEEPALIVE = int(os.environ.get("WEB_KEEPALIVE", "5"))
+WEB_MAX_REQUESTS = int(os.environ.get("WEB_MAX_REQUESTS", "0"))  # 0 = nunca recicla o worker
+
+# Pool de conexões de cada worker (dimensione pelas threads do worker)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_POOL_MAX_OVERFLOW = int(os.environ.get("DB_POOL_MAX_OVERFLOW", "8"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_POOL_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    # o pool entrega cada conexão a uma thread por vez
+    "connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+}
+
 # Pasta para avatares
 AVATAR_UPLOAD_FOLDER = os.path.join("static", "avatars")
 ALLOWED_AVATAR_EXTENSIONS = {"jpg", "jpeg", "png", "webp"}
\ No newline at end of file
@@ -1,33 +1,41 @@
+"""
+Converte vídeos (mkv, avi, ...) para MP4 tocável no navegador, escolhendo o áudio em português.
+
+Uso:
+    python convert.py ["media/Fullmetal Alchemist Brotherhood/temporada 1" ...] [--workers 4] [--force]
+
+Sem caminhos, converte toda a MEDIA_ROOT. O vídeo é sempre copiado (-c:v copy);
+o áudio só é recodificado para AAC quando a faixa escolhida ainda não é compatível
+com o navegador. O MP4 é escrito num arquivo .part e renomeado no final, então um
+job interrompido nunca deixa um .mp4 pela metade para o indexador encontrar.
+"""
+import argparse
 import os
-import json
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-input_folder = "media/Fullmetal Alchemist Brotherhood/temporada 1"
-
-FFMPEG_EXE = r"C:\ffmpeg\bin\ffmpeg.exe"
-FFPROBE_EXE = r"C:\ffmpeg\bin\ffprobe.exe"
+from config import MEDIA_ROOT, FFMPEG_BIN
+from media_metadata import get_probe
 
 VIDEO_EXTS = (".mkv", ".avi", ".mov", ".wmv", ".mpg", ".mpeg")
 
 # idiomas que vamos aceitar como "português"
 PT_LANGS = {"por", "pt", "pt-br", "pob", "pb", "ptbr"}
 
-def ffprobe_streams(path: str) -> dict:
-    """Retorna JSON do ffprobe com streams."""
-    cmd = [
-        FFPROBE_EXE,
-        "-v", "error",
-        "-show_streams",
-        "-of", "json",
-        path
-    ]
-    out = subprocess.check_output(cmd, text=True, encoding="utf-8", errors="replace")
-    return json.loads(out)
+# codecs de áudio que os navegadores tocam dentro de MP4 (dá pra copiar sem recodificar)
+BROWSER_AUDIO_CODECS = {"aac", "mp3"}
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+
+def _audio_streams(info: dict) -> list:
+    streams = info.get("streams", [])
+    return [s for s in streams if s.get("codec_type") == "audio"]
+
 
 def pick_portuguese_audio_index(info: dict) -> int | None:
     """Escolhe índice do áudio em português (0:a:<index>), se existir."""
-    streams = info.get("streams", [])
-    audio_streams = [s for s in streams if s.get("codec_type") == "audio"]
+    audio_streams = _audio_streams(info)
 
     for i, s in enumerate(audio_streams):
         tags = s.get("tags") or {}
@@ -43,51 +51,148 @@ def pick_portuguese_audio_index(info: dict) -> int | None:
 
     return None
 
+
 def has_any_audio(info: dict) -> bool:
-    streams = info.get("streams", [])
-    return any(s.get("codec_type") == "audio" for s in streams)
+    return bool(_audio_streams(info))
 
-for file in os.listdir(input_folder):
-    if not file.lower().endswith(VIDEO_EXTS):
-        continue
 
-    input_path = os.path.join(input_folder, file)
-    output_path = os.path.splitext(input_path)[0] + ".mp4"
+def output_path_for(input_path: str) -> str:
+    return os.path.splitext(input_path)[0] + ".mp4"
 
-    print("\n🎬 Arquivo:", file)
 
-    info = ffprobe_streams(input_path)
+def is_up_to_date(input_path: str, output_path: str) -> bool:
+    """O MP4 já existe e é mais novo que o original."""
+    try:
+        return os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+    except OSError:
+        return False
 
-    if not has_any_audio(info):
-        print("⚠️ Nenhum áudio encontrado. Pulando:", file)
-        continue
 
+def build_command(input_path: str, output_path: str, info: dict) -> list:
+    """Monta o comando do ffmpeg: vídeo copiado, áudio PT (ou o primeiro) copiado ou em AAC."""
+    audio_streams = _audio_streams(info)
     pt_audio_idx = pick_portuguese_audio_index(info)
+    audio_idx = pt_audio_idx if pt_audio_idx is not None else 0
 
-    if pt_audio_idx is not None:
-        audio_map = f"0:a:{pt_audio_idx}"
-        print(f"✅ Áudio PT detectado: {audio_map}")
+    codec = (audio_streams[audio_idx].get("codec_name") or "").lower()
+    if codec in BROWSER_AUDIO_CODECS:
+        audio_args = ["-c:a", "copy"]
     else:
-        audio_map = "0:a:0"
-        print("⚠️ Áudio PT não encontrado (ou não marcado). Usando primeiro áudio: 0:a:0")
+        audio_args = ["-c:a", "aac", "-ac", "2"]
 
-    cmd = [
-        FFMPEG_EXE,
+    return [
+        FFMPEG_BIN,
         "-y",
+        "-nostdin",
+        "-loglevel", "error",
         "-i", input_path,
 
         "-map", "0:v:0",
-        "-map", audio_map,
+        "-map", f"0:a:{audio_idx}",
 
         "-c:v", "copy",
-        "-c:a", "aac",
-        "-ac", "2",
+        *audio_args,
         "-movflags", "+faststart",
+        "-f", "mp4",
 
         output_path
     ]
 
-    print("➡️ Comando:", " ".join(cmd))
-    subprocess.run(cmd, check=True)
 
-print("\n✅ Conversão finalizada!")
+def convert_file(input_path: str, force: bool = False) -> str:
+    """
+    Converte um arquivo. Retorna "skipped" (MP4 já atualizado), "no-audio" ou "converted".
+    """
+    output_path = output_path_for(input_path)
+    if not force and is_up_to_date(input_path, output_path):
+        return "skipped"
+
+    # ffprobe só roda se o arquivo for novo ou tiver mudado (cache em media_metadata)
+    info = get_probe(input_path)
+    if not has_any_audio(info):
+        return "no-audio"
+
+    tmp_path = output_path + ".part"
+    try:
+        subprocess.run(build_command(input_path, tmp_path, info), check=True, capture_output=True)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return "converted"
+
+
+def find_inputs(paths: list) -> list:
+    """Arquivos de vídeo a converter dentro das pastas (ou arquivos) indicados."""
+    inputs = []
+    for path in paths:
+        if os.path.isfile(path):
+            if path.lower().endswith(VIDEO_EXTS):
+                inputs.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(VIDEO_EXTS):
+                    inputs.append(os.path.join(root, name))
+    return inputs
+
+
+def convert_tree(paths: list, workers: int = DEFAULT_WORKERS, force: bool = False) -> dict:
+    """
+    Converte tudo o que houver em `paths` com até `workers` ffmpeg ao mesmo tempo.
+    Retorna a contagem por resultado.
+    """
+    inputs = find_inputs(paths)
+    summary = {"converted": 0, "skipped": 0, "no-audio": 0, "failed": 0}
+    total = len(inputs)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(convert_file, path, force): path for path in inputs}
+
+        for n, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            name = os.path.basename(path)
+            try:
+                status = future.result()
+            except subprocess.CalledProcessError as e:
+                summary["failed"] += 1
+                error = (e.stderr or b"").decode("utf-8", errors="replace").strip()[-300:]
+                print(f"❌ [{n}/{total}] {name}: {error or e}")
+                continue
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                # SubprocessError: TimeoutExpired do ffprobe/ffmpeg, por exemplo
+                summary["failed"] += 1
+                print(f"❌ [{n}/{total}] {name}: {e}")
+                continue
+
+            summary[status] += 1
+            if status == "converted":
+                print(f"✅ [{n}/{total}] {name}")
+            elif status == "no-audio":
+                print(f"⚠️ [{n}/{total}] Nenhum áudio encontrado. Pulando: {name}")
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converte vídeos da biblioteca para MP4 (áudio PT).")
+    parser.add_argument("paths", nargs="*", default=[MEDIA_ROOT],
+                        help="pastas ou arquivos (padrão: MEDIA_ROOT do config.py)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="quantos ffmpeg rodam ao mesmo tempo")
+    parser.add_argument("--force", action="store_true", help="reconverte mesmo se o MP4 estiver atualizado")
+    args = parser.parse_args()
+
+    summary = convert_tree(args.paths, max(1, args.workers), args.force)
+    print(
+        f"\n✅ Conversão finalizada! {summary['converted']} convertidos, "
+        f"{summary['skipped']} já atualizados, {summary['no-audio']} sem áudio, "
+        f"{summary['failed']} com erro."
+    )
+    raise SystemExit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
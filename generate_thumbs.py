@@ -1,60 +1,242 @@
+import argparse
+import json
 import os
+import sqlite3
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# ajuste para a pasta onde estão suas séries
-MEDIA_ROOT = r"E:\metflix\media"
+from config import MEDIA_ROOT, FFMPEG_BIN, THUMBS_MANIFEST_FILE
+from media_metadata import get_metadata
 
 VIDEO_EXTS = (".mp4", ".mkv", ".avi", ".mov", ".wmv")
 IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
 
+DEFAULT_SEEK = 10
+DEFAULT_TIMEOUT = 120
 
-def has_thumb(video_path: str) -> bool:
-    """Verifica se já existe uma imagem com o mesmo nome do vídeo."""
-    stem, _ = os.path.splitext(video_path)
-    for ext in IMAGE_EXTS:
-        if os.path.exists(stem + ext):
-            return True
-    return False
+# grava o manifesto a cada N jobs concluídos (e sempre no final)
+MANIFEST_SAVE_EVERY = 20
 
 
-def make_thumb(video_path: str):
-    """Gera um frame do vídeo e salva como JPG ao lado do arquivo."""
-    stem, _ = os.path.splitext(video_path)
-    thumb_path = stem + ".jpg"
+# ======================
+# Manifesto (retomada)
+# ======================
+# {
+#   "done":   {"Série/T1/S01E01.mkv": [tamanho, mtime_ns]},
+#   "failed": {"Série/T1/S01E02.mkv": {"sig": [tamanho, mtime_ns], "error": "...", "attempts": 1}}
+# }
+# A assinatura (tamanho, mtime) faz um vídeo substituído ser processado de novo.
+
+def load_manifest(path: str = THUMBS_MANIFEST_FILE) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data.setdefault("done", {})
+    data.setdefault("failed", {})
+    return data
+
+
+def save_manifest(manifest: dict, path: str = THUMBS_MANIFEST_FILE) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _video_signature(video_path: str) -> list:
+    st = os.stat(video_path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+# ======================
+# Geração de um thumb
+# ======================
 
-    # -ss: tempo do frame (aqui 10 segundos, pode ajustar)
+def has_thumb(names: set, video_name: str) -> bool:
+    """Verifica (entre os arquivos já listados da pasta) se existe imagem com o mesmo nome do vídeo."""
+    stem, _ = os.path.splitext(video_name)
+    return any(stem + ext in names for ext in IMAGE_EXTS)
+
+
+def _run_ffmpeg(video_path: str, out_path: str, seek: float, timeout: float) -> None:
+    # -ss antes do -i: seek rápido pelo índice do container
     # -frames:v 1: só 1 frame
     # -qscale:v 3: qualidade boa (1–5, quanto menor melhor)
     cmd = [
-        "ffmpeg",
+        FFMPEG_BIN,
         "-y",
-        "-ss", "00:00:10",
+        "-nostdin",
+        "-loglevel", "error",
+        "-ss", str(seek),
         "-i", video_path,
         "-frames:v", "1",
         "-qscale:v", "3",
-        thumb_path,
+        "-f", "image2",
+        "-update", "1",
+        out_path,
     ]
+    subprocess.run(cmd, check=True, timeout=timeout, capture_output=True)
 
-    print(f"Gerando thumb para: {video_path}")
-    subprocess.run(cmd, check=True)
 
+def pick_seek(video_path: str, seek: float) -> float:
+    """
+    Ajusta o segundo do frame pela duração já conhecida (cache do ffprobe, sem
+    rodar o ffprobe): vídeos curtos usam um terço da duração.
+    """
+    meta = get_metadata(video_path)
+    duration = meta.get("duration") if meta else None
+    if duration and duration < seek * 2:
+        return round(duration / 3, 3)
+    return seek
 
-def main():
-    for root, dirs, files in os.walk(MEDIA_ROOT):
-        for name in files:
+
+def make_thumb(video_path: str, seek: float = DEFAULT_SEEK, timeout: float = DEFAULT_TIMEOUT) -> str:
+    """
+    Gera um frame do vídeo e salva como JPG ao lado do arquivo.
+
+    O ffmpeg escreve num arquivo temporário que só é renomeado no final: um job
+    morto no meio nunca deixa um .jpg pela metade, e o rename muda o mtime da
+    pasta (o indexador e o cache de /media percebem o thumb novo).
+    """
+    stem, _ = os.path.splitext(video_path)
+    thumb_path = stem + ".jpg"
+    tmp_path = thumb_path + ".tmp"
+
+    try:
+        _run_ffmpeg(video_path, tmp_path, pick_seek(video_path, seek), timeout)
+        # Vídeo mais curto que o seek: o ffmpeg termina sem gerar frame
+        if not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
+            _run_ffmpeg(video_path, tmp_path, 0, timeout)
+        if not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
+            raise RuntimeError("ffmpeg não gerou nenhum frame")
+        os.replace(tmp_path, thumb_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return thumb_path
+
+
+# ======================
+# Fila de jobs
+# ======================
+
+def find_pending(media_root: str, manifest: dict, retry_failed: bool = False):
+    """
+    Percorre a biblioteca e devolve [(relative_path, caminho completo, assinatura)]
+    dos vídeos que ainda precisam de thumb: os que não têm imagem e os que têm um
+    thumb gerado aqui para uma versão anterior do vídeo (assinatura em "done"
+    diferente da atual). Imagens que não vieram deste script nunca são refeitas.
+    """
+    pending = []
+    for root, dirs, files in os.walk(media_root):
+        names = set(files)
+        for name in sorted(files):
             if not name.lower().endswith(VIDEO_EXTS):
                 continue
 
             video_path = os.path.join(root, name)
+            rel_path = os.path.relpath(video_path, media_root).replace("\\", "/")
+
+            try:
+                sig = _video_signature(video_path)
+            except OSError:
+                continue
 
-            if has_thumb(video_path):
-                # já tem thumb, pula
+            if has_thumb(names, name):
+                done = manifest["done"].get(rel_path)
+                if done is None or done == sig:
+                    # já tem thumb (e o vídeo é o mesmo), pula
+                    manifest["failed"].pop(rel_path, None)
+                    continue
+
+            failed = manifest["failed"].get(rel_path)
+            if failed and failed.get("sig") == sig and not retry_failed:
                 continue
 
+            pending.append((rel_path, video_path, sig))
+    return pending
+
+
+def run_jobs(media_root: str, workers: int, seek: float, timeout: float,
+             retry_failed: bool = False, manifest_path: str = THUMBS_MANIFEST_FILE) -> dict:
+    manifest = load_manifest(manifest_path)
+    pending = find_pending(media_root, manifest, retry_failed)
+    total = len(pending)
+    summary = {"total": total, "done": 0, "failed": 0}
+
+    if not pending:
+        print("Nenhum thumb pendente.")
+        save_manifest(manifest, manifest_path)
+        return summary
+
+    print(f"{total} thumbs para gerar com {workers} workers...")
+    lock = threading.Lock()
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(make_thumb, video_path, seek, timeout): (rel_path, sig)
+            for rel_path, video_path, sig in pending
+        }
+
+        for n, future in enumerate(as_completed(futures), start=1):
+            rel_path, sig = futures[future]
             try:
-                make_thumb(video_path)
-            except subprocess.CalledProcessError as e:
-                print(f"Erro ao gerar thumb para {video_path}: {e}")
+                future.result()
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, RuntimeError, OSError,
+                    ValueError, sqlite3.Error) as e:
+                # ValueError/sqlite3.Error vêm do pick_seek (cache do ffprobe): só este job falha
+                if isinstance(e, subprocess.CalledProcessError) and e.stderr:
+                    error = e.stderr.decode("utf-8", errors="replace").strip()[-500:]
+                elif isinstance(e, subprocess.TimeoutExpired):
+                    error = f"timeout após {timeout}s"
+                else:
+                    error = str(e)
+
+                with lock:
+                    previous = manifest["failed"].get(rel_path) or {}
+                    manifest["failed"][rel_path] = {
+                        "sig": sig,
+                        "error": error,
+                        "attempts": previous.get("attempts", 0) + 1,
+                    }
+                    summary["failed"] += 1
+                print(f"[{n}/{total}] ERRO {rel_path}: {error}")
+            else:
+                with lock:
+                    manifest["done"][rel_path] = sig
+                    manifest["failed"].pop(rel_path, None)
+                    summary["done"] += 1
+                print(f"[{n}/{total}] ok {rel_path}")
+
+            if n % MANIFEST_SAVE_EVERY == 0:
+                with lock:
+                    save_manifest(manifest, manifest_path)
+
+    save_manifest(manifest, manifest_path)
+    elapsed = time.monotonic() - started
+    print(f"Concluído em {elapsed:.1f}s: {summary['done']} gerados, {summary['failed']} com erro.")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera thumbs (frame JPG) para os vídeos da biblioteca.")
+    parser.add_argument("--root", default=MEDIA_ROOT, help="pasta da biblioteca (padrão: MEDIA_ROOT do config.py)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                        help="quantos ffmpeg rodam ao mesmo tempo")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="tempo máximo por vídeo (s)")
+    parser.add_argument("--seek", type=float, default=DEFAULT_SEEK, help="segundo do vídeo usado no thumb")
+    parser.add_argument("--retry-failed", action="store_true", help="tenta de novo os que falharam antes")
+    args = parser.parse_args()
+
+    summary = run_jobs(args.root, max(1, args.workers), args.seek, args.timeout, args.retry_failed)
+    raise SystemExit(1 if summary["failed"] else 0)
 
 
 if __name__ == "__main__":
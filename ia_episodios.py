@@ -1,12 +1,20 @@
 # ia_episodios.py
 import os
-import json
+import itertools
+import queue
+import sqlite3
+import threading
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Set, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+from config import APP_DB_PATH, DESCRIPTIONS_CACHE_TTL, DESCRIPTIONS_PENDING_TTL
+from cache_backend import get_cache, make_key
+from models import sqlite_connect
+
 # ==========================================
 # CONFIG BÁSICA / AMBIENTE
 # ==========================================
@@ -21,9 +29,12 @@ GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models"
 
 DEBUG_IA_EP = True
 
-DATA_DIR = os.path.join(BASE_DIR, "data")
-DESCRIPTIONS_FILE = os.path.join(DATA_DIR, "descriptions.json")
-_CACHE_MEM: Dict[str, Any] | None = None
+# Quantas chamadas ao Gemini rodam ao mesmo tempo (threads da fila) e quantas
+# por minuto no total (todas as threads do processo dividem o limite)
+IA_MAX_WORKERS = int(os.getenv("IA_MAX_WORKERS", "4"))
+IA_REQUESTS_PER_MINUTE = float(os.getenv("IA_REQUESTS_PER_MINUTE", "15"))
+
+DESCRIPTIONS_DB = APP_DB_PATH
 
 
 def _debug(msg: str):
@@ -32,33 +43,73 @@ def _debug(msg: str):
 
 
 # ==========================================
-# CACHE LOCAL
+# CACHE LOCAL (tabela episode_descriptions no app.db)
 # ==========================================
+# Uma linha por episódio: inserir e consultar custam O(1) e vários processos
+# (workers do gunicorn, threads da fila) gravam ao mesmo tempo sem um
+# sobrescrever o outro. A tabela (models.EpisodeDescription) é criada pelo
+# ensure_schema, que também importa o antigo data/descriptions.json.
+
+_local = threading.local()
 
-def _load_cache() -> Dict[str, Any]:
-    global _CACHE_MEM
-    if _CACHE_MEM is not None:
-        return _CACHE_MEM
-    os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(DESCRIPTIONS_FILE):
-        _CACHE_MEM = {}
-        return _CACHE_MEM
-    try:
-        with open(DESCRIPTIONS_FILE, "r", encoding="utf-8") as f:
-            _CACHE_MEM = json.load(f)
-            return _CACHE_MEM
-    except Exception as e:
-        _debug(f"Erro ao carregar cache: {e}")
-        _CACHE_MEM = {}
-        return _CACHE_MEM
 
+def _connect() -> sqlite3.Connection:
+    """Uma conexão por thread (o sqlite3 não compartilha conexões entre threads)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite_connect(DESCRIPTIONS_DB)  # mesmos PRAGMAs do pool do app
+        _local.conn = conn
+    return conn
 
-def _save_cache(cache: Dict[str, Any]) -> None:
-    global _CACHE_MEM
-    os.makedirs(DATA_DIR, exist_ok=True)
-    with open(DESCRIPTIONS_FILE, "w", encoding="utf-8") as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
-    _CACHE_MEM = cache
+
+def _cached_descricao(serie: str, temporada: str, numero: int) -> str | None:
+    return _cached_temporada(serie, temporada).get(numero)
+
+
+def _cached_temporada(serie: str, temporada: str) -> Dict[int, str]:
+    """
+    Todas as descrições já geradas da temporada (uma consulta), guardadas no
+    cache_backend por DESCRIPTIONS_CACHE_TTL e apagadas quando uma nova é salva.
+    """
+    key = make_key("descriptions", serie, temporada)
+    cache = get_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = dict(
+        _connect().execute(
+            "SELECT numero, descricao FROM episode_descriptions WHERE serie = ? AND temporada = ?",
+            (serie, temporada),
+        )
+    )
+    cache.set(key, result, ttl=DESCRIPTIONS_CACHE_TTL)
+    return result
+
+
+def _db_temporada(serie: str, temporada: str, numeros: Iterable[int]) -> Dict[int, str]:
+    """Descrições direto do banco, sem o cache (que é de cada processo)."""
+    numeros = list(numeros)
+    if not numeros:
+        return {}
+    marks = ", ".join("?" * len(numeros))
+    return dict(
+        _connect().execute(
+            "SELECT numero, descricao FROM episode_descriptions "
+            f"WHERE serie = ? AND temporada = ? AND numero IN ({marks})",
+            (serie, temporada, *numeros),
+        )
+    )
+
+
+def _salvar_descricao(serie: str, temporada: str, numero: int, desc: str) -> None:
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO episode_descriptions VALUES (?, ?, ?, ?, ?)",
+            (serie, temporada, numero, desc, time.time()),
+        )
+    get_cache().delete(make_key("descriptions", serie, temporada))
 
 
 # ==========================================
@@ -85,37 +136,30 @@ def _is_fallback(desc: str, serie: str, temporada: str, numero: int, filename: s
 
 def gerar_descricao_episodio(serie: str, temporada: str, numero: int, filename: str) -> str:
     """
-    Busca no cache. Se não tiver, tenta gerar via Gemini.
-    Se falhar, usa fallback, mas NÃO salva fallback no cache.
-    Assim, em uma próxima vez ele tenta gerar pela IA novamente.
+    Busca no cache. Se não tiver, devolve o fallback NA HORA e coloca o episódio
+    na fila de geração em segundo plano (a descrição da IA entra no cache quando
+    ficar pronta). O fallback nunca é salvo no cache, então a IA é tentada de
+    novo na próxima vez.
     """
-    cache = _load_cache()
-
-    serie_key = serie
-    temporada_key = temporada
-    numero_key = str(numero)
-
     # 1 — Se já existe no cache
-    if (
-        serie_key in cache
-        and temporada_key in cache[serie_key]
-        and numero_key in cache[serie_key][temporada_key]
-    ):
-        return cache[serie_key][temporada_key][numero_key]
-
-    # 2 — Se não existe → tentar gerar
+    cached = _cached_descricao(serie, temporada, numero)
+    if cached is not None:
+        return cached
+
+    # 2 — Se não existe → agenda a geração e responde com o fallback
     if not GEMINI_API_KEY:
         _debug("Sem GEMINI_API_KEY, usando fallback (sem salvar no cache).")
-        desc = _fallback_descricao(serie, temporada, numero, filename)
     else:
-        desc = _gerar_via_ia(serie, temporada, numero, filename)
+        enfileirar_descricao(serie, temporada, numero, filename)
+    return _fallback_descricao(serie, temporada, numero, filename)
+
+
+def _gerar_e_salvar(serie: str, temporada: str, numero: int, filename: str) -> str:
+    desc = _gerar_via_ia(serie, temporada, numero, filename)
 
     # 3 — Salvar NO CACHE só se NÃO for fallback
     if not _is_fallback(desc, serie, temporada, numero, filename):
-        cache.setdefault(serie_key, {})
-        cache[serie_key].setdefault(temporada_key, {})
-        cache[serie_key][temporada_key][numero_key] = desc
-        _save_cache(cache)
+        _salvar_descricao(serie, temporada, numero, desc)
         _debug("Descrição real da IA salva no cache.")
     else:
         _debug("Fallback detectado — NÃO será salvo no cache.")
@@ -123,6 +167,320 @@ def gerar_descricao_episodio(serie: str, temporada: str, numero: int, filename:
     return desc
 
 
+# ==========================================
+# FILA DE GERAÇÃO EM SEGUNDO PLANO
+# ==========================================
+# Fila com prioridade + IA_MAX_WORKERS threads. O episódio que alguém está
+# olhando (PRIORIDADE_PAGINA) passa na frente do pré-carregamento da próxima
+# temporada (PRIORIDADE_PREFETCH). Cada episódio fica no máximo uma vez em
+# _PENDENTES/_EM_ANDAMENTO, então pedidos repetidos não geram chamadas repetidas.
+# A fila é de cada processo; entre os workers do gunicorn quem evita a geração
+# repetida é a marca em episode_description_jobs (ver _reservar).
+
+PRIORIDADE_PAGINA = 0
+PRIORIDADE_PREFETCH = 1
+
+_FILA: "queue.PriorityQueue[Tuple[int, int, Tuple[str, str, int], str]]" = queue.PriorityQueue()
+_SEQ = itertools.count()
+_PENDENTES: Dict[Tuple[str, str, int], int] = {}  # chave -> prioridade na fila
+_EM_ANDAMENTO: set = set()
+_FILA_LOCK = threading.Lock()
+_WORKERS: List[threading.Thread] = []
+
+
+def enfileirar_descricao(serie: str, temporada: str, numero: int, filename: str,
+                         prioridade: int = PRIORIDADE_PAGINA) -> None:
+    """Agenda a geração da descrição (ignora se já estiver na fila ou sendo gerada)."""
+    _enfileirar(serie, temporada, [(numero, filename)], prioridade)
+
+
+def _enfileirar(serie: str, temporada: str, episodios: List[Tuple[int, str]], prioridade: int) -> None:
+    novos: List[Tuple[int, str]] = []
+    with _FILA_LOCK:
+        for numero, filename in episodios:
+            key = (serie, temporada, numero)
+            if key in _EM_ANDAMENTO:
+                continue
+            atual = _PENDENTES.get(key)
+            if atual is None:
+                novos.append((numero, filename))
+            elif prioridade < atual:
+                # Já na fila com prioridade menor: entra de novo na frente; a
+                # cópia antiga é descartada pelo worker
+                _PENDENTES[key] = prioridade
+                _FILA.put((prioridade, next(_SEQ), key, filename))
+                _iniciar_workers()
+    if not novos:
+        return
+
+    # Só entra na fila deste processo o que nenhum outro worker está gerando
+    reservados = _reservar(serie, temporada, [numero for numero, _ in novos])
+    with _FILA_LOCK:
+        for numero, filename in novos:
+            key = (serie, temporada, numero)
+            if numero not in reservados or key in _PENDENTES or key in _EM_ANDAMENTO:
+                continue
+            _PENDENTES[key] = prioridade
+            _FILA.put((prioridade, next(_SEQ), key, filename))
+        _iniciar_workers()
+
+
+def _iniciar_workers() -> None:
+    # chamado com _FILA_LOCK
+    while len(_WORKERS) < IA_MAX_WORKERS:
+        worker = threading.Thread(target=_worker_loop, name=f"ia-ep-{len(_WORKERS)}", daemon=True)
+        _WORKERS.append(worker)
+        worker.start()
+
+
+def _worker_loop() -> None:
+    while True:
+        prioridade, _, key, filename = _FILA.get()
+        with _FILA_LOCK:
+            if _PENDENTES.get(key) != prioridade:
+                continue  # cópia antiga de um episódio que foi repriorizado ou já saiu
+            del _PENDENTES[key]
+            _EM_ANDAMENTO.add(key)
+        serie, temporada, numero = key
+        try:
+            _renovar(key)
+            # direto do banco: outro worker pode ter gerado enquanto estava na fila
+            if numero not in _db_temporada(serie, temporada, [numero]):
+                _gerar_e_salvar(serie, temporada, numero, filename)
+        except Exception as e:
+            _debug(f"Erro na fila de descrições ({key}): {e}")
+        finally:
+            _liberar(key)
+            with _FILA_LOCK:
+                _EM_ANDAMENTO.discard(key)
+
+
+# Marcas de "sendo gerado" compartilhadas (tabela episode_description_jobs no
+# app.db): o polling do cliente cai em qualquer worker, não só no que tem o
+# episódio na fila. Cada marca tem prazo (DESCRIPTIONS_PENDING_TTL), então a de
+# um worker que morreu expira sozinha e o episódio pode ser reagendado.
+
+def _reservar(serie: str, temporada: str, numeros: List[int]) -> Set[int]:
+    """Marca como pendentes os episódios sem marca válida; retorna os marcados."""
+    now = time.time()
+    marks = ", ".join("?" * len(numeros))
+    try:
+        conn = _connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            ocupados = {
+                numero for (numero,) in conn.execute(
+                    "SELECT numero FROM episode_description_jobs "
+                    f"WHERE serie = ? AND temporada = ? AND numero IN ({marks}) AND deadline > ?",
+                    (serie, temporada, *numeros, now),
+                )
+            }
+            livres = [numero for numero in numeros if numero not in ocupados]
+            conn.executemany(
+                "INSERT OR REPLACE INTO episode_description_jobs VALUES (?, ?, ?, ?)",
+                [(serie, temporada, numero, now + DESCRIPTIONS_PENDING_TTL) for numero in livres],
+            )
+    except sqlite3.Error as e:
+        # sem a marca os outros workers não veem o episódio como pendente,
+        # mas este ainda gera a descrição
+        _debug(f"Erro ao marcar descrições pendentes ({serie}/{temporada}): {e}")
+        return set(numeros)
+    return set(livres)
+
+
+def _renovar(key: Tuple[str, str, int]) -> None:
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO episode_description_jobs VALUES (?, ?, ?, ?)",
+            (*key, time.time() + DESCRIPTIONS_PENDING_TTL),
+        )
+
+
+def _liberar(key: Tuple[str, str, int]) -> None:
+    try:
+        conn = _connect()
+        with conn:
+            conn.execute(
+                "DELETE FROM episode_description_jobs WHERE serie = ? AND temporada = ? AND numero = ?", key
+            )
+    except sqlite3.Error as e:
+        _debug(f"Erro ao liberar a marca de {key}: {e}")  # expira pelo deadline
+
+
+def _pendentes(serie: str, temporada: str, numeros: List[int]) -> Set[int]:
+    """Episódios na fila deste processo ou com marca válida de qualquer worker."""
+    if not numeros:
+        return set()
+    with _FILA_LOCK:
+        locais = {
+            numero for numero in numeros
+            if (serie, temporada, numero) in _PENDENTES or (serie, temporada, numero) in _EM_ANDAMENTO
+        }
+    marks = ", ".join("?" * len(numeros))
+    marcados = {
+        numero for (numero,) in _connect().execute(
+            "SELECT numero FROM episode_description_jobs "
+            f"WHERE serie = ? AND temporada = ? AND numero IN ({marks}) AND deadline > ?",
+            (serie, temporada, *numeros, time.time()),
+        )
+    }
+    return locais | marcados
+
+
+# ==========================================
+# TEMPORADA INTEIRA
+# ==========================================
+
+def gerar_descricoes_temporada(
+    serie: str,
+    temporada: str,
+    episodios: List[Tuple[int, str]],
+) -> Tuple[Dict[int, str], List[int]]:
+    """
+    Descrições de vários episódios de uma vez, sem esperar pela IA.
+
+    `episodios` é uma lista de (numero, filename). Retorna ({numero: descrição},
+    [números ainda sendo gerados]): o que está no cache volta pronto; o resto
+    recebe o fallback e vai para a fila. O cliente consulta depois com
+    descricoes_prontas().
+    """
+    cached = _cached_temporada(serie, temporada)
+    result: Dict[int, str] = {}
+    faltando: List[Tuple[int, str]] = []
+
+    for numero, filename in episodios:
+        if numero in cached:
+            result[numero] = cached[numero]
+            continue
+        result[numero] = _fallback_descricao(serie, temporada, numero, filename)
+        faltando.append((numero, filename))
+
+    if not GEMINI_API_KEY or not faltando:
+        return result, []
+    _enfileirar(serie, temporada, faltando, PRIORIDADE_PAGINA)
+    pendentes = _pendentes(serie, temporada, [numero for numero, _ in faltando])
+    return result, [numero for numero, _ in faltando if numero in pendentes]
+
+
+def prefetch_temporada(serie: str, temporada: str, episodios: List[Tuple[int, str]]) -> None:
+    """Coloca na fila, com prioridade baixa, os episódios ainda sem descrição."""
+    if not GEMINI_API_KEY:
+        return
+    cached = _cached_temporada(serie, temporada)
+    faltando = [(numero, filename) for numero, filename in episodios if numero not in cached]
+    if faltando:
+        _enfileirar(serie, temporada, faltando, PRIORIDADE_PREFETCH)
+
+
+def descricoes_prontas(serie: str, temporada: str, numeros: List[int]) -> Tuple[Dict[int, str], List[int]]:
+    """
+    Para o polling do cliente: ({numero: descrição já gerada}, [números ainda na fila]).
+    Números fora das duas listas falharam e ficam com o fallback.
+
+    Lê o banco e as marcas compartilhadas, não o cache deste processo: a
+    descrição pode ter sido gerada (e o episódio estar na fila) em outro worker.
+    """
+    prontas = _db_temporada(serie, temporada, numeros)
+    if prontas:
+        # o cache deste worker ainda não tem as novas
+        get_cache().delete(make_key("descriptions", serie, temporada))
+    faltando = [numero for numero in numeros if numero not in prontas]
+    pendentes = _pendentes(serie, temporada, faltando)
+    return prontas, [numero for numero in faltando if numero in pendentes]
+
+
+# ==========================================
+# HTTP: SESSÃO COMPARTILHADA + LIMITE DE TAXA
+# ==========================================
+
+class _RateLimiter:
+    """
+    Token bucket global: no máximo `per_minute` chamadas por minuto somando todas
+    as threads. Um 429 com Retry-After pausa todo mundo até a cota voltar, em vez
+    de cada thread dormir e tentar de novo por conta própria.
+    """
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.capacity = max(1.0, min(per_minute, IA_MAX_WORKERS))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.blocked_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) * self.interval
+                else:
+                    delay = self.blocked_until - now
+            time.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self.updated = self.blocked_until
+
+
+_LIMITER = _RateLimiter(IA_REQUESTS_PER_MINUTE)
+
+_SESSION: requests.Session | None = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # No processo filho (worker do gunicorn) as threads, a conexão SQLite e as
+    # conexões TLS do pai não existem/não podem ser reaproveitadas. A fila e os
+    # locks também são recriados: um lock preso por uma thread do pai no momento
+    # do fork nunca seria liberado, e chaves em _PENDENTES/_EM_ANDAMENTO do pai
+    # ficariam "pendentes" para sempre no filho, sem ninguém para gerá-las.
+    global _local, _SESSION, _SESSION_LOCK, _FILA, _FILA_LOCK, _PENDENTES, _EM_ANDAMENTO
+    _local = threading.local()
+    _WORKERS.clear()
+    _FILA = queue.PriorityQueue()
+    _FILA_LOCK = threading.Lock()
+    _PENDENTES = {}
+    _EM_ANDAMENTO = set()
+    _SESSION = None
+    _SESSION_LOCK = threading.Lock()
+    _LIMITER.lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _session() -> requests.Session:
+    """Uma sessão para todas as threads: reaproveita as conexões TLS com o Gemini."""
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=IA_MAX_WORKERS)
+                session.mount("https://", adapter)
+                _SESSION = session
+    return _SESSION
+
+
+def _retry_after(resp: requests.Response) -> float | None:
+    try:
+        return float(resp.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
 # ==========================================
 # CHAMADA À IA COM RETRY / BACKOFF
 # ==========================================
@@ -154,12 +512,15 @@ Regras:
         try:
             _debug(f"Tentativa {tentativa}/{max_tentativas} para gerar descrição...")
 
-            resp = requests.post(url, json=payload, timeout=20)
+            _LIMITER.acquire()
+            resp = _session().post(url, json=payload, timeout=20)
 
-            # Se for erro de QUOTA / RATE LIMIT (429), espera e tenta de novo
+            # Se for erro de QUOTA / RATE LIMIT (429), pausa o limitador (todas as
+            # threads) pelo Retry-After, ou pelo backoff se não vier, e tenta de novo
             if resp.status_code == 429:
-                _debug("Erro 429 (quota/rate limit) — aguardando para tentar novamente...")
-                time.sleep(espera)
+                pausa = _retry_after(resp) or espera
+                _debug(f"Erro 429 (quota/rate limit) — pausando as chamadas por {pausa}s...")
+                _LIMITER.pause(pausa)
                 espera = min(espera * 2, 30)  # evita explodir o tempo
                 continue
 
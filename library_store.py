@@ -0,0 +1,229 @@
+# library_store.py
+"""
+Estado da biblioteca compartilhado entre os workers.
+
+Cada processo guarda o LibraryState em memória. Quem revarre a biblioteca grava o
+snapshot em disco e incrementa um contador de geração (LIBRARY_GENERATION_FILE);
+os outros workers comparam esse contador de tempos em tempos e recarregam o
+snapshot quando ele muda, sem precisar revarrer nada. Com um cache_backend
+compartilhado ("shared"/"redis"), o estado publicado também vai para o cache e
+os workers o leem de lá antes de recorrer ao arquivo.
+"""
+import os
+import threading
+import time
+
+from config import (
+    MEDIA_ROOT,
+    LIBRARY_SNAPSHOT_FILE,
+    LIBRARY_GENERATION_FILE,
+    LIBRARY_CHECK_INTERVAL,
+)
+from cache_backend import get_cache, make_key
+from media_metadata import attach_to_library
+from media_indexer import (
+    LibraryState,
+    rescan_series_library,
+    load_library_snapshot,
+    save_library_snapshot,
+)
+
+_lock = threading.Lock()
+_state: LibraryState | None = None
+_generation = 0
+_last_check = 0.0
+
+_rescan_event = threading.Event()
+_rescan_thread: threading.Thread | None = None
+_rescan_images = False  # algum pedido na fila quer conferir as imagens
+
+
+# ======================
+# Contador de geração
+# ======================
+
+def read_generation() -> int:
+    try:
+        with open(LIBRARY_GENERATION_FILE, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_generation() -> int:
+    """
+    Publica uma nova geração. Usa time_ns para que dois processos publicando ao
+    mesmo tempo nunca gravem o mesmo número.
+    """
+    generation = max(time.time_ns(), read_generation() + 1)
+    folder = os.path.dirname(LIBRARY_GENERATION_FILE)
+    os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{LIBRARY_GENERATION_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(str(generation))
+    os.replace(tmp_path, LIBRARY_GENERATION_FILE)
+    return generation
+
+
+def _publish(state: LibraryState) -> None:
+    global _state, _generation
+    save_library_snapshot(state, LIBRARY_SNAPSHOT_FILE, MEDIA_ROOT)
+    replaced = {read_generation(), _generation}
+    _generation = _write_generation()
+    _state = state
+
+    cache = get_cache()
+    if cache.shared:
+        cache.set(make_key("library", MEDIA_ROOT, _generation), state, ttl=24 * 3600)
+        # a geração anterior não é mais lida (quem ainda não recarregou vai direto
+        # para a nova); sem isso cada publicação deixa um LibraryState inteiro no tmpfs
+        for generation in replaced - {0, _generation}:
+            cache.delete(make_key("library", MEDIA_ROOT, generation))
+
+
+def _load_published(generation: int) -> LibraryState | None:
+    """Estado de uma geração publicada: do cache compartilhado ou do snapshot."""
+    cache = get_cache()
+    if cache.shared:
+        state = cache.get(make_key("library", MEDIA_ROOT, generation))
+        if state is not None:
+            return state
+    return load_library_snapshot(LIBRARY_SNAPSHOT_FILE, MEDIA_ROOT)
+
+
+# ======================
+# Leitura
+# ======================
+
+def get_library_state() -> LibraryState:
+    """
+    Estado atual da biblioteca neste worker.
+
+    Na primeira chamada carrega o snapshot (relendo só as pastas que mudaram
+    desde que ele foi gravado).
+    Depois, a cada LIBRARY_CHECK_INTERVAL segundos, confere a geração publicada
+    e recarrega o snapshot se outro processo publicou uma versão nova.
+    """
+    global _state, _generation, _last_check
+
+    now = time.monotonic()
+    if _state is not None and now - _last_check < LIBRARY_CHECK_INTERVAL:
+        return _state
+
+    with _lock:
+        _last_check = now
+        generation = read_generation()
+
+        if _state is None:
+            # Valida o snapshot contra as assinaturas das pastas: só o que mudou é relido
+            previous = load_library_snapshot(LIBRARY_SNAPSHOT_FILE, MEDIA_ROOT)
+            # o snapshot pode ser antigo: confere também as imagens, uma vez
+            state = rescan_series_library(MEDIA_ROOT, previous, check_images=True)
+            attach_to_library(state.library)
+            if previous is None or generation == 0 or state.signatures != previous.signatures:
+                try:
+                    _publish(state)
+                except OSError as e:
+                    print(f"[library] não foi possível gravar o snapshot: {e}")
+                    _state, _generation = state, generation
+            else:
+                _state, _generation = state, generation
+        elif generation != _generation:
+            state = _load_published(generation)
+            # Snapshot ainda não legível (sendo gravado, cache sem a chave): mantém
+            # a geração antiga para tentar de novo na próxima conferência
+            if state is not None:
+                _state, _generation = state, generation
+
+    return _state
+
+
+def get_library_generation() -> int:
+    """Geração do estado carregado neste worker (muda a cada nova publicação)."""
+    get_library_state()
+    return _generation
+
+
+def get_cached_library() -> dict:
+    return get_library_state().library
+
+
+# ======================
+# Revarredura
+# ======================
+
+def rescan_now(check_images: bool = False) -> LibraryState:
+    """
+    Revarredura incremental síncrona. Só publica (snapshot + geração) se alguma
+    pasta mudou de fato. Sem check_images custa um stat por pasta; com ele,
+    mais um por imagem (pega posters/thumbs sobrescritos no lugar).
+    """
+    previous = get_library_state()
+    with _lock:
+        state = rescan_series_library(MEDIA_ROOT, previous, check_images=check_images)
+        if state.signatures != previous.signatures:
+            attach_to_library(state.library)
+            _publish(state)
+    return state
+
+
+def refresh_metadata() -> None:
+    """
+    Recoloca os metadados do ffprobe nos episódios e publica a biblioteca,
+    para os workers verem durações/codecs analisados depois da última varredura.
+    """
+    state = get_library_state()
+    with _lock:
+        attach_to_library(state.library)
+        _publish(state)
+
+
+def _rescan_loop() -> None:
+    global _rescan_images
+    while True:
+        _rescan_event.wait()
+        with _lock:
+            _rescan_event.clear()
+            check_images, _rescan_images = _rescan_images, False
+        try:
+            state = rescan_now(check_images)
+            print(
+                "[library] revarredura: "
+                f"{state.stats['rescanned']} pastas relidas, "
+                f"{state.stats['skipped']} reaproveitadas"
+            )
+        except Exception as e:
+            print(f"[library] erro na revarredura: {e}")
+
+
+def request_rescan(check_images: bool = False) -> None:
+    """
+    Agenda uma revarredura em segundo plano e retorna na hora.
+    Pedidos que chegam enquanto uma revarredura está na fila viram um só
+    (que confere as imagens se algum deles pediu).
+    """
+    global _rescan_thread, _rescan_images
+    with _lock:
+        _rescan_images = _rescan_images or check_images
+        if _rescan_thread is None or not _rescan_thread.is_alive():
+            _rescan_thread = threading.Thread(
+                target=_rescan_loop, name="library-rescan", daemon=True
+            )
+            _rescan_thread.start()
+    _rescan_event.set()
+
+
+def _reset_after_fork() -> None:
+    # Workers do gunicorn nascem por fork do processo que fez o warm-up. O estado
+    # carregado continua valendo, mas o lock pode ter sido copiado preso (uma
+    # revarredura do pai no meio do fork) e a thread de revarredura não existe
+    # no filho
+    global _lock, _rescan_event, _rescan_thread, _rescan_images
+    _lock = threading.Lock()
+    _rescan_images = False
+    _rescan_event = threading.Event()
+    _rescan_thread = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,177 @@
+# library_watcher.py
+"""
+Serviço opcional que observa MEDIA_ROOT e mantém a biblioteca atualizada sem /reindex.
+
+Usa o watchdog (inotify no Linux) quando ele está instalado; sem ele, faz polling
+periódico — a revarredura incremental só custa um stat por pasta quando nada mudou.
+Por isso o polling não vê uma imagem sobrescrita no lugar (o mtime da pasta não
+muda): isso fica para os eventos do inotify, que conferem as imagens (um stat
+por imagem), e para o /reindex.
+Rajadas de eventos (cópia de uma temporada inteira, por exemplo) são agrupadas:
+a revarredura só roda depois de LIBRARY_WATCH_DEBOUNCE segundos sem eventos novos.
+
+Cada revarredura publica um snapshot e uma nova geração (ver library_store), e os
+workers do app recarregam sozinhos.
+
+Com LIBRARY_WATCHER=1 o app inicia o observador numa thread. O serve.py e o
+asgi_app.py não deixam isso acontecer em cada worker: o serve.py sobe um
+processo à parte (spawn_library_watcher) e o asgi_app.py mantém a thread só no
+processo que inicia o uvicorn.
+
+Uso:
+    python library_watcher.py [--exit-with-parent]
+"""
+import argparse
+import atexit
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from config import MEDIA_ROOT, LIBRARY_WATCH_DEBOUNCE, LIBRARY_POLL_INTERVAL
+import library_store
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # watchdog é opcional
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher: "LibraryWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        # Leituras não mudam a biblioteca
+        if getattr(event, "event_type", "") in ("opened", "closed", "closed_no_write"):
+            return
+        self.watcher.notify()
+
+
+class LibraryWatcher:
+    def __init__(self, media_root: str, on_change, debounce: float = LIBRARY_WATCH_DEBOUNCE,
+                 poll_interval: float = LIBRARY_POLL_INTERVAL):
+        self.media_root = media_root
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self._event = threading.Event()
+        self._stop = threading.Event()
+        self._last_event = 0.0
+        self._observer = None
+        self._thread = None
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._observer is not None else "polling"
+
+    def notify(self) -> None:
+        self._last_event = time.monotonic()
+        self._event.set()
+
+    def start(self) -> None:
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_EventHandler(self), self.media_root, recursive=True)
+                self._observer.start()
+            except OSError as e:
+                print(f"[watcher] watchdog indisponível ({e}), usando polling")
+                self._observer = None
+
+        self._thread = threading.Thread(target=self._run, name="library-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._event.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Sem inotify, cada timeout do wait é uma rodada de polling
+            timeout = None if self._observer is not None else self.poll_interval
+            triggered = self._event.wait(timeout)
+            if self._stop.is_set():
+                break
+
+            if triggered:
+                # Debounce: espera a rajada de eventos acabar
+                while True:
+                    quiet = time.monotonic() - self._last_event
+                    if quiet >= self.debounce or self._stop.is_set():
+                        break
+                    time.sleep(self.debounce - quiet)
+                self._event.clear()
+
+            try:
+                # evento do inotify: pode ser uma imagem sobrescrita, confere todas
+                self.on_change(triggered)
+            except Exception as e:
+                print(f"[watcher] erro ao atualizar a biblioteca: {e}")
+
+
+def _rescan_and_log(check_images: bool = False) -> None:
+    state = library_store.rescan_now(check_images)
+    stats = state.stats
+    print(
+        f"[watcher] biblioteca atualizada: {stats['rescanned']} pastas relidas, "
+        f"{stats['skipped']} reaproveitadas"
+    )
+
+
+def start_library_watcher() -> LibraryWatcher:
+    watcher = LibraryWatcher(MEDIA_ROOT, _rescan_and_log)
+    watcher.start()
+    return watcher
+
+
+def spawn_library_watcher() -> subprocess.Popen:
+    """
+    Roda o observador num processo próprio, encerrado junto com este. Usado pelo
+    serve.py: o processo principal do gunicorn cria os workers por fork e não
+    pode ter uma revarredura (com os locks do library_store) rodando numa thread.
+    """
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--exit-with-parent"])
+    atexit.register(_stop_process, proc)
+    return proc
+
+
+def _stop_process(proc: subprocess.Popen) -> None:
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Observa MEDIA_ROOT e publica a biblioteca atualizada.")
+    parser.add_argument("--exit-with-parent", action="store_true",
+                        help="encerra quando o processo que o iniciou morrer (spawn_library_watcher)")
+    args = parser.parse_args()
+    parent = os.getppid()
+
+    library_store.get_library_state()
+    watcher = start_library_watcher()
+    print(f"[watcher] observando {MEDIA_ROOT} ({watcher.mode})")
+    try:
+        while not args.exit_with_parent or os.getppid() == parent:
+            time.sleep(5 if args.exit_with_parent else 3600)
+    except KeyboardInterrupt:
+        pass
+    watcher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# media_derivatives.py
+"""
+Versões reduzidas (derivadas) de posters e thumbs para servir em /media?size=...
+
+As imagens originais ficam como estão (frames em resolução cheia gerados pelo
+generate_thumbs.py); na primeira vez que um tamanho é pedido, geramos uma cópia
+redimensionada em WebP (ou JPEG, para navegadores sem WebP) e guardamos em
+DERIVATIVE_CACHE_DIR. A chave do arquivo é um hash do caminho + mtime/tamanho do
+original + variante, então trocar a imagem original gera uma derivada nova.
+
+O cache tem limite de tamanho (DERIVATIVE_CACHE_MAX_BYTES) com remoção das
+derivadas usadas há mais tempo. Pedidos simultâneos da mesma derivada geram o
+arquivo uma única vez: dentro do processo por um lock por chave, entre processos
+por um arquivo .lock criado com O_EXCL.
+
+Depende do Pillow; sem ele, available() é False e o app serve o original.
+"""
+import hashlib
+import os
+import threading
+import time
+
+from config import DERIVATIVE_CACHE_DIR, DERIVATIVE_CACHE_MAX_BYTES
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow é opcional
+    Image = None
+
+# variante -> caixa máxima (largura, altura); a proporção original é mantida
+DERIVATIVE_SIZES = {
+    "card": (360, 540),
+    "row": (480, 270),
+    "hero": (1280, 720),
+}
+
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+SOURCE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+# Não atualiza o "último uso" de uma derivada mais do que uma vez por intervalo
+_TOUCH_INTERVAL = 3600
+_LOCK_STALE_AFTER = 60
+_LOCK_WAIT_TIMEOUT = 30
+
+_locks_guard = threading.Lock()
+_locks: dict[str, threading.Lock] = {}
+
+_size_lock = threading.Lock()
+_cache_bytes: int | None = None
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def _key_lock(key: str) -> threading.Lock:
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = threading.Lock()
+        return lock
+
+
+def _derivative_path(relative_path: str, st: os.stat_result, variant: str, fmt: str) -> str:
+    raw = f"{relative_path}|{st.st_mtime_ns}|{st.st_size}|{variant}|{fmt}".encode("utf-8")
+    key = hashlib.sha256(raw).hexdigest()
+    ext = "webp" if fmt == "webp" else "jpg"
+    return os.path.join(DERIVATIVE_CACHE_DIR, key[:2], f"{key}.{ext}")
+
+
+def _render(source_path: str, target_path: str, variant: str, fmt: str) -> None:
+    pil_format, options = FORMATS[fmt]
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(DERIVATIVE_SIZES[variant], Image.Resampling.LANCZOS)
+        if img.mode not in ("RGB", "RGBA") or (fmt == "jpeg" and img.mode == "RGBA"):
+            img = img.convert("RGB")
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            img.save(tmp_path, pil_format, **options)
+            os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def _acquire_file_lock(lock_path: str) -> bool:
+    """Tenta criar o .lock; remove locks abandonados por processos que morreram."""
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.close(fd)
+        return True
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock_path) > _LOCK_STALE_AFTER:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        return False
+
+
+def _touch(path: str, st: os.stat_result) -> None:
+    if time.time() - st.st_mtime > _TOUCH_INTERVAL:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+def _add_to_cache_size(nbytes: int) -> None:
+    global _cache_bytes
+    with _size_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(size for _, size, _ in _cache_entries())
+        else:
+            _cache_bytes += nbytes
+        over = _cache_bytes > DERIVATIVE_CACHE_MAX_BYTES
+    if over:
+        evict()
+
+
+def _cache_entries():
+    """(caminho, tamanho, mtime) de cada derivada no cache."""
+    entries = []
+    if not os.path.isdir(DERIVATIVE_CACHE_DIR):
+        return entries
+    with os.scandir(DERIVATIVE_CACHE_DIR) as shards:
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            with os.scandir(shard.path) as it:
+                for entry in it:
+                    if entry.name.endswith((".webp", ".jpg")):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((entry.path, st.st_size, st.st_mtime))
+    return entries
+
+
+def evict(target_ratio: float = 0.9) -> int:
+    """
+    Remove as derivadas usadas há mais tempo até o cache ficar abaixo de
+    target_ratio * DERIVATIVE_CACHE_MAX_BYTES. Retorna quantos arquivos saíram.
+    """
+    global _cache_bytes
+    entries = _cache_entries()
+    total = sum(size for _, size, _ in entries)
+    limit = DERIVATIVE_CACHE_MAX_BYTES * target_ratio
+    removed = 0
+
+    for path, size, _ in sorted(entries, key=lambda e: e[2]):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    with _size_lock:
+        _cache_bytes = total
+    return removed
+
+
+def get_derivative(source_path: str, relative_path: str, variant: str, fmt: str) -> str | None:
+    """
+    Caminho da derivada pronta, gerando se preciso. Retorna None se a variante/
+    formato não existir, o Pillow não estiver instalado ou a imagem não abrir —
+    nesses casos quem chamou deve servir o original.
+    """
+    if Image is None or variant not in DERIVATIVE_SIZES or fmt not in FORMATS:
+        return None
+    if not relative_path.lower().endswith(SOURCE_EXTS):
+        return None
+
+    try:
+        source_st = os.stat(source_path)
+    except OSError:
+        return None
+
+    target = _derivative_path(relative_path, source_st, variant, fmt)
+    try:
+        _touch(target, os.stat(target))
+        return target
+    except OSError:
+        pass
+
+    # o lock da chave sai do dicionário em qualquer saída (inclusive nos returns
+    # antecipados), senão _locks cresce com cada derivada já pedida
+    try:
+        with _key_lock(target):
+            lock_path = target + ".lock"
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            deadline = time.monotonic() + _LOCK_WAIT_TIMEOUT
+
+            while True:
+                if os.path.exists(target):
+                    return target
+                if _acquire_file_lock(lock_path):
+                    break
+                # Outro processo está gerando essa mesma derivada
+                if time.monotonic() > deadline:
+                    return None
+                time.sleep(0.05)
+
+            try:
+                if not os.path.exists(target):
+                    _render(source_path, target, variant, fmt)
+                    _add_to_cache_size(os.path.getsize(target))
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                print(f"[derivatives] erro ao gerar {variant}/{fmt} de {relative_path}: {e}")
+                return None
+            finally:
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+    finally:
+        with _locks_guard:
+            _locks.pop(target, None)
+    return target
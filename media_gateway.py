@@ -0,0 +1,235 @@
+# media_gateway.py
+"""
+Servidor de mídia separado do app: confere URLs assinadas (media_signing.py) e
+entrega os arquivos de /stream e /media sem carregar o app Flask, a sessão ou o
+banco. Assim a vazão de vídeo escala independente da renderização das páginas.
+
+É um app ASGI puro (sem framework). Dois modos:
+
+1. Servindo os bytes (Range, If-Range, ETag/304, derivadas ?size=):
+
+       python media_gateway.py --port 8001          # usa uvicorn, se instalado
+       uvicorn media_gateway:app --port 8001 --workers 4
+
+   e o proxy reverso manda /stream/ e /media/ para ele:
+
+       location /stream/ { proxy_pass http://127.0.0.1:8001; proxy_buffering off; }
+       location /media/  { proxy_pass http://127.0.0.1:8001; }
+
+2. Só autorizando (auth_request do nginx; forward_auth do Caddy/Traefik):
+   MEDIA_GATEWAY_AUTH_PATH responde 204 (URL válida) ou 403, olhando o
+   X-Original-URI (ou X-Forwarded-Uri), e o próprio nginx serve o arquivo:
+
+       location /stream/ {
+           auth_request /_media_auth;
+           alias /caminho/da/media/;
+       }
+       location = /_media_auth {
+           internal;
+           proxy_pass http://127.0.0.1:8001;
+           proxy_pass_request_body off;
+           proxy_set_header Content-Length "";
+           proxy_set_header X-Original-URI $request_uri;
+       }
+
+Ligue MEDIA_SIGNED_URLS=1 no app antes de desviar as rotas: pedidos sem
+assinatura recebem 403 aqui.
+"""
+import argparse
+import asyncio
+import mimetypes
+import os
+import stat
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from werkzeug.utils import safe_join
+
+import media_derivatives
+from config import MEDIA_ROOT, MEDIA_GATEWAY_AUTH_PATH, STREAM_BUFFER_SIZE
+from media_signing import KINDS, verify
+from media_stream import cache_headers, last_modified_of, make_etag, media_cache_policy, not_modified, resolve_range
+
+
+def parse_query(query_string: str) -> dict:
+    """Primeiro valor de cada parâmetro da query string."""
+    return {k: v[0] for k, v in parse_qs(query_string).items()}
+
+
+def split_media_path(path: str):
+    """"/stream/A/T1/E01.mp4" -> ("stream", "A/T1/E01.mp4"); outros caminhos -> (None, None)."""
+    prefix, _, rel = path.lstrip("/").partition("/")
+    kind = KINDS.get(prefix)
+    if kind is None or not rel:
+        return None, None
+    return kind, rel
+
+
+def verify_uri(uri: str) -> int | None:
+    """Confere uma URI completa (caminho + query). Retorna o id do usuário ou None."""
+    parts = urlsplit(uri)
+    kind, rel = split_media_path(unquote(parts.path))
+    if kind is None:
+        return None
+    return verify(kind, rel, parse_query(parts.query))
+
+
+# ======================
+# Respostas
+# ======================
+
+async def respond(send, status: int, headers: list | None = None, body: bytes = b"") -> None:
+    await send({"type": "http.response.start", "status": status, "headers": headers or []})
+    await send({"type": "http.response.body", "body": body})
+
+
+def header(headers: dict, name: str) -> str | None:
+    """Cabeçalho do scope ASGI ({nome em bytes minúsculos: valor}) como str."""
+    value = headers.get(name.encode("latin-1"))
+    return value.decode("latin-1") if value is not None else None
+
+
+def _pick_file(kind: str, rel: str, query: dict, headers: dict):
+    """(caminho no disco, Vary) do arquivo a enviar, ou (None, None)."""
+    full_path = safe_join(MEDIA_ROOT, rel)
+    if full_path is None:
+        return None, None
+    size = query.get("size") if kind == "media" else None
+    if size and media_derivatives.available():
+        accept = header(headers, "accept") or ""
+        fmt = "webp" if "image/webp" in accept else "jpeg"
+        derivative = media_derivatives.get_derivative(full_path, rel, size, fmt)
+        if derivative:
+            return derivative, "Accept"
+    return full_path, None
+
+
+async def send_file(scope, send, kind: str, rel: str, query: dict, headers: dict) -> None:
+    """Responde com o arquivo (ou o trecho do Range) de /stream ou /media. Não confere acesso."""
+    full_path, vary = await asyncio.to_thread(_pick_file, kind, rel, query, headers)
+    try:
+        st = os.stat(full_path) if full_path else None
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
+        await respond(send, 404)
+        return
+
+    etag = make_etag(st)
+    last_modified = last_modified_of(st)
+    mimetype = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+
+    # mesmas regras das rotas do app (media_stream)
+    policy = media_cache_policy(kind, bool(query.get("v")))
+    response_headers = [
+        (b"content-type", mimetype.encode("latin-1")),
+        (b"accept-ranges", b"bytes"),
+    ]
+    response_headers += [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in cache_headers(etag, last_modified, **policy)
+    ]
+    if vary:
+        response_headers.append((b"vary", vary.encode("latin-1")))
+
+    if not_modified(etag, last_modified, header(headers, "if-none-match"), header(headers, "if-modified-since")):
+        await respond(send, 304, response_headers)
+        return
+
+    status, start, length, content_range = resolve_range(
+        st.st_size, etag, last_modified, header(headers, "range"), header(headers, "if-range")
+    )
+    if content_range:
+        response_headers.append((b"content-range", content_range.encode("latin-1")))
+    if status == 416:
+        await respond(send, 416, response_headers + [(b"content-length", b"0")])
+        return
+
+    response_headers.append((b"content-length", str(length).encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    if scope["method"] == "HEAD" or length == 0:
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    # Arquivo inteiro: o servidor pode enviar direto do disco (extensão pathsend)
+    if status == 200 and "http.response.pathsend" in scope.get("extensions", {}):
+        await send({"type": "http.response.pathsend", "path": full_path})
+        return
+
+    with open(full_path, "rb", buffering=0) as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(STREAM_BUFFER_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:  # arquivo encolheu no meio do envio
+            await send({"type": "http.response.body", "body": b""})
+
+
+# ======================
+# App ASGI
+# ======================
+
+async def handle_lifespan(receive, send) -> None:
+    """Startup/shutdown do servidor ASGI (nada a preparar)."""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await handle_lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    headers = dict(scope.get("headers") or [])
+    path = scope["path"]
+
+    if path == MEDIA_GATEWAY_AUTH_PATH:
+        uri = header(headers, "x-original-uri") or header(headers, "x-forwarded-uri") or ""
+        await respond(send, 204 if verify_uri(uri) is not None else 403)
+        return
+
+    if scope["method"] not in ("GET", "HEAD"):
+        await respond(send, 405, [(b"allow", b"GET, HEAD")])
+        return
+
+    kind, rel = split_media_path(path)
+    if kind is None:
+        await respond(send, 404)
+        return
+    query = parse_query(scope.get("query_string", b"").decode("latin-1"))
+    if verify(kind, rel, query) is None:
+        await respond(send, 403)
+        return
+
+    try:
+        await send_file(scope, send, kind, rel, query, headers)
+    except OSError:
+        pass  # cliente desconectou no meio do envio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de mídia com URLs assinadas (ASGI).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("O media_gateway precisa de um servidor ASGI: pip install uvicorn")
+    uvicorn.run("media_gateway:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,246 @@
 # media_indexer.py
 import os
+import pickle
 import re
+import sys
+import tempfile
+from typing import NamedTuple
 
 VIDEO_EXTS = (".mp4", ".mkv", ".avi", ".mov", ".wmv")
 IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
 
+# Versão do formato do snapshot em disco; mude sempre que LibraryState mudar
+SNAPSHOT_VERSION = 4
 
-def _find_thumb_for_video(folder_path: str, video_name: str, serie_name: str, season_name: str | None):
+
+class DirListing(NamedTuple):
     """
-    Procura uma imagem com o mesmo nome do vídeo (ex: S01E01.jpg).
-    Retorna o caminho relativo para usar na rota /media.
+    Conteúdo de uma pasta lido numa única passada de os.scandir.
+
+    - dirs: nomes das subpastas
+    - videos: nomes dos arquivos de vídeo
+    - images: {stem: nome do arquivo} das imagens (ex: "S01E01" -> "S01E01.jpg")
+    - poster: nome do primeiro arquivo poster.* encontrado, ou None
+    - image_stats: {nome do arquivo: (st_size, st_mtime_ns)} de cada imagem
     """
-    stem, _ = os.path.splitext(video_name)
+    dirs: list
+    videos: list
+    images: dict
+    poster: str | None
+    image_stats: dict
+
+
+def _read_dir(path: str) -> DirListing:
+    """
+    Lê a pasta uma única vez. O tipo de cada entrada vem do próprio scandir
+    (d_type), então não há stat/exists extra por arquivo; só as imagens recebem
+    um stat, para a versão usada na URL (asset_version).
+    """
+    dirs = []
+    videos = []
+    images = {}
+    image_rank = {}
+    image_stats = {}
+    poster = None
+
+    with os.scandir(path) as it:
+        for entry in it:
+            name = entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                dirs.append(name)
+                continue
+
+            lower = name.lower()
+            if lower.endswith(VIDEO_EXTS):
+                videos.append(name)
+                continue
+
+            if lower.endswith(IMAGE_EXTS):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                image_stats[name] = (st.st_size, st.st_mtime_ns)
+
+            stem, ext = os.path.splitext(name)
+            if ext in IMAGE_EXTS:
+                # Mesma prioridade de antes: .jpg, .jpeg, .png, .webp
+                rank = IMAGE_EXTS.index(ext)
+                if rank < image_rank.get(stem, len(IMAGE_EXTS)):
+                    image_rank[stem] = rank
+                    images[stem] = name
+            if poster is None and lower.startswith("poster") and lower.endswith(IMAGE_EXTS):
+                poster = name
+
+    return DirListing(dirs, videos, images, poster, image_stats)
+
+
+# ======================
+# Registros compactos
+# ======================
+# Com centenas de milhares de episódios, um dict por episódio (e outro no índice)
+# com o caminho completo repetido custa centenas de MB por worker. Os registros
+# abaixo usam __slots__ e guardam só o nome do arquivo: o prefixo "Série/Temporada"
+# é uma única string (interned) compartilhada pela temporada inteira, e
+# relative_path/thumb são montados na hora. Continuam aceitando ep["chave"] e
+# ep.get("chave"), então templates, API e o resto do app não mudam.
+
+class _Record:
+    __slots__ = ()
+    _keys: tuple = ()
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self._keys:
+            return default
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def keys(self):
+        return self._keys
+
+    def as_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self._keys}
+
+    def __eq__(self, other):
+        if isinstance(other, _Record):
+            other = other.as_dict()
+        if isinstance(other, dict):
+            return self.as_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()!r})"
+
+
+class Episode(_Record):
+    """
+    Um episódio da biblioteca.
+
+    - filename: nome do arquivo de vídeo
+    - relative_path: "Série/Temporada/arquivo" (derivado)
+    - thumb: caminho relativo da imagem com o mesmo nome do vídeo, ou None (derivado)
+    - meta: resumo do ffprobe (media_metadata), ou None
+    """
+    __slots__ = ("prefix", "filename", "thumb_ext", "meta")
+    _keys = ("filename", "relative_path", "thumb", "meta")
+
+    def __init__(self, prefix: str, filename: str, thumb_ext: str | None, meta=None):
+        self.prefix = prefix
+        self.filename = filename
+        self.thumb_ext = thumb_ext
+        self.meta = meta
+
+    @property
+    def relative_path(self) -> str:
+        return f"{self.prefix}/{self.filename}"
+
+    @property
+    def thumb(self) -> str | None:
+        if self.thumb_ext is None:
+            return None
+        return f"{self.prefix}/{os.path.splitext(self.filename)[0]}{self.thumb_ext}"
+
+    def __setitem__(self, key, value):
+        # só o meta é gravável (media_metadata.attach_to_library)
+        if key != "meta":
+            raise KeyError(key)
+        self.meta = value
+
+    def as_dict(self) -> dict:
+        data = {"filename": self.filename, "relative_path": self.relative_path, "thumb": self.thumb}
+        if self.meta is not None:
+            data["meta"] = self.meta
+        return data
+
+    def __getstate__(self):
+        return (self.prefix, self.filename, self.thumb_ext, self.meta)
+
+    def __setstate__(self, state):
+        prefix, filename, thumb_ext, meta = state
+        # o pickle não preserva o interning: reaplica ao carregar o snapshot
+        self.prefix = sys.intern(prefix)
+        self.filename = filename
+        self.thumb_ext = sys.intern(thumb_ext) if thumb_ext else None
+        self.meta = meta
+
+
+class EpisodeInfo(_Record):
+    """
+    Entrada do índice de episódios (build_episode_index). Guarda referências aos
+    registros Episode em vez de cópias dos caminhos.
+    """
+    __slots__ = ("serie_name", "season_name", "episode_index", "episode", "prev_episode", "next_episode")
+    _keys = ("serie_name", "episode_name", "season_name", "episode_index", "prev", "next", "relative_path")
+
+    def __init__(self, serie_name: str, season_name: str, episode_index: int, episode: Episode,
+                 prev_episode: Episode | None = None, next_episode: Episode | None = None):
+        self.serie_name = serie_name
+        self.season_name = season_name
+        self.episode_index = episode_index
+        self.episode = episode
+        self.prev_episode = prev_episode
+        self.next_episode = next_episode
+
+    @property
+    def episode_name(self) -> str:
+        return self.episode.filename
+
+    @property
+    def relative_path(self) -> str:
+        return self.episode.relative_path
+
+    @property
+    def prev(self) -> str | None:
+        return self.prev_episode.relative_path if self.prev_episode else None
+
+    @property
+    def next(self) -> str | None:
+        return self.next_episode.relative_path if self.next_episode else None
+
+    def __getstate__(self):
+        return (self.serie_name, self.season_name, self.episode_index,
+                self.episode, self.prev_episode, self.next_episode)
+
+    def __setstate__(self, state):
+        (self.serie_name, self.season_name, self.episode_index,
+         self.episode, self.prev_episode, self.next_episode) = state
+
 
-    for ext in IMAGE_EXTS:
-        cand = stem + ext
-        cand_full = os.path.join(folder_path, cand)
-        if os.path.exists(cand_full):
-            if season_name:
-                return f"{serie_name}/{season_name}/{cand}"
-            else:
-                return f"{serie_name}/{cand}"
+def _find_thumb_ext(images: dict, video_name: str) -> str | None:
+    """
+    Procura, entre as imagens já lidas da pasta, uma com o mesmo nome do vídeo
+    (ex: S01E01.jpg) e retorna só a extensão dela (o caminho é montado pelo Episode).
+    """
+    stem, _ = os.path.splitext(video_name)
+    cand = images.get(stem)
+    if cand:
+        return sys.intern(cand[len(stem):])
     return None
 
 
+def _build_episodes(listing: DirListing, prefix: str):
+    prefix = sys.intern(prefix)
+
+    # Episódios ordenados por número
+    return [
+        Episode(prefix, fname, _find_thumb_ext(listing.images, fname))
+        for fname in sorted(listing.videos, key=extract_number)
+    ]
+
+
 def extract_number(text: str) -> int:
     """
     Extrai o primeiro número encontrado no texto para usar como chave de ordenação.
@@ -33,6 +250,254 @@ def extract_number(text: str) -> int:
     return int(nums[0]) if nums else 9999
 
 
+class LibraryState(NamedTuple):
+    """
+    Resultado de uma varredura da biblioteca.
+
+    - library: dict no formato de get_series_library
+    - signatures: {pasta_relativa: (mtime_ns, inode, subpastas, imagens)} de cada
+      pasta lida; imagens é o image_stats da pasta ({arquivo: (tamanho, mtime_ns)})
+    - stats: {"rescanned": n, "skipped": n} contagem de pastas relidas / reaproveitadas
+    - episodes: índice {(prefixo, arquivo): EpisodeInfo} montado por build_episode_index
+    - cards: lista de cards da página inicial (get_series_cards), já ordenada
+    """
+    library: dict
+    signatures: dict
+    stats: dict
+    episodes: dict
+    cards: list
+
+
+def _dir_signature(path: str):
+    """
+    Assinatura (mtime_ns, inode) de uma pasta, ou None se ela não existir.
+    O mtime da pasta muda sempre que um arquivo é criado, removido ou renomeado nela.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_ino)
+
+
+def _same_signature(signatures: dict, rel_dir: str, sig, path: str, check_images: bool = False) -> bool:
+    """
+    A pasta está igual à da varredura anterior (mtime/inode da pasta).
+
+    Com check_images, confere também cada imagem já conhecida (um stat por
+    imagem): sobrescrever um arquivo no lugar (sem criar, remover ou renomear)
+    não muda o mtime da pasta, mas muda a versão da imagem. Fica fora do
+    polling, que assim custa um stat por pasta.
+    """
+    old = signatures.get(rel_dir)
+    if old is None or sig is None or old[:2] != sig:
+        return False
+    if not check_images:
+        return True
+    for name, image_sig in old[3].items():
+        try:
+            st = os.stat(os.path.join(path, name))
+        except OSError:
+            return False
+        if (st.st_size, st.st_mtime_ns) != image_sig:
+            return False
+    return True
+
+
+def _scan_season(season_path: str, serie_name: str, season_name: str):
+    """(temporada ou None se não tiver episódios, image_stats da pasta)."""
+    listing = _read_dir(season_path)
+    eps = _build_episodes(listing, f"{serie_name}/{season_name}")
+
+    if not eps:
+        return None, listing.image_stats
+    return {
+        "name": season_name,
+        "episodes": eps
+    }, listing.image_stats
+
+
+def _scan_serie(media_root: str, serie_name: str, previous: dict | None,
+                old_sigs: dict, new_sigs: dict, stats: dict, check_images: bool = False):
+    """
+    Monta a entrada de uma série, relendo só as pastas cuja assinatura mudou.
+    Retorna None se a série não tiver episódios.
+    """
+    serie_path = os.path.join(media_root, serie_name)
+    serie_sig = _dir_signature(serie_path)
+    if serie_sig is None:
+        return None
+
+    old_serie = old_sigs.get(serie_name)
+    serie_changed = not _same_signature(old_sigs, serie_name, serie_sig, serie_path, check_images)
+
+    # Se a pasta da série não mudou, as subpastas são as mesmas da última varredura
+    if not serie_changed:
+        season_dirs = list(old_serie[2])
+    else:
+        season_dirs = []
+
+    season_sigs = {}
+    seasons_changed = False
+    for sd in season_dirs:
+        rel_sd = f"{serie_name}/{sd}"
+        season_path = os.path.join(serie_path, sd)
+        sig = _dir_signature(season_path)
+        same = _same_signature(old_sigs, rel_sd, sig, season_path, check_images)
+        season_sigs[sd] = (sig, same)
+        if not same:
+            seasons_changed = True
+
+    # Nada mudou: reaproveita a série inteira da varredura anterior
+    if not serie_changed and not seasons_changed:
+        new_sigs[serie_name] = old_serie
+        for sd in season_dirs:
+            new_sigs[f"{serie_name}/{sd}"] = old_sigs[f"{serie_name}/{sd}"]
+        stats["skipped"] += 1 + len(season_dirs)
+        return previous
+
+    stats["rescanned"] += 1
+
+    # Uma única leitura da pasta: temporadas, vídeos soltos e poster
+    listing = _read_dir(serie_path)
+    poster = f"{serie_name}/{listing.poster}" if listing.poster else None
+
+    # Pastas = temporadas, vídeos soltos = "Episódios"
+    season_dirs = list(listing.dirs)
+    season_dirs.sort(key=extract_number)
+    new_sigs[serie_name] = (*serie_sig, tuple(season_dirs), listing.image_stats)
+
+    previous_seasons = {}
+    if previous:
+        previous_seasons = {s["name"]: s for s in previous.get("seasons", [])}
+
+    seasons = []
+
+    # Temporadas em subpastas (ordenadas por número)
+    for sd in season_dirs:
+        rel_sd = f"{serie_name}/{sd}"
+        season_path = os.path.join(serie_path, sd)
+        if sd in season_sigs:
+            sig, same = season_sigs[sd]
+        else:
+            sig = _dir_signature(season_path)
+            same = _same_signature(old_sigs, rel_sd, sig, season_path, check_images)
+        if sig is None:
+            continue
+
+        if same:
+            stats["skipped"] += 1
+            new_sigs[rel_sd] = old_sigs[rel_sd]
+            season = previous_seasons.get(sd)
+        else:
+            stats["rescanned"] += 1
+            season, image_stats = _scan_season(season_path, serie_name, sd)
+            new_sigs[rel_sd] = (*sig, (), image_stats)
+
+        if season:
+            seasons.append(season)
+
+    # Episódios soltos (temporada "Episódios")
+    if listing.videos:
+        seasons.insert(0, {
+            "name": "Episódios",
+            "episodes": _build_episodes(listing, serie_name)
+        })
+
+    if not seasons:
+        return None
+    return {
+        "poster": poster,
+        "seasons": seasons
+    }
+
+
+def rescan_series_library(media_root: str, previous: LibraryState | None = None,
+                          check_images: bool = False) -> LibraryState:
+    """
+    Varredura incremental da biblioteca.
+
+    Compara a assinatura (mtime/inode) de cada pasta de série e de temporada com a
+    varredura anterior e só relê as pastas que mudaram; as demais são reaproveitadas
+    do dict anterior. Sem `previous`, faz a varredura completa. Com check_images,
+    relê também as pastas com alguma imagem sobrescrita no lugar (ver _same_signature).
+    """
+    old_library = previous.library if previous else {}
+    old_sigs = previous.signatures if previous else {}
+    new_sigs = {}
+    stats = {"rescanned": 0, "skipped": 0}
+    library = {}
+
+    root_sig = _dir_signature(media_root)
+    if root_sig is None:
+        return LibraryState(library, new_sigs, stats, {}, [])
+
+    # A raiz é sempre listada: é uma única chamada e pega séries novas/removidas
+    stats["rescanned"] += 1
+    serie_names = sorted(_read_dir(media_root).dirs)
+    new_sigs[""] = (*root_sig, tuple(serie_names), {})
+
+    for serie_name in serie_names:
+        serie = _scan_serie(
+            media_root, serie_name, old_library.get(serie_name),
+            old_sigs, new_sigs, stats, check_images,
+        )
+        if serie:
+            library[serie_name] = serie
+
+    return LibraryState(
+        library, new_sigs, stats,
+        build_episode_index(library),
+        get_series_cards(library),
+    )
+
+
+def save_library_snapshot(state: LibraryState, snapshot_path: str, media_root: str) -> None:
+    """
+    Grava o estado da biblioteca (dict, assinaturas e índices) num pickle versionado.
+    A escrita vai para um arquivo temporário e depois os.replace, então um leitor
+    nunca vê um snapshot pela metade.
+    """
+    folder = os.path.dirname(snapshot_path) or "."
+    os.makedirs(folder, exist_ok=True)
+
+    payload = {
+        "version": SNAPSHOT_VERSION,
+        "media_root": os.path.abspath(media_root),
+        "state": tuple(state),
+    }
+    fd, tmp_path = tempfile.mkstemp(prefix=".library-", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_library_snapshot(snapshot_path: str, media_root: str) -> LibraryState | None:
+    """
+    Lê um snapshot gravado por save_library_snapshot.
+    Retorna None se não existir, estiver corrompido, for de outra versão ou de outra raiz.
+    """
+    try:
+        with open(snapshot_path, "rb") as f:
+            payload = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError):
+        return None
+
+    if not isinstance(payload, dict) or payload.get("version") != SNAPSHOT_VERSION:
+        return None
+    if payload.get("media_root") != os.path.abspath(media_root):
+        return None
+    try:
+        return LibraryState(*payload["state"])
+    except (KeyError, TypeError):
+        return None
+
+
 def get_series_library(media_root: str):
     """
     Estrutura:
@@ -57,87 +522,7 @@ def get_series_library(media_root: str):
       ...
     }
     """
-    library = {}
-
-    if not os.path.exists(media_root):
-        return library
-
-    for serie_name in sorted(os.listdir(media_root)):
-        serie_path = os.path.join(media_root, serie_name)
-        if not os.path.isdir(serie_path):
-            continue
-
-        # Poster da série
-        poster = None
-        for file in os.listdir(serie_path):
-            lower = file.lower()
-            if lower.startswith("poster") and lower.endswith(IMAGE_EXTS):
-                poster = f"{serie_name}/{file}"
-                break
-
-        seasons = []
-        season_dirs = []
-        loose_episodes = []
-
-        # Pastas = temporadas, vídeos soltos = "Episódios"
-        for entry in os.listdir(serie_path):
-            full = os.path.join(serie_path, entry)
-            if os.path.isdir(full):
-                season_dirs.append(entry)
-            elif entry.lower().endswith(VIDEO_EXTS):
-                loose_episodes.append(entry)
-
-        # Temporadas em subpastas (ordenadas por número)
-        for sd in sorted(season_dirs, key=extract_number):
-
-            season_path = os.path.join(serie_path, sd)
-            eps = []
-
-            # Episódios ordenados por número
-            for fname in sorted(os.listdir(season_path), key=extract_number):
-                if not fname.lower().endswith(VIDEO_EXTS):
-                    continue
-
-                rel_path = f"{serie_name}/{sd}/{fname}"
-                thumb = _find_thumb_for_video(season_path, fname, serie_name, sd)
-
-                eps.append({
-                    "filename": fname,
-                    "relative_path": rel_path,
-                    "thumb": thumb
-                })
-
-            if eps:
-                seasons.append({
-                    "name": sd,
-                    "episodes": eps
-                })
-
-        # Episódios soltos (temporada "Episódios")
-        if loose_episodes:
-            eps = []
-            for f in sorted(loose_episodes, key=extract_number):
-                rel_path = f"{serie_name}/{f}"
-                thumb = _find_thumb_for_video(serie_path, f, serie_name, None)
-
-                eps.append({
-                    "filename": f,
-                    "relative_path": rel_path,
-                    "thumb": thumb
-                })
-
-            seasons.insert(0, {
-                "name": "Episódios",
-                "episodes": eps
-            })
-
-        if seasons:
-            library[serie_name] = {
-                "poster": poster,
-                "seasons": seasons
-            }
-
-    return library
+    return rescan_series_library(media_root).library
 
 
 def get_series_cards(library: dict):
@@ -151,31 +536,77 @@ def get_series_cards(library: dict):
     return cards
 
 
-def find_episode_info(library: dict, relative_path: str):
+def asset_version(signatures: dict, relative_path: str) -> str | None:
+    """
+    Versão curta de um arquivo da biblioteca (poster/thumb) para usar como
+    fingerprint na URL (?v=...). Vem do (tamanho, mtime_ns) do próprio arquivo,
+    lido na varredura: qualquer substituição, inclusive no lugar, muda a versão.
     """
-    Encontra informações sobre um episódio a partir do caminho relativo.
+    folder, _, name = relative_path.rpartition("/")
+    sig = signatures.get(folder)
+    if sig is None:
+        return None
+    image_sig = sig[3].get(name)
+    if image_sig is None:
+        return None
+    size, mtime_ns = image_sig
+    return f"{mtime_ns:x}-{size:x}"
 
-    Retorna:
+
+def build_episode_index(library: dict):
+    """
+    Índice por (prefixo, arquivo) do episódio, montado junto com a biblioteca.
+    Os valores são EpisodeInfo, que se comportam como:
       {
         "serie_name": str,
         "episode_name": str,
         "season_name": str,
-        "episode_index": int  # 1-based dentro da temporada
+        "episode_index": int,       # 1-based dentro da temporada
+        "prev": str | None,         # relative_path do episódio anterior na série
+        "next": str | None,         # relative_path do próximo episódio na série
+        "relative_path": str,
       }
+    A chave é a tupla (prefix, filename) que o Episode já guarda, então o índice
+    não cria nenhuma string nova; use find_episode_info para consultar.
     """
-    rel_norm = relative_path.replace("\\", "/")
+    index = {}
 
     for serie_name, data in library.items():
+        prev_info = None
         for season in data.get("seasons", []):
             season_name = season.get("name", "")
-            episodes = season.get("episodes", [])
-            for idx, ep in enumerate(episodes):
-                if ep["relative_path"] == rel_norm:
-                    return {
-                        "serie_name": serie_name,
-                        "episode_name": ep["filename"],
-                        "season_name": season_name,
-                        "episode_index": idx + 1,
-                    }
+            for idx, ep in enumerate(season.get("episodes", [])):
+                info = EpisodeInfo(
+                    serie_name,
+                    season_name,
+                    idx + 1,
+                    ep,
+                    prev_info.episode if prev_info else None,
+                )
+                if prev_info:
+                    prev_info.next_episode = ep
+                index[(ep.prefix, ep.filename)] = info
+                prev_info = info
 
-    return None
+    return index
+
+
+def find_episode_info(episode_index: dict, relative_path: str):
+    """
+    Encontra informações sobre um episódio a partir do caminho relativo,
+    usando o índice de build_episode_index (consulta O(1)).
+
+    Retorna:
+      {
+        "serie_name": str,
+        "episode_name": str,
+        "season_name": str,
+        "episode_index": int,  # 1-based dentro da temporada
+        "prev": str | None,
+        "next": str | None,
+        "relative_path": str,
+      }
+    """
+    rel_norm = relative_path.replace("\\", "/")
+    prefix, _, filename = rel_norm.rpartition("/")
+    return episode_index.get((prefix, filename))
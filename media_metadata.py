@@ -0,0 +1,329 @@
+# media_metadata.py
+"""
+Cache persistente do ffprobe de cada vídeo da biblioteca.
+
+Fica num SQLite à parte (MEDIA_METADATA_DB), chaveado pelo caminho relativo à
+MEDIA_ROOT e validado pelo tamanho + mtime do arquivo: o ffprobe só roda para
+arquivos novos ou alterados. Guarda o JSON completo do ffprobe (streams + format),
+usado pelo convert.py, e um resumo (duração, codecs, resolução, faixas de áudio)
+que vai para o dict da biblioteca, para a API de temporadas e para o generate_thumbs.
+
+Uso (atualiza o cache de toda a biblioteca em paralelo):
+    python media_metadata.py [--workers 8]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import MEDIA_ROOT, FFPROBE_BIN, MEDIA_METADATA_DB
+
+VIDEO_EXTS = (".mp4", ".mkv", ".avi", ".mov", ".wmv", ".mpg", ".mpeg")
+
+PROBE_TIMEOUT = 60
+
+_local = threading.local()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_metadata (
+    path      TEXT PRIMARY KEY,
+    size      INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    summary   TEXT NOT NULL,
+    probe     TEXT NOT NULL,
+    probed_at REAL NOT NULL
+)
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    """Uma conexão por thread (o sqlite3 não compartilha conexões entre threads)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(MEDIA_METADATA_DB), exist_ok=True)
+        conn = sqlite3.connect(MEDIA_METADATA_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def _reset_after_fork() -> None:
+    # Conexão SQLite aberta antes do fork não pode ser usada no processo filho
+    # (workers do gunicorn criados a partir do processo que fez o warm-up)
+    global _local
+    _local = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _key(path: str) -> str:
+    """Caminho relativo à MEDIA_ROOT (com "/"), ou o absoluto para arquivos fora dela."""
+    full = os.path.abspath(path)
+    root = os.path.abspath(MEDIA_ROOT)
+    if full.startswith(root + os.sep):
+        return os.path.relpath(full, root).replace("\\", "/")
+    return full
+
+
+# ======================
+# ffprobe
+# ======================
+
+def probe(full_path: str) -> dict:
+    """Roda o ffprobe e retorna o JSON com streams + format."""
+    cmd = [
+        FFPROBE_BIN,
+        "-v", "error",
+        "-show_streams",
+        "-show_format",
+        "-of", "json",
+        full_path,
+    ]
+    out = subprocess.check_output(
+        cmd, text=True, encoding="utf-8", errors="replace", timeout=PROBE_TIMEOUT
+    )
+    return json.loads(out)
+
+
+def summarize(info: dict) -> dict:
+    """Resumo enxuto do ffprobe, no formato exposto para o app."""
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+
+    duration = (info.get("format") or {}).get("duration") or video.get("duration")
+    try:
+        duration = round(float(duration), 3)
+    except (TypeError, ValueError):
+        duration = None
+
+    audio = []
+    for s in streams:
+        if s.get("codec_type") != "audio":
+            continue
+        tags = s.get("tags") or {}
+        audio.append({
+            "codec": s.get("codec_name"),
+            "language": tags.get("language"),
+            "title": tags.get("title"),
+            "channels": s.get("channels"),
+        })
+
+    return {
+        "duration": duration,
+        "video_codec": video.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "audio": audio,
+    }
+
+
+# ======================
+# Cache
+# ======================
+
+def _store(key: str, st: os.stat_result, info: dict) -> dict:
+    summary = summarize(info)
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO media_metadata (path, size, mtime_ns, summary, probe, probed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, st.st_size, st.st_mtime_ns, json.dumps(summary, ensure_ascii=False),
+             json.dumps(info, ensure_ascii=False), time.time()),
+        )
+    return summary
+
+
+def _cached_row(key: str, st: os.stat_result | None):
+    row = _connect().execute(
+        "SELECT size, mtime_ns, summary, probe FROM media_metadata WHERE path = ?", (key,)
+    ).fetchone()
+    if row is None:
+        return None
+    if st is not None and (row[0], row[1]) != (st.st_size, st.st_mtime_ns):
+        return None
+    return row
+
+
+def get_probe(full_path: str) -> dict:
+    """
+    JSON do ffprobe para o arquivo, do cache se o arquivo não mudou;
+    senão roda o ffprobe e guarda.
+    """
+    st = os.stat(full_path)
+    key = _key(full_path)
+    row = _cached_row(key, st)
+    if row is not None:
+        return json.loads(row[3])
+
+    info = probe(full_path)
+    _store(key, st, info)
+    return info
+
+
+def get_metadata(full_path: str, probe_missing: bool = False) -> dict | None:
+    """
+    Resumo do arquivo. Com probe_missing=False nunca chama o ffprobe: devolve None
+    se o arquivo não estiver no cache ou tiver mudado desde o último probe.
+    """
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        return None
+    row = _cached_row(_key(full_path), st)
+    if row is not None:
+        return json.loads(row[2])
+    if not probe_missing:
+        return None
+    try:
+        return _store(_key(full_path), st, probe(full_path))
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def lookup_many(relative_paths) -> dict:
+    """
+    {relative_path: resumo} do que já estiver no cache, numa consulta só e sem stat
+    (pode estar desatualizado até o próximo refresh). Usado pelo app.
+    """
+    paths = list(relative_paths)
+    if not paths or not os.path.exists(MEDIA_METADATA_DB):
+        return {}
+
+    result = {}
+    conn = _connect()
+    # o SQLite limita a quantidade de parâmetros por consulta
+    for i in range(0, len(paths), 500):
+        chunk = paths[i:i + 500]
+        marks = ",".join("?" * len(chunk))
+        for path, summary in conn.execute(
+            f"SELECT path, summary FROM media_metadata WHERE path IN ({marks})", chunk
+        ):
+            result[path] = json.loads(summary)
+    return result
+
+
+def attach_to_library(library: dict) -> None:
+    """Coloca o resumo de cada episódio em ep["meta"] (None se ainda não foi analisado)."""
+    episodes = [
+        ep
+        for serie in library.values()
+        for season in serie.get("seasons", [])
+        for ep in season.get("episodes", [])
+    ]
+    if not episodes or not os.path.exists(MEDIA_METADATA_DB):
+        return
+
+    # Uma leitura da tabela inteira sai mais barata que milhares de IN (...)
+    found = {
+        path: json.loads(summary)
+        for path, summary in _connect().execute("SELECT path, summary FROM media_metadata")
+    }
+    for ep in episodes:
+        ep["meta"] = found.get(ep["relative_path"])
+
+
+# ======================
+# Atualização em lote
+# ======================
+
+def _under_root(media_root: str):
+    """
+    Função que diz se uma chave do cache fica dentro de `media_root`. Só essas
+    podem ser removidas por um refresh dessa raiz: rodar com --root numa série
+    (ou fora da MEDIA_ROOT) não mexe no resto do cache.
+    """
+    root = os.path.abspath(media_root)
+    media = os.path.abspath(MEDIA_ROOT)
+    if root == media:
+        return lambda key: not os.path.isabs(key)
+
+    scope = _key(root)
+    if not os.path.isabs(scope):
+        prefix = scope + "/"
+        return lambda key: key.startswith(prefix)
+
+    prefix = root.rstrip(os.sep) + os.sep
+    media_inside = media.startswith(prefix)
+    # raiz acima da MEDIA_ROOT: as chaves relativas também estão dentro dela
+    return lambda key: key.startswith(prefix) or (media_inside and not os.path.isabs(key))
+
+
+def refresh(media_root: str = MEDIA_ROOT, workers: int = 8) -> dict:
+    """
+    Percorre a biblioteca e roda o ffprobe, em paralelo, só nos vídeos novos ou
+    alterados. Remove do cache os arquivos que sumiram de dentro de `media_root`.
+    """
+    conn = _connect()
+    known = {
+        path: (size, mtime_ns)
+        for path, size, mtime_ns in conn.execute("SELECT path, size, mtime_ns FROM media_metadata")
+    }
+
+    pending = []
+    seen = set()
+    for root, dirs, files in os.walk(media_root):
+        for name in files:
+            if not name.lower().endswith(VIDEO_EXTS):
+                continue
+            full = os.path.join(root, name)
+            key = _key(full)
+            seen.add(key)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            if known.get(key) != (st.st_size, st.st_mtime_ns):
+                pending.append((key, full, st))
+
+    summary = {"probed": 0, "failed": 0, "removed": 0, "unchanged": len(seen) - len(pending)}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(probe, full): (key, st) for key, full, st in pending}
+        for future in as_completed(futures):
+            key, st = futures[future]
+            try:
+                _store(key, st, future.result())
+                summary["probed"] += 1
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                summary["failed"] += 1
+                print(f"[metadata] erro no ffprobe de {key}: {e}")
+
+    in_scope = _under_root(media_root)
+    gone = [key for key in known if key not in seen and in_scope(key)]
+    if gone:
+        with conn:
+            conn.executemany("DELETE FROM media_metadata WHERE path = ?", [(k,) for k in gone])
+        summary["removed"] = len(gone)
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Atualiza o cache de metadados (ffprobe) da biblioteca.")
+    parser.add_argument("--root", default=MEDIA_ROOT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    summary = refresh(args.root, max(1, args.workers))
+    print(
+        f"Metadados: {summary['probed']} analisados, {summary['unchanged']} sem mudança, "
+        f"{summary['removed']} removidos, {summary['failed']} com erro."
+    )
+
+    if summary["probed"] or summary["removed"]:
+        # Publica a biblioteca com os metadados novos para os workers do app
+        import library_store
+        library_store.refresh_metadata()
+
+
+if __name__ == "__main__":
+    main()
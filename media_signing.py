@@ -0,0 +1,75 @@
+# media_signing.py
+"""
+URLs de mídia assinadas (HMAC) com validade, para /stream e /media.
+
+    /stream/<caminho>?uid=<id do usuário>&exp=<unix>&sig=<assinatura>
+
+A assinatura cobre o tipo (stream/media), o caminho dentro da MEDIA_ROOT, o
+usuário e o instante de expiração, com uma chave derivada da SECRET_KEY. Quem
+conhece a SECRET_KEY confere a URL sem sessão e sem banco: o próprio app
+(app.py aceita a assinatura no lugar do login) e o media_gateway.py, que serve
+os arquivos fora do Flask.
+
+A expiração é arredondada para janelas de MEDIA_URL_TTL/2: durante uma janela a
+mesma mídia gera a mesma URL, então o cache do navegador continua valendo. Cada
+URL vale entre MEDIA_URL_TTL/2 e MEDIA_URL_TTL a partir de quando foi gerada.
+
+Só depende da biblioteca padrão e do config.
+"""
+import base64
+import hashlib
+import hmac
+import time
+
+from config import SECRET_KEY, MEDIA_URL_TTL
+
+# prefixo da URL -> tipo assinado
+KINDS = {"stream": "stream", "media": "media"}
+
+_KEY = hmac.new(SECRET_KEY.encode("utf-8"), b"metflix-media-url-v1", hashlib.sha256).digest()
+
+
+def normalize_path(relative_path: str) -> str:
+    return relative_path.replace("\\", "/").lstrip("/")
+
+
+def _signature(kind: str, relative_path: str, user_id: int, expires: int) -> str:
+    message = f"{kind}\n{relative_path}\n{user_id}\n{expires}".encode("utf-8")
+    digest = hmac.new(_KEY, message, hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def expires_at(now: float | None = None, ttl: int = MEDIA_URL_TTL) -> int:
+    """Fim da janela atual + meia janela (a URL fica estável durante a janela)."""
+    window = max(1, ttl // 2)
+    now = int(time.time() if now is None else now)
+    return (now // window + 2) * window
+
+
+def sign(kind: str, relative_path: str, user_id: int, expires: int | None = None) -> dict:
+    """Parâmetros de query ({"uid", "exp", "sig"}) que autorizam esta mídia."""
+    if expires is None:
+        expires = expires_at()
+    rel = normalize_path(relative_path)
+    return {"uid": user_id, "exp": expires, "sig": _signature(kind, rel, user_id, expires)}
+
+
+def verify(kind: str, relative_path: str, params, now: float | None = None) -> int | None:
+    """
+    Confere os parâmetros assinados (qualquer mapeamento com .get, como
+    request.args). Retorna o id do usuário ou None (ausente, expirada ou inválida).
+    """
+    try:
+        user_id = int(params.get("uid"))
+        expires = int(params.get("exp"))
+    except (TypeError, ValueError):
+        return None
+    sig = params.get("sig")
+    if not sig:
+        return None
+    if expires < (time.time() if now is None else now):
+        return None
+    expected = _signature(kind, normalize_path(relative_path), user_id, expires)
+    if not hmac.compare_digest(expected, str(sig)):
+        return None
+    return user_id
@@ -0,0 +1,219 @@
+# media_stream.py
+"""
+Envio de arquivos de mídia com suporte a Range (206), If-Range e respostas condicionais.
+
+As regras (ETag/304, Range/If-Range, Cache-Control) ficam em funções puras, sobre
+os valores dos cabeçalhos, usadas também pelo media_gateway/asgi_app; aqui só a
+resposta é montada no Flask.
+
+O corpo da resposta é um arquivo já posicionado no início do trecho pedido e
+entregue via wsgi.file_wrapper. Em servidores que suportam (gunicorn, por exemplo)
+isso vira os.sendfile: os bytes vão do page cache direto para o socket, sem passar
+pelo Python. Nos demais, o arquivo é lido em blocos de STREAM_BUFFER_SIZE.
+
+Com MEDIA_ACCEL configurado, o Flask só valida o acesso e devolve um cabeçalho
+X-Accel-Redirect (nginx) ou X-Sendfile (Apache/lighttpd); o proxy reverso local
+serve os bytes e cuida dos Ranges.
+"""
+import mimetypes
+import os
+import stat
+from datetime import datetime, timezone
+from typing import NamedTuple
+from urllib.parse import quote
+
+from flask import Response, abort, request
+from werkzeug.http import http_date, parse_date, parse_etags, parse_if_range_header, parse_range_header
+from werkzeug.wsgi import wrap_file
+
+from config import (
+    MEDIA_ACCEL,
+    MEDIA_ACCEL_PREFIX,
+    MEDIA_IMMUTABLE_MAX_AGE,
+    MEDIA_MAX_AGE,
+    STREAM_BUFFER_SIZE,
+)
+
+
+class FileRange:
+    """
+    Arquivo aberto e posicionado em `start` que entrega no máximo `length` bytes.
+
+    Expõe fileno() para que o servidor possa usar sendfile a partir da posição
+    atual do descritor, limitado pelo Content-Length da resposta.
+    """
+
+    def __init__(self, path: str, start: int, length: int):
+        self._file = open(path, "rb", buffering=0)
+        self._file.seek(start)
+        self.remaining = length
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# ======================
+# Regras (sem framework)
+# ======================
+
+def make_etag(st: os.stat_result) -> str:
+    """ETag forte baseado em mtime + tamanho (sem ler o conteúdo)."""
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def last_modified_of(st: os.stat_result) -> datetime:
+    return datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+
+
+def media_cache_policy(kind: str, versioned: bool) -> dict:
+    """
+    max_age/immutable de /stream e /media. Posters e thumbs: URL versionada (?v=)
+    vira cache imutável; sem versão, cache curto + 304. Vídeos sempre revalidam.
+    """
+    if kind != "media":
+        return {}
+    if versioned:
+        return {"max_age": MEDIA_IMMUTABLE_MAX_AGE, "immutable": True}
+    return {"max_age": MEDIA_MAX_AGE}
+
+
+def cache_headers(etag: str, last_modified: datetime, max_age: int | None = None,
+                  immutable: bool = False) -> list[tuple[str, str]]:
+    """ETag, Last-Modified e Cache-Control de um arquivo."""
+    # private: as mídias ficam atrás do login, então proxies compartilhados não guardam
+    if max_age is None:
+        cache_control = "no-cache"
+    elif immutable:
+        cache_control = f"private, max-age={max_age}, immutable"
+    else:
+        cache_control = f"private, max-age={max_age}"
+    return [
+        ("ETag", f'"{etag}"'),
+        ("Last-Modified", http_date(last_modified)),
+        ("Cache-Control", cache_control),
+    ]
+
+
+def not_modified(etag: str, last_modified: datetime, if_none_match: str | None,
+                 if_modified_since: str | None) -> bool:
+    """304? If-None-Match (comparação fraca) tem precedência sobre If-Modified-Since."""
+    if if_none_match is not None:
+        return parse_etags(if_none_match).contains_weak(etag)
+    since = parse_date(if_modified_since)
+    return since is not None and since >= last_modified
+
+
+def _range_allowed(etag: str, last_modified: datetime, if_range: str | None) -> bool:
+    """
+    If-Range: o Range só vale se o validador bater com a versão atual do arquivo;
+    caso contrário o cliente recebe o arquivo inteiro (200). ETag fraco nunca bate.
+    """
+    if not if_range:
+        return True
+    if if_range.strip().startswith("W/"):
+        return False
+    parsed = parse_if_range_header(if_range)
+    if parsed.etag is not None:
+        return parsed.etag == etag
+    if parsed.date is not None:
+        return parsed.date >= last_modified
+    return False
+
+
+class ByteRange(NamedTuple):
+    """Trecho a enviar: status 200 (inteiro), 206 (trecho) ou 416 (fora do arquivo)."""
+    status: int
+    start: int
+    length: int
+    content_range: str | None
+
+
+def resolve_range(size: int, etag: str, last_modified: datetime, range_header: str | None,
+                  if_range: str | None) -> ByteRange:
+    byte_range = parse_range_header(range_header)
+    if byte_range is None or not _range_allowed(etag, last_modified, if_range):
+        return ByteRange(200, 0, size, None)
+    bounds = byte_range.range_for_length(size)
+    if bounds is None:
+        # range_for_length só resolve um trecho: pedidos com vários trechos
+        # recebem o arquivo inteiro (200); um trecho único fora do arquivo é 416.
+        if len(byte_range.ranges) == 1:
+            return ByteRange(416, 0, 0, f"bytes */{size}")
+        return ByteRange(200, 0, size, None)
+    start, stop = bounds
+    return ByteRange(206, start, stop - start, f"bytes {start}-{stop - 1}/{size}")
+
+
+# ======================
+# Resposta do Flask
+# ======================
+
+def _accel_response(full_path: str, relative_path: str, mimetype: str) -> Response:
+    response = Response(mimetype=mimetype)
+    if MEDIA_ACCEL == "nginx":
+        response.headers["X-Accel-Redirect"] = MEDIA_ACCEL_PREFIX + quote(relative_path)
+    else:
+        response.headers["X-Sendfile"] = full_path
+    return response
+
+
+def send_file_range(full_path: str, relative_path: str | None, max_age: int | None = None,
+                    immutable: bool = False) -> Response:
+    """
+    Responde com o arquivo (ou o trecho pedido em Range) de `full_path`.
+    `relative_path` é o caminho dentro de MEDIA_ROOT, usado no modo X-Accel-Redirect;
+    arquivos fora de MEDIA_ROOT (relative_path=None) são sempre enviados pelo app.
+
+    Sem `max_age` o cliente sempre revalida (ETag/Last-Modified -> 304). Com
+    `immutable`, a URL é tratada como versionada e pode ficar em cache até `max_age`.
+    """
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        abort(404)
+    if not stat.S_ISREG(st.st_mode):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    etag = make_etag(st)
+    last_modified = last_modified_of(st)
+
+    if MEDIA_ACCEL and relative_path is not None:
+        # o proxy mantém o Cache-Control do app ao seguir o X-Accel-Redirect
+        response = _accel_response(full_path, relative_path, mimetype)
+        response.headers.extend(cache_headers(etag, last_modified, max_age, immutable))
+        return response
+
+    response = Response(mimetype=mimetype, direct_passthrough=True)
+    response.headers["Accept-Ranges"] = "bytes"
+    response.headers.extend(cache_headers(etag, last_modified, max_age, immutable))
+
+    headers = request.headers
+    if not_modified(etag, last_modified, headers.get("If-None-Match"), headers.get("If-Modified-Since")):
+        response.status_code = 304
+        return response
+
+    byte_range = resolve_range(st.st_size, etag, last_modified, headers.get("Range"), headers.get("If-Range"))
+    response.status_code = byte_range.status
+    if byte_range.content_range:
+        response.headers["Content-Range"] = byte_range.content_range
+    if byte_range.status == 416:
+        return response
+
+    response.content_length = byte_range.length
+    response.response = wrap_file(
+        request.environ, FileRange(full_path, byte_range.start, byte_range.length), STREAM_BUFFER_SIZE
+    )
+    return response
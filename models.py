@@ -1,10 +1,24 @@
 # models.py
+import json
+import os
+import sqlite3
+import time
 from datetime import datetime
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from config import (
+    APP_DB_PATH,
+    DESCRIPTIONS_LEGACY_FILE,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_MMAP_SIZE,
+    SQLITE_CACHE_SIZE_KB,
+)
+
 db = SQLAlchemy()
 
 
@@ -30,25 +44,187 @@ class User(UserMixin, db.Model):
         """
         Retorna a URL do avatar ou um placeholder.
         """
-        from flask import url_for
+        return avatar_url_for(self.avatar_filename)
+
 
-        if self.avatar_filename:
-            return url_for("static", filename=f"avatars/{self.avatar_filename}")
-        return url_for("static", filename="avatars/default.png")
+def avatar_url_for(avatar_filename: str | None) -> str:
+    """URL do avatar (em static/avatars) ou do placeholder."""
+    from flask import url_for
+
+    if avatar_filename:
+        return url_for("static", filename=f"avatars/{avatar_filename}")
+    return url_for("static", filename="avatars/default.png")
 
 
 class WatchProgress(db.Model):
     __tablename__ = "watch_progress"
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     relative_path = db.Column(db.String(500), nullable=False)
     serie_name = db.Column(db.String(255), nullable=False)
     episode_name = db.Column(db.String(255), nullable=False)
     last_watched = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    # NOVO: onde o usuário parou (segundos) e a duração do vídeo, vindos do heartbeat do player
+    position_seconds = db.Column(db.Float, nullable=True)
+    duration_seconds = db.Column(db.Float, nullable=True)
 
     user = db.relationship("User", backref=db.backref("watch_progress", lazy="dynamic"))
 
     __table_args__ = (
         db.UniqueConstraint("user_id", "relative_path", name="uq_progress_user_path"),
+        # "Continuar assistindo": progresso do usuário do mais recente para o mais antigo
+        db.Index("ix_progress_user_last_watched", "user_id", "last_watched"),
     )
+
+
+class EpisodeDescription(db.Model):
+    """Descrição gerada pela IA (ia_episodios.py), uma linha por episódio."""
+    __tablename__ = "episode_descriptions"
+
+    serie = db.Column(db.Text, primary_key=True)
+    temporada = db.Column(db.Text, primary_key=True)
+    numero = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    descricao = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+
+    __table_args__ = {"sqlite_with_rowid": False}
+
+
+class EpisodeDescriptionImport(db.Model):
+    """Arquivos JSON antigos de descrições já importados."""
+    __tablename__ = "episode_descriptions_imports"
+
+    source = db.Column(db.Text, primary_key=True)
+    imported_at = db.Column(db.Float, nullable=False)
+
+
+class EpisodeDescriptionJob(db.Model):
+    """
+    Episódio na fila de algum worker (ia_episodios.py). A marca vale até
+    `deadline`: se o processo morrer no meio, ela expira sozinha.
+    """
+    __tablename__ = "episode_description_jobs"
+
+    serie = db.Column(db.Text, primary_key=True)
+    temporada = db.Column(db.Text, primary_key=True)
+    numero = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    deadline = db.Column(db.Float, nullable=False)
+
+    __table_args__ = {"sqlite_with_rowid": False}
+
+
+# Colunas adicionadas depois que o banco já existia: {tabela: {coluna: tipo SQL}}
+_ADDED_COLUMNS = {
+    "watch_progress": {
+        "position_seconds": "FLOAT",
+        "duration_seconds": "FLOAT",
+    },
+}
+
+# Índices que saíram do modelo (cobertos por ix_progress_user_last_watched)
+_DROPPED_INDEXES = ["ix_watch_progress_user_id"]
+
+
+def ensure_schema() -> None:
+    """
+    Cria as tabelas que faltam e adiciona as colunas e índices novos em bancos
+    antigos (o create_all não altera tabelas existentes). Pode ser chamado sempre.
+    """
+    db.create_all()
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = {col["name"] for col in inspector.get_columns(table)}
+            for name, sql_type in columns.items():
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}"))
+        for model in (User, WatchProgress):
+            for index in model.__table__.indexes:
+                index.create(conn, checkfirst=True)
+        for name in _DROPPED_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        _import_legacy_descriptions(conn)
+        # estatísticas para o planejador escolher os índices certos
+        conn.execute(text("PRAGMA optimize"))
+
+
+def _import_legacy_descriptions(conn) -> None:
+    """Importa o data/descriptions.json antigo para episode_descriptions (uma vez só)."""
+    if not os.path.exists(DESCRIPTIONS_LEGACY_FILE):
+        return
+    source = os.path.abspath(DESCRIPTIONS_LEGACY_FILE)
+    done = conn.execute(
+        text("SELECT 1 FROM episode_descriptions_imports WHERE source = :source"), {"source": source}
+    ).first()
+    if done:
+        return
+    try:
+        with open(DESCRIPTIONS_LEGACY_FILE, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[schema] erro ao importar {DESCRIPTIONS_LEGACY_FILE}: {e}")
+        cache = {}
+    now = time.time()
+    rows = [
+        {"serie": serie, "temporada": temporada, "numero": int(numero), "descricao": desc, "created_at": now}
+        for serie, temporadas in cache.items()
+        for temporada, episodios in temporadas.items()
+        for numero, desc in episodios.items()
+        if str(numero).isdigit()
+    ]
+    # OR IGNORE: o que já foi gerado no banco vale mais que o JSON antigo
+    if rows:
+        conn.execute(
+            text("INSERT OR IGNORE INTO episode_descriptions "
+                 "VALUES (:serie, :temporada, :numero, :descricao, :created_at)"),
+            rows,
+        )
+    conn.execute(
+        text("INSERT OR IGNORE INTO episode_descriptions_imports VALUES (:source, :now)"),
+        {"source": source, "now": now},
+    )
+    print(f"[schema] {len(rows)} descrições importadas de {DESCRIPTIONS_LEGACY_FILE}.")
+
+
+# ======================
+# Conexões SQLite
+# ======================
+
+def _sqlite_pragmas(dbapi_conn, connection_record) -> None:
+    """
+    Roda em cada conexão nova do pool. WAL deixa leitores e o escritor trabalharem
+    ao mesmo tempo; busy_timeout faz a conexão esperar o lock em vez de falhar com
+    "database is locked"; synchronous=NORMAL só sincroniza no checkpoint (com WAL
+    não corrompe o banco, no máximo perde as últimas transações numa queda de energia).
+    """
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def sqlite_connect(path: str = APP_DB_PATH) -> sqlite3.Connection:
+    """
+    Conexão sqlite3 avulsa ao app.db, com os mesmos PRAGMAs do pool do
+    SQLAlchemy. Para threads sem app context (fila do ia_episodios).
+    """
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    _sqlite_pragmas(conn, None)
+    return conn
+
+
+def init_db(app) -> None:
+    """
+    db.init_app + os PRAGMAs do SQLite em cada conexão. As opções do pool vêm de
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]; cada processo (worker) tem o seu pool.
+    """
+    db.init_app(app)
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", _sqlite_pragmas)
@@ -0,0 +1,298 @@
+"""
+Empacota os vídeos da biblioteca em HLS com várias qualidades (bitrate adaptativo).
+
+Uso:
+    python package_hls.py ["media/Fullmetal Alchemist Brotherhood/temporada 1" ...] [--workers 1] [--force]
+
+Para cada vídeo gera, em HLS_ROOT/<caminho do vídeo sem extensão>/:
+
+    master.m3u8            playlist mestre (uma entrada por qualidade)
+    1080p/index.m3u8       playlist de mídia de cada qualidade
+    1080p/init_<v>.mp4     segmento de inicialização (fMP4)
+    1080p/seg_<v>_00001.m4s ...
+
+Só entram as qualidades até a altura do vídeo original (medida pelo cache do
+ffprobe em media_metadata). Os keyframes são forçados a cada HLS_SEGMENT_SECONDS,
+então todas as qualidades cortam os segmentos nos mesmos pontos e o player pode
+trocar de qualidade entre um segmento e outro.
+
+<v> é uma versão do arquivo de origem (tamanho + mtime): segmentos de um vídeo
+reempacotado ganham nomes novos, por isso podem ficar em cache imutável no
+navegador. Tudo é escrito numa pasta .part e trocado no final, então o app nunca
+vê um pacote pela metade.
+"""
+import argparse
+import json
+import mimetypes
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import MEDIA_ROOT, FFMPEG_BIN, HLS_ROOT, HLS_SEGMENT_SECONDS
+from convert import pick_portuguese_audio_index, has_any_audio
+from media_metadata import get_probe, summarize
+
+VIDEO_EXTS = (".mp4", ".mkv", ".avi", ".mov", ".wmv", ".mpg", ".mpeg")
+
+MASTER_PLAYLIST = "master.m3u8"
+SOURCE_FILE = "source.json"
+
+# (nome, altura, bitrate do vídeo, bitrate do áudio) — da maior para a menor
+RENDITIONS = [
+    ("1080p", 1080, "5000k", "160k"),
+    ("720p", 720, "2800k", "128k"),
+    ("480p", 480, "1400k", "128k"),
+    ("360p", 360, "800k", "96k"),
+]
+
+DEFAULT_WORKERS = 1  # o x264 já usa todos os núcleos em cada vídeo
+
+# Tipos que o mimetypes do Python não conhece (usados ao servir /hls)
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/iso.segment", ".m4s")
+mimetypes.add_type("video/mp2t", ".ts")
+
+
+# ======================
+# Caminhos
+# ======================
+
+def package_dir_for(relative_path: str) -> str:
+    """Pasta (relativa a HLS_ROOT) do pacote de um vídeo: o caminho sem a extensão."""
+    return os.path.splitext(relative_path.replace("\\", "/"))[0]
+
+
+def master_playlist_for(relative_path: str) -> str | None:
+    """
+    Caminho (relativo a HLS_ROOT) da playlist mestre do vídeo, ou None se ele
+    ainda não foi empacotado. Usado pelo app para escolher HLS ou MP4.
+    """
+    rel = f"{package_dir_for(relative_path)}/{MASTER_PLAYLIST}"
+    if os.path.isfile(os.path.join(HLS_ROOT, rel)):
+        return rel
+    return None
+
+
+def _source_signature(input_path: str) -> dict:
+    st = os.stat(input_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _version(signature: dict) -> str:
+    return f"{signature['mtime_ns']:x}{signature['size']:x}"[-12:]
+
+
+def is_up_to_date(input_path: str, out_dir: str) -> bool:
+    """O pacote existe e foi gerado a partir desta versão do arquivo."""
+    try:
+        with open(os.path.join(out_dir, SOURCE_FILE), "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (
+        os.path.isfile(os.path.join(out_dir, MASTER_PLAYLIST))
+        and stored.get("source") == _source_signature(input_path)
+    )
+
+
+# ======================
+# Comando do ffmpeg
+# ======================
+
+def pick_renditions(info: dict) -> list:
+    """Qualidades até a altura do original (a menor sempre entra)."""
+    height = summarize(info).get("height") or 0
+    chosen = [r for r in RENDITIONS if r[1] <= height]
+    return chosen or [RENDITIONS[-1]]
+
+
+def build_command(input_path: str, out_dir: str, info: dict, renditions: list, version: str) -> list:
+    """
+    Um único ffmpeg decodifica o vídeo uma vez, escala para cada qualidade
+    (filtro split) e escreve todas as variantes + a playlist mestre.
+    """
+    n = len(renditions)
+    splits = "".join(f"[s{i}]" for i in range(n))
+    scales = ";".join(f"[s{i}]scale=-2:{h}[v{i}]" for i, (_, h, _, _) in enumerate(renditions))
+    filter_complex = f"[0:v:0]split={n}{splits};{scales}"
+
+    with_audio = has_any_audio(info)
+    audio_idx = pick_portuguese_audio_index(info)
+    if audio_idx is None:
+        audio_idx = 0
+
+    cmd = [
+        FFMPEG_BIN,
+        "-y",
+        "-nostdin",
+        "-loglevel", "error",
+        "-i", input_path,
+        "-filter_complex", filter_complex,
+    ]
+    for i in range(n):
+        cmd += ["-map", f"[v{i}]"]
+    if with_audio:
+        for i in range(n):
+            cmd += ["-map", f"0:a:{audio_idx}"]
+
+    cmd += [
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-profile:v", "main",
+        "-pix_fmt", "yuv420p",
+        # keyframe no início de cada segmento, igual em todas as qualidades
+        "-sc_threshold", "0",
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+    ]
+    for i, (_, _, v_rate, a_rate) in enumerate(renditions):
+        cmd += [f"-b:v:{i}", v_rate, f"-maxrate:v:{i}", v_rate, f"-bufsize:v:{i}", v_rate]
+        if with_audio:
+            cmd += [f"-b:a:{i}", a_rate]
+    if with_audio:
+        cmd += ["-c:a", "aac", "-ac", "2"]
+
+    if with_audio:
+        stream_map = " ".join(f"v:{i},a:{i},name:{r[0]}" for i, r in enumerate(renditions))
+    else:
+        stream_map = " ".join(f"v:{i},name:{r[0]}" for i, r in enumerate(renditions))
+
+    cmd += [
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_type", "fmp4",
+        "-hls_fmp4_init_filename", f"init_{version}.mp4",
+        "-hls_segment_filename", os.path.join(out_dir, "%v", f"seg_{version}_%05d.m4s"),
+        "-master_pl_name", MASTER_PLAYLIST,
+        "-var_stream_map", stream_map,
+        os.path.join(out_dir, "%v", "index.m3u8"),
+    ]
+    return cmd
+
+
+# ======================
+# Empacotamento
+# ======================
+
+def package_file(input_path: str, relative_path: str, force: bool = False) -> str:
+    """
+    Empacota um vídeo. Retorna "skipped" (pacote já atualizado) ou "packaged".
+    """
+    out_dir = os.path.join(HLS_ROOT, package_dir_for(relative_path))
+    if not force and is_up_to_date(input_path, out_dir):
+        return "skipped"
+
+    signature = _source_signature(input_path)
+    info = get_probe(input_path)
+    renditions = pick_renditions(info)
+
+    tmp_dir = out_dir + ".part"
+    old_dir = out_dir + ".old"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    try:
+        for name, _, _, _ in renditions:
+            os.makedirs(os.path.join(tmp_dir, name))
+        subprocess.run(
+            build_command(input_path, tmp_dir, info, renditions, _version(signature)),
+            check=True,
+            capture_output=True,
+        )
+        if not os.path.isfile(os.path.join(tmp_dir, MASTER_PLAYLIST)):
+            raise RuntimeError("ffmpeg não gerou a playlist mestre")
+
+        with open(os.path.join(tmp_dir, SOURCE_FILE), "w", encoding="utf-8") as f:
+            json.dump({"source": signature, "renditions": [r[0] for r in renditions]}, f)
+
+        # Troca o pacote antigo pelo novo
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.isdir(out_dir):
+            os.replace(out_dir, old_dir)
+        os.replace(tmp_dir, out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return "packaged"
+
+
+def find_inputs(paths: list, media_root: str = MEDIA_ROOT) -> list:
+    """
+    [(caminho completo, relative_path)] dos vídeos a empacotar. Quando o mesmo
+    episódio existe em mais de um formato (o .mkv original e o .mp4 do convert.py),
+    só o .mp4 entra, já que os dois iriam para a mesma pasta.
+    """
+    by_stem = {}
+    for path in paths:
+        if os.path.isfile(path):
+            candidates = [path]
+        else:
+            candidates = [
+                os.path.join(root, name)
+                for root, dirs, files in os.walk(path)
+                for name in files
+            ]
+        for full in candidates:
+            if not full.lower().endswith(VIDEO_EXTS):
+                continue
+            rel = os.path.relpath(full, media_root).replace("\\", "/")
+            if rel.startswith("../"):
+                continue
+            stem = package_dir_for(rel)
+            current = by_stem.get(stem)
+            if current is None or full.lower().endswith(".mp4"):
+                by_stem[stem] = (full, rel)
+    return [by_stem[stem] for stem in sorted(by_stem)]
+
+
+def package_tree(paths: list, workers: int = DEFAULT_WORKERS, force: bool = False) -> dict:
+    """Empacota tudo o que houver em `paths`. Retorna a contagem por resultado."""
+    inputs = find_inputs(paths)
+    summary = {"packaged": 0, "skipped": 0, "failed": 0}
+    total = len(inputs)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(package_file, full, rel, force): rel for full, rel in inputs}
+
+        for n, future in enumerate(as_completed(futures), start=1):
+            rel = futures[future]
+            try:
+                status = future.result()
+            except subprocess.CalledProcessError as e:
+                summary["failed"] += 1
+                error = (e.stderr or b"").decode("utf-8", errors="replace").strip()[-300:]
+                print(f"❌ [{n}/{total}] {rel}: {error or e}")
+                continue
+            except (OSError, ValueError, RuntimeError, subprocess.SubprocessError) as e:
+                # SubprocessError: TimeoutExpired do ffprobe/ffmpeg, por exemplo
+                summary["failed"] += 1
+                print(f"❌ [{n}/{total}] {rel}: {e}")
+                continue
+
+            summary[status] += 1
+            if status == "packaged":
+                print(f"✅ [{n}/{total}] {rel}")
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Empacota os vídeos da biblioteca em HLS (várias qualidades).")
+    parser.add_argument("paths", nargs="*", default=[MEDIA_ROOT],
+                        help="pastas ou arquivos dentro da MEDIA_ROOT (padrão: toda a MEDIA_ROOT)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="quantos vídeos são empacotados ao mesmo tempo")
+    parser.add_argument("--force", action="store_true", help="reempacota mesmo se o pacote estiver atualizado")
+    args = parser.parse_args()
+
+    summary = package_tree(args.paths, max(1, args.workers), args.force)
+    print(
+        f"\n✅ Empacotamento finalizado! {summary['packaged']} empacotados, "
+        f"{summary['skipped']} já atualizados, {summary['failed']} com erro."
+    )
+    raise SystemExit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
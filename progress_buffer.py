@@ -0,0 +1,267 @@
+# progress_buffer.py
+"""
+Gravação do progresso ("continuar assistindo") em lote.
+
+Abrir um episódio só grava o progresso num dict em memória; uma thread do
+processo descarrega o buffer a cada PROGRESS_FLUSH_INTERVAL segundos (ou antes,
+quando passa de PROGRESS_FLUSH_MAX_PENDING entradas) numa única transação:
+
+    INSERT INTO watch_progress (...) VALUES (...), (...)
+    ON CONFLICT (user_id, relative_path) DO UPDATE SET ...
+
+Assim as requisições não disputam o lock de escrita do SQLite, e várias aberturas
+do mesmo episódio viram uma linha só. O heartbeat do player (posição e duração,
+a cada poucos segundos por espectador) também só atualiza o buffer, então
+milhares de heartbeats por segundo custam alguns UPSERTs por intervalo.
+
+As leituras (pending_for_user, get) juntam o buffer com o banco, então o usuário
+vê o próprio progresso na hora. O buffer é de cada processo; o que sobrar é
+gravado no encerramento (atexit).
+"""
+import atexit
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.sqlite import insert
+
+from config import PROGRESS_FLUSH_INTERVAL, PROGRESS_FLUSH_MAX_PENDING, PROGRESS_FLUSH_MAX_ATTEMPTS
+from models import db, WatchProgress
+
+# linhas por INSERT (7 parâmetros cada; o SQLite limita parâmetros por comando)
+_CHUNK = 120
+
+
+def _merge(older: dict, newer: dict) -> dict:
+    """
+    Junta duas versões da mesma linha como o UPSERT faria: nomes e last_watched
+    da mais recente, posição/duração nulas na nova mantêm as da antiga (COALESCE).
+    """
+    if older["last_watched"] > newer["last_watched"]:
+        older, newer = newer, older
+    row = dict(newer)
+    for column in ("position_seconds", "duration_seconds"):
+        if row[column] is None:
+            row[column] = older[column]
+    return row
+
+
+class ProgressBuffer:
+    def __init__(self, interval: float = PROGRESS_FLUSH_INTERVAL,
+                 max_pending: int = PROGRESS_FLUSH_MAX_PENDING,
+                 max_attempts: int = PROGRESS_FLUSH_MAX_ATTEMPTS):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.app = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: dict[tuple[int, str], dict] = {}
+        self._flushing: dict[tuple[int, str], dict] = {}  # sendo gravado agora
+        self._attempts: dict[tuple[int, str], int] = {}  # recusas de cada linha pelo banco
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._after_flush: list = []
+
+    def _after_fork(self) -> None:
+        # No filho a thread de gravação não existe e um lock preso por ela no
+        # fork nunca seria liberado. O que estava no buffer é do pai, que grava
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._flushing = {}
+        self._attempts = {}
+        self._wake = threading.Event()
+        self._thread = None
+
+    def init_app(self, app) -> None:
+        self.app = app
+        atexit.register(self.flush)
+
+    def after_flush(self, callback):
+        """
+        Registra callback(user_ids) chamado depois de cada gravação bem-sucedida,
+        com os usuários gravados (ex.: apagar fragmentos em cache que outro
+        worker montou antes de o progresso chegar ao banco). Serve de decorator.
+        """
+        self._after_flush.append(callback)
+        return callback
+
+    # ======================
+    # Escrita
+    # ======================
+
+    def record(self, user_id: int, relative_path: str, serie_name: str, episode_name: str,
+               position: float | None = None, duration: float | None = None,
+               when: datetime | None = None) -> None:
+        """
+        Registra que o usuário está no episódio. Sem `position` (abrir a página),
+        a posição salva antes é mantida; com ela (heartbeat), é atualizada.
+        """
+        key = (user_id, relative_path)
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = {
+                    "user_id": user_id,
+                    "relative_path": relative_path,
+                    "position_seconds": None,
+                    "duration_seconds": None,
+                }
+                self._pending[key] = row
+            row["serie_name"] = serie_name
+            row["episode_name"] = episode_name
+            row["last_watched"] = when or datetime.utcnow()
+            if position is not None:
+                row["position_seconds"] = position
+            if duration is not None:
+                row["duration_seconds"] = duration
+            full = len(self._pending) >= self.max_pending
+            self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def _ensure_thread(self) -> None:
+        # chamado com _lock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="progress-flush", daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[progress] erro ao gravar o progresso: {e}")
+
+    def flush(self) -> int:
+        """
+        Grava tudo o que está no buffer numa transação. Retorna quantas linhas.
+
+        Se o banco recusar o lote por causa de alguma linha (e não por estar
+        travado ou indisponível), grava linha a linha: as boas entram e a
+        recusada volta ao buffer, até ser descartada depois de
+        PROGRESS_FLUSH_MAX_ATTEMPTS recusas. Sem isso uma linha ruim faria
+        todas as gravações seguintes falharem e o buffer cresceria sem fim.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._flushing = self._pending
+                self._pending = {}
+                rows = list(self._flushing.values())
+
+            written = rows
+            try:
+                try:
+                    self._write(rows)
+                except OperationalError:
+                    raise  # banco travado/indisponível: o lote inteiro tenta de novo depois
+                except Exception as e:
+                    print(f"[progress] lote recusado ({e}); gravando linha a linha")
+                    written = self._write_each(rows)
+                else:
+                    with self._lock:
+                        self._flushing = {}
+                    if self._attempts:
+                        for row in rows:
+                            self._attempts.pop((row["user_id"], row["relative_path"]), None)
+            finally:
+                # Devolve ao buffer o que não foi gravado, campo a campo: um
+                # heartbeat mais novo sem posição não apaga a posição deste lote
+                with self._lock:
+                    for key, row in self._flushing.items():
+                        newer = self._pending.get(key)
+                        self._pending[key] = row if newer is None else _merge(row, newer)
+                    self._flushing = {}
+        if written:
+            self._notify({row["user_id"] for row in written})
+        return len(written)
+
+    def _write(self, rows: list[dict]) -> None:
+        table = WatchProgress.__table__
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                for i in range(0, len(rows), _CHUNK):
+                    stmt = insert(table).values(rows[i:i + _CHUNK])
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=["user_id", "relative_path"],
+                        set_={
+                            "serie_name": stmt.excluded.serie_name,
+                            "episode_name": stmt.excluded.episode_name,
+                            "last_watched": stmt.excluded.last_watched,
+                            # posição nula = só abriu a página: mantém a gravada
+                            "position_seconds": func.coalesce(
+                                stmt.excluded.position_seconds, table.c.position_seconds
+                            ),
+                            "duration_seconds": func.coalesce(
+                                stmt.excluded.duration_seconds, table.c.duration_seconds
+                            ),
+                        },
+                    )
+                    conn.execute(stmt)
+
+    def _write_each(self, rows: list[dict]) -> list[dict]:
+        """
+        Uma transação por linha (chamado com _flush_lock). Tira de _flushing o
+        que foi gravado ou descartado; as recusadas ficam lá e voltam ao buffer.
+        """
+        written = []
+        for row in rows:
+            key = (row["user_id"], row["relative_path"])
+            try:
+                self._write([row])
+            except OperationalError:
+                raise
+            except Exception as e:
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts < self.max_attempts:
+                    self._attempts[key] = attempts
+                    continue
+                self._attempts.pop(key, None)
+                print(f"[progress] descartando {key} depois de {attempts} recusas: {e}")
+            else:
+                self._attempts.pop(key, None)
+                written.append(row)
+            with self._lock:
+                del self._flushing[key]
+        return written
+
+    def _notify(self, user_ids: set) -> None:
+        for callback in self._after_flush:
+            try:
+                callback(user_ids)
+            except Exception as e:  # o progresso já está no banco
+                print(f"[progress] erro depois da gravação: {e}")
+
+    # ======================
+    # Leitura
+    # ======================
+
+    def pending_for_user(self, user_id: int) -> list[dict]:
+        """Progresso deste usuário que ainda não foi gravado no banco."""
+        with self._lock:
+            merged = {key: row for key, row in self._flushing.items() if key[0] == user_id}
+            merged.update((key, row) for key, row in self._pending.items() if key[0] == user_id)
+        return [dict(row) for row in merged.values()]
+
+    def get(self, user_id: int, relative_path: str) -> dict | None:
+        """Linha ainda não gravada deste episódio (buffer ou gravação em andamento)."""
+        key = (user_id, relative_path)
+        with self._lock:
+            row = dict(self._flushing.get(key) or {})
+            pending = self._pending.get(key)
+            if pending:
+                row.update((k, v) for k, v in pending.items() if v is not None)
+        return row or None
+
+
+progress_buffer = ProgressBuffer()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=progress_buffer._after_fork)
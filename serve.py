@@ -0,0 +1,225 @@
+# serve.py
+"""
+Servidor de produção (o app.run(debug=True) do app.py é só para desenvolvimento).
+
+Uso:
+    python serve.py [--bind 0.0.0.0:8000] [--workers 4] [--threads 8] [--timeout 120] [--asgi]
+
+1. Warm-up no processo principal, uma vez só:
+   - migra o banco (ensure_schema: tabelas, colunas e índices novos). Os workers
+     não migram ao importar o app (SCHEMA_AUTO_MIGRATE=0), então nenhum DDL
+     roda em paralelo, mesmo que o app seja carregado depois do fork;
+   - importa o app;
+   - carrega a biblioteca (snapshot validado ou varredura) com os metadados do ffprobe;
+   - compila os templates;
+   - gc.freeze(): os objetos do warm-up saem do coletor de lixo, então os workers
+     não reescrevem essas páginas de memória e a biblioteca fica compartilhada
+     entre todos (copy-on-write).
+2. Só então o gunicorn abre a porta e cria os workers (fork), que já nascem com
+   tudo carregado. Cada worker descarta as conexões herdadas do processo
+   principal, abre as suas e só depois disso passa a aceitar conexões.
+3. Com LIBRARY_WATCHER=1, o observador da biblioteca roda num processo próprio
+   (library_watcher.spawn_library_watcher), nunca no processo principal nem nos
+   workers.
+
+Os tempos do warm-up, de quando a porta abre e de cada worker pronto vão para o
+log. Com --asgi os workers rodam o asgi_app (worker do uvicorn). Sem o gunicorn
+(no Windows, por exemplo) o warm-up é o mesmo e o app roda num processo só, no
+servidor do Werkzeug com threads (ou no uvicorn, com --asgi).
+
+As opções padrão vêm de config.py (WEB_*).
+"""
+import argparse
+import gc
+import os
+import time
+
+# O launcher migra o esquema antes do fork; o import do app (aqui e nos
+# workers, que herdam o ambiente) não roda o ensure_schema
+os.environ["SCHEMA_AUTO_MIGRATE"] = "0"
+# Nem inicia o observador da biblioteca: uma thread dele no processo principal
+# seria copiada para os workers no meio de uma revarredura. O launcher sobe um
+# observador só, num processo à parte (ou numa thread, sem o gunicorn)
+_LIBRARY_WATCHER = os.environ.get("LIBRARY_WATCHER", "0") == "1"
+os.environ["LIBRARY_WATCHER"] = "0"
+
+from config import (  # noqa: E402
+    WEB_BIND,
+    WEB_WORKERS,
+    WEB_THREADS,
+    WEB_TIMEOUT,
+    WEB_GRACEFUL_TIMEOUT,
+    WEB_KEEPALIVE,
+    WEB_MAX_REQUESTS,
+)
+
+try:
+    from gunicorn.app.base import BaseApplication  # noqa: E402
+except ImportError:  # gunicorn é opcional (não roda no Windows)
+    BaseApplication = None
+
+_STARTED = time.perf_counter()
+
+
+def _log(message: str) -> None:
+    print(f"[serve] {message}", flush=True)
+
+
+# ======================
+# Warm-up (processo principal)
+# ======================
+
+def warm_up(asgi: bool = False):
+    """Carrega o que os workers vão herdar. Retorna o app a servir (WSGI ou ASGI)."""
+    t0 = time.perf_counter()
+    import app as web
+    from models import ensure_schema
+
+    with web.app.app_context():
+        ensure_schema()
+    t_app = time.perf_counter()
+    from library_store import get_library_state
+
+    state = get_library_state()
+    t_library = time.perf_counter()
+
+    jinja = web.app.jinja_env
+    templates = jinja.list_templates(extensions=["html"])
+    for name in templates:
+        jinja.get_template(name)
+
+    application = web.app
+    if asgi:
+        import asgi_app
+
+        application = asgi_app.app
+
+    gc.collect()
+    gc.freeze()
+
+    _log(
+        f"warm-up em {time.perf_counter() - t0:.2f}s "
+        f"(app + esquema {t_app - t0:.2f}s, biblioteca {t_library - t_app:.2f}s: "
+        f"{len(state.library)} séries, {len(state.episodes)} episódios; {len(templates)} templates)"
+    )
+    return application
+
+
+# ======================
+# Ganchos dos workers (gunicorn)
+# ======================
+
+def _when_ready(server) -> None:
+    _log(f"ouvindo em {', '.join(str(s) for s in server.LISTENERS)} "
+         f"({time.perf_counter() - _STARTED:.2f}s desde o início)")
+
+
+def _post_fork(server, worker) -> None:
+    # O pool do SQLAlchemy veio do processo principal: as conexões herdadas são
+    # descartadas sem fechar (fechar afetaria o pai); o worker abre as suas
+    from app import app as flask_app
+    from models import db
+
+    with flask_app.app_context():
+        db.engine.dispose(close=False)
+
+
+def _post_worker_init(worker) -> None:
+    """Roda no worker antes de ele aceitar conexões."""
+    t0 = time.perf_counter()
+    from app import app as flask_app
+    from library_store import get_library_state
+    from models import db
+
+    with flask_app.app_context():
+        with db.engine.connect():
+            pass  # primeira conexão do pool (PRAGMAs aplicados)
+    get_library_state()  # confere se outra geração foi publicada durante o warm-up
+    _log(f"worker {os.getpid()} pronto em {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+
+def _worker_class(asgi: bool, threads: int) -> str:
+    if asgi:
+        try:
+            import uvicorn_worker  # noqa: F401
+
+            return "uvicorn_worker.UvicornWorker"
+        except ImportError:
+            return "uvicorn.workers.UvicornWorker"
+    return "gthread" if threads > 1 else "sync"
+
+
+def run_gunicorn(application, options: dict) -> None:
+    class _Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return application
+
+    _Server().run()
+
+
+def run_single_process(application, bind: str, asgi: bool) -> None:
+    host, _, port = bind.rpartition(":")
+    _log(f"gunicorn não instalado: um processo só, ouvindo em {bind}")
+    if asgi:
+        try:
+            import uvicorn
+        except ImportError:
+            raise SystemExit("O modo --asgi precisa do gunicorn + uvicorn ou só do uvicorn: pip install uvicorn")
+        uvicorn.run(application, host=host or "0.0.0.0", port=int(port))
+        return
+
+    from werkzeug.serving import run_simple
+
+    run_simple(host or "0.0.0.0", int(port), application, threaded=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metflix em produção (gunicorn com warm-up antes do fork).")
+    parser.add_argument("--bind", default=WEB_BIND)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS)
+    parser.add_argument("--threads", type=int, default=WEB_THREADS, help="threads por worker")
+    parser.add_argument("--timeout", type=int, default=WEB_TIMEOUT)
+    parser.add_argument("--graceful-timeout", type=int, default=WEB_GRACEFUL_TIMEOUT)
+    parser.add_argument("--keepalive", type=int, default=WEB_KEEPALIVE)
+    parser.add_argument("--max-requests", type=int, default=WEB_MAX_REQUESTS)
+    parser.add_argument("--asgi", action="store_true", help="workers ASGI (asgi_app, via uvicorn)")
+    args = parser.parse_args()
+
+    application = warm_up(args.asgi)
+
+    if BaseApplication is None:
+        if _LIBRARY_WATCHER:
+            from library_watcher import start_library_watcher
+
+            start_library_watcher()
+        run_single_process(application, args.bind, args.asgi)
+        return
+
+    if _LIBRARY_WATCHER:
+        from library_watcher import spawn_library_watcher
+
+        _log(f"observador da biblioteca no processo {spawn_library_watcher().pid}")
+
+    run_gunicorn(application, {
+        "bind": args.bind,
+        "workers": max(1, args.workers),
+        "threads": max(1, args.threads),
+        "worker_class": _worker_class(args.asgi, args.threads),
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "keepalive": args.keepalive,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        "preload_app": True,
+        "when_ready": _when_ready,
+        "post_fork": _post_fork,
+        "post_worker_init": _post_worker_init,
+    })
+
+
+if __name__ == "__main__":
+    main()
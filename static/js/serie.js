@@ -57,6 +57,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
         const description = document.createElement("p");
         description.className = "episode-description";
+        description.dataset.number = episode.number;
         description.textContent = episode.description;
 
         const action = document.createElement("a");
@@ -75,7 +76,41 @@ document.addEventListener("DOMContentLoaded", () => {
         return item;
     };
 
+    // Descrições que a IA ainda está gerando: consulta de tempos em tempos e
+    // troca o texto quando chegam. Trocar de temporada cancela o polling.
+    let pollToken = 0;
+
+    const pollDescriptions = async (seasonIndex, pending, token) => {
+        let numbers = pending;
+        for (let attempt = 0; attempt < 30 && numbers.length && token === pollToken; attempt += 1) {
+            await new Promise((resolve) => setTimeout(resolve, 2000));
+            if (token !== pollToken) {
+                return;
+            }
+            try {
+                const response = await fetch(
+                    `/api/serie/${encodeURIComponent(serieName)}/temporada/${seasonIndex}/descricoes?numeros=${numbers.join(",")}`
+                );
+                const data = await response.json();
+                if (token !== pollToken) {
+                    return;
+                }
+                Object.entries(data.descriptions || {}).forEach(([number, text]) => {
+                    const target = episodesList.querySelector(`.episode-description[data-number="${number}"]`);
+                    if (target) {
+                        target.textContent = text;
+                    }
+                });
+                numbers = data.pending || [];
+            } catch (error) {
+                return;
+            }
+        }
+    };
+
     const loadSeason = async (seasonIndex) => {
+        pollToken += 1;
+        const token = pollToken;
         episodesList.innerHTML = "";
         episodesList.classList.add("is-loading");
 
@@ -97,6 +132,10 @@ document.addEventListener("DOMContentLoaded", () => {
             episodes.forEach((episode, index) => {
                 episodesList.appendChild(buildEpisodeCard(episode, index));
             });
+
+            if ((data.pending_descriptions || []).length) {
+                pollDescriptions(seasonIndex, data.pending_descriptions, token);
+            }
         } catch (error) {
             const empty = document.createElement("div");
             empty.className = "empty-state";
@@ -76,6 +76,104 @@ document.addEventListener("DOMContentLoaded", () => {
         }, 1000);
     };
 
+    // HLS: com suporte nativo (Safari, Android) o próprio <source> já escolheu a
+    // playlist; nos demais usa o hls.js, se carregou. Sem nenhum dos dois, ou se o
+    // HLS falhar, fica no MP4 progressivo do /stream.
+    const setupHls = () => {
+        const hlsSrc = video?.dataset.hlsSrc;
+        if (!hlsSrc || video.currentSrc === new URL(hlsSrc, window.location.href).href) {
+            return;
+        }
+        if (video.canPlayType("application/vnd.apple.mpegurl")) {
+            return;
+        }
+        if (!window.Hls || !window.Hls.isSupported()) {
+            return;
+        }
+
+        const fallbackSrc = video.querySelector('source[type="video/mp4"]')?.src;
+        const hls = new window.Hls({ capLevelToPlayerSize: true });
+        hls.on(window.Hls.Events.ERROR, (event, data) => {
+            if (data.fatal) {
+                hls.destroy();
+                if (fallbackSrc) {
+                    video.src = fallbackSrc;
+                    video.play().catch(() => {});
+                }
+            }
+        });
+        hls.loadSource(hlsSrc);
+        hls.attachMedia(video);
+    };
+
+    // Retomada + heartbeat: começa de onde o usuário parou e envia a posição
+    // a cada N segundos enquanto toca, ao pausar e ao sair da página.
+    const relativePath = watchShell?.dataset.relativePath || "";
+    const progressUrl = watchShell?.dataset.progressUrl || "";
+    const resumePosition = Number(watchShell?.dataset.resumePosition) || 0;
+    const heartbeatSeconds = Number(watchShell?.dataset.heartbeatSeconds) || 15;
+    let lastSentPosition = -1;
+
+    const progressPayload = () =>
+        JSON.stringify({
+            relative_path: relativePath,
+            position: video.currentTime,
+            duration: Number.isFinite(video.duration) ? video.duration : null,
+        });
+
+    const sendProgress = (useBeacon = false) => {
+        if (!video || !progressUrl || !relativePath) {
+            return;
+        }
+        if (Math.abs(video.currentTime - lastSentPosition) < 1) {
+            return;
+        }
+        lastSentPosition = video.currentTime;
+        const body = progressPayload();
+
+        if (useBeacon && navigator.sendBeacon) {
+            navigator.sendBeacon(progressUrl, new Blob([body], { type: "application/json" }));
+            return;
+        }
+        fetch(progressUrl, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body,
+            keepalive: true,
+        }).catch(() => {});
+    };
+
+    if (video && relativePath) {
+        if (resumePosition > 0) {
+            const seekToResume = () => {
+                if (resumePosition < (video.duration || Infinity)) {
+                    video.currentTime = resumePosition;
+                }
+            };
+            if (video.readyState >= 1) {
+                seekToResume();
+            } else {
+                video.addEventListener("loadedmetadata", seekToResume, { once: true });
+            }
+        }
+
+        setInterval(() => {
+            if (!video.paused && !video.ended) {
+                sendProgress();
+            }
+        }, heartbeatSeconds * 1000);
+
+        video.addEventListener("pause", () => sendProgress());
+        video.addEventListener("ended", () => sendProgress());
+        window.addEventListener("pagehide", () => sendProgress(true));
+        document.addEventListener("visibilitychange", () => {
+            if (document.visibilityState === "hidden") {
+                sendProgress(true);
+            }
+        });
+    }
+
+    setupHls();
     loadSettings();
 
     if (autoplayToggle) {
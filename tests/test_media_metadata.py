@@ -0,0 +1,62 @@
+# tests/test_media_metadata.py
+"""
+refresh() com --root numa parte da biblioteca só remove do cache o que sumiu
+dessa parte.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import media_metadata  # noqa: E402
+
+FAKE_PROBE = {"format": {"duration": "60"}, "streams": [{"codec_type": "video", "codec_name": "h264"}]}
+
+
+def _touch(path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0")
+
+
+def _cached_paths() -> set:
+    return {row[0] for row in media_metadata._connect().execute("SELECT path FROM media_metadata")}
+
+
+def _setup(tmp_path, monkeypatch):
+    media_root = tmp_path / "media"
+    monkeypatch.setattr(media_metadata, "MEDIA_ROOT", str(media_root))
+    monkeypatch.setattr(media_metadata, "MEDIA_METADATA_DB", str(tmp_path / "meta.db"))
+    monkeypatch.setattr(media_metadata, "_local", threading.local())
+    monkeypatch.setattr(media_metadata, "probe", lambda full_path: FAKE_PROBE)
+    for rel in ("A/T1/E01.mp4", "A/T1/E02.mp4", "B/T1/E01.mp4", "C/E01.mkv"):
+        _touch(str(media_root / rel))
+    media_metadata.refresh(str(media_root), workers=2)
+    return media_root
+
+
+def test_refresh_subtree_keeps_other_series(tmp_path, monkeypatch):
+    media_root = _setup(tmp_path, monkeypatch)
+    assert _cached_paths() == {"A/T1/E01.mp4", "A/T1/E02.mp4", "B/T1/E01.mp4", "C/E01.mkv"}
+
+    os.remove(media_root / "A" / "T1" / "E02.mp4")
+    summary = media_metadata.refresh(str(media_root / "A"), workers=2)
+
+    assert summary["removed"] == 1
+    assert _cached_paths() == {"A/T1/E01.mp4", "B/T1/E01.mp4", "C/E01.mkv"}
+
+
+def test_refresh_outside_media_root_keeps_library(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    other = tmp_path / "outra"
+    _touch(str(other / "X.mp4"))
+
+    media_metadata.refresh(str(other), workers=2)
+    os.remove(other / "X.mp4")
+    summary = media_metadata.refresh(str(other), workers=2)
+
+    assert summary["removed"] == 1
+    assert _cached_paths() == {"A/T1/E01.mp4", "A/T1/E02.mp4", "B/T1/E01.mp4", "C/E01.mkv"}
@@ -0,0 +1,82 @@
+# tests/test_progress_buffer.py
+"""
+Gravação em lote do progresso: o que não foi gravado volta ao buffer campo a
+campo, e uma linha que o banco recusa não trava as outras.
+
+    python -m pytest tests
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, WatchProgress  # noqa: E402
+from progress_buffer import ProgressBuffer  # noqa: E402
+
+T0 = datetime(2024, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def buffer(tmp_path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'app.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    buf = ProgressBuffer(interval=3600, max_pending=10_000, max_attempts=2)
+    buf.app = app
+    yield buf
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _saved(buf: ProgressBuffer) -> dict:
+    with buf.app.app_context():
+        return {row.relative_path: row for row in WatchProgress.query.all()}
+
+
+def test_failed_flush_keeps_position_of_the_batch(buffer, monkeypatch):
+    buffer.record(1, "A/T1/E01.mp4", "A", "E01.mp4", position=120.0, duration=1500.0, when=T0)
+
+    def locked(rows):
+        # página aberta de novo (sem posição) enquanto o lote era gravado
+        buffer.record(1, "A/T1/E01.mp4", "A", "E01.mp4", when=T0 + timedelta(seconds=30))
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(buffer, "_write", locked)
+    with pytest.raises(OperationalError):
+        buffer.flush()
+
+    row = buffer.get(1, "A/T1/E01.mp4")
+    assert row["position_seconds"] == 120.0
+    assert row["duration_seconds"] == 1500.0
+    assert row["last_watched"] == T0 + timedelta(seconds=30)
+
+    monkeypatch.undo()
+    assert buffer.flush() == 1
+    saved = _saved(buffer)["A/T1/E01.mp4"]
+    assert saved.position_seconds == 120.0
+    assert saved.last_watched == T0 + timedelta(seconds=30)
+
+
+def test_rejected_row_does_not_block_the_others(buffer):
+    flushed = []
+    buffer.after_flush(flushed.append)
+    buffer.record(1, "A/T1/E01.mp4", "A", "E01.mp4", when=T0)
+    buffer.record(2, "B/T1/E01.mp4", None, "E01.mp4", when=T0)  # serie_name NOT NULL
+
+    assert buffer.flush() == 1
+    assert set(_saved(buffer)) == {"A/T1/E01.mp4"}
+    assert flushed == [{1}]
+    assert buffer.get(2, "B/T1/E01.mp4") is not None  # volta para mais uma tentativa
+
+    buffer.record(1, "A/T1/E02.mp4", "A", "E02.mp4", when=T0)
+    assert buffer.flush() == 1
+    assert set(_saved(buffer)) == {"A/T1/E01.mp4", "A/T1/E02.mp4"}
+    assert buffer.get(2, "B/T1/E01.mp4") is None  # descartada depois de max_attempts
+    assert buffer.flush() == 0